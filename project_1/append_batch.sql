@@ -0,0 +1,455 @@
+-- append one batch of HMDA rows to an existing project_1 database
+--
+-- expects the batch staged as Preliminary (raw text columns, like the table
+-- project_1.sql reads) with ID values continuing after MAX(LoanApplication.ID).
+-- only the new batch is scanned: lookup tables are upserted, RespondentAgency
+-- and Location only gain rows they don't have yet, and LoanApplication and the
+-- junction tables get the batch's rows appended.
+--
+-- bulk_load.py --append stages the CSVs, runs this script in one transaction
+-- and records the batch in LoadBatch, so loading the same files twice is a no-op.
+
+-- upsert lookup tables: new codes are added, and names are filled in or
+-- corrected when the new batch has them
+INSERT INTO Agency (agency_code, agency_name, agency_abbr)
+SELECT DISTINCT ON (code) code, name, abbr
+FROM (
+    SELECT
+        NULLIF(agency_code, '')::SMALLINT AS code,
+        NULLIF(agency_name, '') AS name,
+        NULLIF(agency_abbr, '') AS abbr
+    FROM Preliminary
+    WHERE agency_code != ''
+) AS v
+ORDER BY code, name, abbr
+ON CONFLICT (agency_code) DO UPDATE
+SET agency_name = EXCLUDED.agency_name, agency_abbr = EXCLUDED.agency_abbr
+WHERE (Agency.agency_name, Agency.agency_abbr) IS DISTINCT FROM (EXCLUDED.agency_name, EXCLUDED.agency_abbr);
+
+INSERT INTO LoanType (loan_type, loan_type_name)
+SELECT DISTINCT ON (code) code, name
+FROM (
+    SELECT NULLIF(loan_type, '')::SMALLINT AS code, NULLIF(loan_type_name, '') AS name
+    FROM Preliminary
+    WHERE loan_type != ''
+) AS v
+ORDER BY code, name
+ON CONFLICT (loan_type) DO UPDATE
+SET loan_type_name = EXCLUDED.loan_type_name
+WHERE LoanType.loan_type_name IS DISTINCT FROM EXCLUDED.loan_type_name;
+
+INSERT INTO PropertyType (property_type, property_type_name)
+SELECT DISTINCT ON (code) code, name
+FROM (
+    SELECT NULLIF(property_type, '')::SMALLINT AS code, NULLIF(property_type_name, '') AS name
+    FROM Preliminary
+    WHERE property_type != ''
+) AS v
+ORDER BY code, name
+ON CONFLICT (property_type) DO UPDATE
+SET property_type_name = EXCLUDED.property_type_name
+WHERE PropertyType.property_type_name IS DISTINCT FROM EXCLUDED.property_type_name;
+
+INSERT INTO LoanPurpose (loan_purpose, loan_purpose_name)
+SELECT DISTINCT ON (code) code, name
+FROM (
+    SELECT NULLIF(loan_purpose, '')::SMALLINT AS code, NULLIF(loan_purpose_name, '') AS name
+    FROM Preliminary
+    WHERE loan_purpose != ''
+) AS v
+ORDER BY code, name
+ON CONFLICT (loan_purpose) DO UPDATE
+SET loan_purpose_name = EXCLUDED.loan_purpose_name
+WHERE LoanPurpose.loan_purpose_name IS DISTINCT FROM EXCLUDED.loan_purpose_name;
+
+INSERT INTO OwnerOccupancy (owner_occupancy, owner_occupancy_name)
+SELECT DISTINCT ON (code) code, name
+FROM (
+    SELECT NULLIF(owner_occupancy, '')::SMALLINT AS code, NULLIF(owner_occupancy_name, '') AS name
+    FROM Preliminary
+    WHERE owner_occupancy != ''
+) AS v
+ORDER BY code, name
+ON CONFLICT (owner_occupancy) DO UPDATE
+SET owner_occupancy_name = EXCLUDED.owner_occupancy_name
+WHERE OwnerOccupancy.owner_occupancy_name IS DISTINCT FROM EXCLUDED.owner_occupancy_name;
+
+INSERT INTO Preapproval (preapproval, preapproval_name)
+SELECT DISTINCT ON (code) code, name
+FROM (
+    SELECT NULLIF(preapproval, '')::SMALLINT AS code, NULLIF(preapproval_name, '') AS name
+    FROM Preliminary
+    WHERE preapproval != ''
+) AS v
+ORDER BY code, name
+ON CONFLICT (preapproval) DO UPDATE
+SET preapproval_name = EXCLUDED.preapproval_name
+WHERE Preapproval.preapproval_name IS DISTINCT FROM EXCLUDED.preapproval_name;
+
+INSERT INTO ActionTaken (action_taken, action_taken_name)
+SELECT DISTINCT ON (code) code, name
+FROM (
+    SELECT NULLIF(action_taken, '')::SMALLINT AS code, NULLIF(action_taken_name, '') AS name
+    FROM Preliminary
+    WHERE action_taken != ''
+) AS v
+ORDER BY code, name
+ON CONFLICT (action_taken) DO UPDATE
+SET action_taken_name = EXCLUDED.action_taken_name
+WHERE ActionTaken.action_taken_name IS DISTINCT FROM EXCLUDED.action_taken_name;
+
+-- msamd_name may be NULL for placeholder MSAs added from location data; keep a known name
+INSERT INTO MSA (msamd, msamd_name)
+SELECT DISTINCT ON (code) code, name
+FROM (
+    SELECT NULLIF(msamd, '') AS code, NULLIF(msamd_name, '') AS name
+    FROM Preliminary
+    WHERE msamd != ''
+) AS v
+ORDER BY code, name
+ON CONFLICT (msamd) DO UPDATE
+SET msamd_name = EXCLUDED.msamd_name
+WHERE EXCLUDED.msamd_name IS NOT NULL
+  AND MSA.msamd_name IS DISTINCT FROM EXCLUDED.msamd_name;
+
+INSERT INTO State (state_code, state_name, state_abbr)
+SELECT DISTINCT ON (code) code, name, abbr
+FROM (
+    SELECT
+        NULLIF(state_code, '') AS code,
+        NULLIF(state_name, '') AS name,
+        NULLIF(state_abbr, '') AS abbr
+    FROM Preliminary
+    WHERE state_code != ''
+) AS v
+ORDER BY code, name, abbr
+ON CONFLICT (state_code) DO UPDATE
+SET state_name = EXCLUDED.state_name, state_abbr = EXCLUDED.state_abbr
+WHERE (State.state_name, State.state_abbr) IS DISTINCT FROM (EXCLUDED.state_name, EXCLUDED.state_abbr);
+
+INSERT INTO County (county_code, state_code, county_name)
+SELECT DISTINCT ON (code, state) code, state, name
+FROM (
+    SELECT
+        NULLIF(county_code, '') AS code,
+        NULLIF(state_code, '') AS state,
+        NULLIF(county_name, '') AS name
+    FROM Preliminary
+    WHERE county_code != '' AND state_code != ''
+) AS v
+ORDER BY code, state, name
+ON CONFLICT (county_code, state_code) DO UPDATE
+SET county_name = EXCLUDED.county_name
+WHERE County.county_name IS DISTINCT FROM EXCLUDED.county_name;
+
+-- the applicant / co-applicant lookups are unpivoted in one scan of the batch
+INSERT INTO Ethnicity (ethnicity_code, ethnicity_name)
+SELECT DISTINCT ON (code) code, name
+FROM (
+    SELECT NULLIF(v.code, '')::SMALLINT AS code, NULLIF(v.name, '') AS name
+    FROM Preliminary p
+    CROSS JOIN LATERAL (VALUES
+        (p.applicant_ethnicity, p.applicant_ethnicity_name),
+        (p.co_applicant_ethnicity, p.co_applicant_ethnicity_name)
+    ) AS v(code, name)
+    WHERE v.code != ''
+) AS v
+ORDER BY code, name
+ON CONFLICT (ethnicity_code) DO UPDATE
+SET ethnicity_name = EXCLUDED.ethnicity_name
+WHERE Ethnicity.ethnicity_name IS DISTINCT FROM EXCLUDED.ethnicity_name;
+
+INSERT INTO Race (race_code, race_name)
+SELECT DISTINCT ON (code) code, name
+FROM (
+    SELECT NULLIF(v.code, '')::SMALLINT AS code, NULLIF(v.name, '') AS name
+    FROM Preliminary p
+    CROSS JOIN LATERAL (VALUES
+        (p.applicant_race_1, p.applicant_race_name_1),
+        (p.applicant_race_2, p.applicant_race_name_2),
+        (p.applicant_race_3, p.applicant_race_name_3),
+        (p.applicant_race_4, p.applicant_race_name_4),
+        (p.applicant_race_5, p.applicant_race_name_5),
+        (p.co_applicant_race_1, p.co_applicant_race_name_1),
+        (p.co_applicant_race_2, p.co_applicant_race_name_2),
+        (p.co_applicant_race_3, p.co_applicant_race_name_3),
+        (p.co_applicant_race_4, p.co_applicant_race_name_4),
+        (p.co_applicant_race_5, p.co_applicant_race_name_5)
+    ) AS v(code, name)
+    WHERE v.code != ''
+) AS v
+ORDER BY code, name
+ON CONFLICT (race_code) DO UPDATE
+SET race_name = EXCLUDED.race_name
+WHERE Race.race_name IS DISTINCT FROM EXCLUDED.race_name;
+
+INSERT INTO Sex (sex_code, sex_name)
+SELECT DISTINCT ON (code) code, name
+FROM (
+    SELECT NULLIF(v.code, '')::SMALLINT AS code, NULLIF(v.name, '') AS name
+    FROM Preliminary p
+    CROSS JOIN LATERAL (VALUES
+        (p.applicant_sex, p.applicant_sex_name),
+        (p.co_applicant_sex, p.co_applicant_sex_name)
+    ) AS v(code, name)
+    WHERE v.code != ''
+) AS v
+ORDER BY code, name
+ON CONFLICT (sex_code) DO UPDATE
+SET sex_name = EXCLUDED.sex_name
+WHERE Sex.sex_name IS DISTINCT FROM EXCLUDED.sex_name;
+
+INSERT INTO PurchaserType (purchaser_type, purchaser_type_name)
+SELECT DISTINCT ON (code) code, name
+FROM (
+    SELECT NULLIF(purchaser_type, '')::SMALLINT AS code, NULLIF(purchaser_type_name, '') AS name
+    FROM Preliminary
+    WHERE purchaser_type != ''
+) AS v
+ORDER BY code, name
+ON CONFLICT (purchaser_type) DO UPDATE
+SET purchaser_type_name = EXCLUDED.purchaser_type_name
+WHERE PurchaserType.purchaser_type_name IS DISTINCT FROM EXCLUDED.purchaser_type_name;
+
+INSERT INTO DenialReason (denial_reason_code, denial_reason_name)
+SELECT DISTINCT ON (code) code, name
+FROM (
+    SELECT NULLIF(v.code, '')::SMALLINT AS code, NULLIF(v.name, '') AS name
+    FROM Preliminary p
+    CROSS JOIN LATERAL (VALUES
+        (p.denial_reason_1, p.denial_reason_name_1),
+        (p.denial_reason_2, p.denial_reason_name_2),
+        (p.denial_reason_3, p.denial_reason_name_3)
+    ) AS v(code, name)
+    WHERE v.code != ''
+) AS v
+ORDER BY code, name
+ON CONFLICT (denial_reason_code) DO UPDATE
+SET denial_reason_name = EXCLUDED.denial_reason_name
+WHERE DenialReason.denial_reason_name IS DISTINCT FROM EXCLUDED.denial_reason_name;
+
+INSERT INTO HOEPAStatus (hoepa_status, hoepa_status_name)
+SELECT DISTINCT ON (code) code, name
+FROM (
+    SELECT NULLIF(hoepa_status, '')::SMALLINT AS code, NULLIF(hoepa_status_name, '') AS name
+    FROM Preliminary
+    WHERE hoepa_status != ''
+) AS v
+ORDER BY code, name
+ON CONFLICT (hoepa_status) DO UPDATE
+SET hoepa_status_name = EXCLUDED.hoepa_status_name
+WHERE HOEPAStatus.hoepa_status_name IS DISTINCT FROM EXCLUDED.hoepa_status_name;
+
+INSERT INTO LienStatus (lien_status, lien_status_name)
+SELECT DISTINCT ON (code) code, name
+FROM (
+    SELECT NULLIF(lien_status, '')::SMALLINT AS code, NULLIF(lien_status_name, '') AS name
+    FROM Preliminary
+    WHERE lien_status != ''
+) AS v
+ORDER BY code, name
+ON CONFLICT (lien_status) DO UPDATE
+SET lien_status_name = EXCLUDED.lien_status_name
+WHERE LienStatus.lien_status_name IS DISTINCT FROM EXCLUDED.lien_status_name;
+
+INSERT INTO EditStatus (edit_status, edit_status_name)
+SELECT DISTINCT ON (code) code, name
+FROM (
+    SELECT NULLIF(edit_status, '')::SMALLINT AS code, NULLIF(edit_status_name, '') AS name
+    FROM Preliminary
+    WHERE edit_status != ''
+) AS v
+ORDER BY code, name
+ON CONFLICT (edit_status) DO UPDATE
+SET edit_status_name = EXCLUDED.edit_status_name
+WHERE EditStatus.edit_status_name IS DISTINCT FROM EXCLUDED.edit_status_name;
+
+INSERT INTO RespondentAgency (as_of_year, respondent_id, agency_code)
+SELECT DISTINCT
+    NULLIF(as_of_year, '')::INTEGER,
+    NULLIF(respondent_id, ''),
+    NULLIF(agency_code, '')::SMALLINT
+FROM Preliminary
+WHERE as_of_year != '' AND respondent_id != '' AND agency_code != ''
+ON CONFLICT (as_of_year, respondent_id) DO NOTHING;
+
+-- distinct locations of the batch, keyed exactly like temp_location in project_1.sql
+CREATE TEMPORARY TABLE temp_batch_location AS
+SELECT DISTINCT
+    md5(
+        COALESCE(msamd, '') || '|' ||
+        COALESCE(state_code, '') || '|' ||
+        COALESCE(county_code, '') || '|' ||
+        COALESCE(census_tract_number, '') || '|' ||
+        COALESCE(population, '') || '|' ||
+        COALESCE(minority_population, '') || '|' ||
+        COALESCE(hud_median_family_income, '') || '|' ||
+        COALESCE(tract_to_msamd_income, '') || '|' ||
+        COALESCE(number_of_owner_occupied_units, '') || '|' ||
+        COALESCE(number_of_1_to_4_family_units, '')
+    ) AS location_key,
+    NULLIF(msamd, '') AS msamd,
+    NULLIF(state_code, '') AS state_code,
+    NULLIF(county_code, '') AS county_code,
+    NULLIF(census_tract_number, '') AS census_tract_number,
+    NULLIF(population, '')::INTEGER AS population,
+    NULLIF(minority_population, '')::NUMERIC AS minority_population,
+    NULLIF(hud_median_family_income, '')::INTEGER AS hud_median_family_income,
+    NULLIF(tract_to_msamd_income, '')::NUMERIC AS tract_to_msamd_income,
+    NULLIF(number_of_owner_occupied_units, '')::INTEGER AS number_of_owner_occupied_units,
+    NULLIF(number_of_1_to_4_family_units, '')::INTEGER AS number_of_1_to_4_family_units
+FROM Preliminary;
+
+CREATE UNIQUE INDEX temp_batch_location_key_idx ON temp_batch_location (location_key);
+ANALYZE temp_batch_location;
+
+-- locations not seen in earlier batches get the next serial ids
+CREATE TEMPORARY TABLE temp_new_location AS
+SELECT
+    nextval(pg_get_serial_sequence('location', 'location_id'))::INTEGER AS location_id,
+    t.*
+FROM temp_batch_location t
+WHERE NOT EXISTS (
+    SELECT 1 FROM LocationKey k WHERE k.location_key = t.location_key
+);
+
+INSERT INTO MSA (msamd, msamd_name)
+SELECT DISTINCT msamd, NULL
+FROM temp_new_location
+WHERE msamd IS NOT NULL
+ON CONFLICT (msamd) DO NOTHING;
+
+INSERT INTO Location (
+    location_id,
+    msamd,
+    state_code,
+    county_code,
+    census_tract_number,
+    population,
+    minority_population,
+    hud_median_family_income,
+    tract_to_msamd_income,
+    number_of_owner_occupied_units,
+    number_of_1_to_4_family_units
+)
+SELECT
+    location_id,
+    msamd,
+    state_code,
+    county_code,
+    census_tract_number,
+    population,
+    minority_population,
+    hud_median_family_income,
+    tract_to_msamd_income,
+    number_of_owner_occupied_units,
+    number_of_1_to_4_family_units
+FROM temp_new_location;
+
+INSERT INTO LocationKey (location_key, location_id)
+SELECT location_key, location_id
+FROM temp_new_location
+ON CONFLICT (location_key) DO NOTHING;
+
+-- with the partitioned layout (project_1_partitioned.sql), give new years their own partition
+DO $$
+DECLARE
+    loan_year INTEGER;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'loanapplication'::regclass) = 'p' THEN
+        FOR loan_year IN
+            SELECT DISTINCT NULLIF(as_of_year, '')::INTEGER FROM Preliminary WHERE as_of_year != ''
+        LOOP
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS LoanApplication_%s PARTITION OF LoanApplication FOR VALUES FROM (%s) TO (%s)',
+                loan_year, loan_year, loan_year + 1
+            );
+        END LOOP;
+    END IF;
+END $$;
+
+-- append the batch's applications, resolving every location through its key
+INSERT INTO LoanApplication (
+    ID, as_of_year, respondent_id, loan_type, property_type, loan_purpose,
+    owner_occupancy, loan_amount_000s, preapproval, action_taken,
+    location_id, applicant_ethnicity, co_applicant_ethnicity,
+    applicant_sex, co_applicant_sex, applicant_income_000s,
+    purchaser_type, rate_spread, hoepa_status, lien_status,
+    edit_status, sequence_number, application_date_indicator
+)
+SELECT
+    p.ID,
+    NULLIF(p.as_of_year, '')::INTEGER,
+    NULLIF(p.respondent_id, ''),
+    NULLIF(p.loan_type, '')::SMALLINT,
+    NULLIF(p.property_type, '')::SMALLINT,
+    NULLIF(p.loan_purpose, '')::SMALLINT,
+    NULLIF(p.owner_occupancy, '')::SMALLINT,
+    NULLIF(p.loan_amount_000s, '')::NUMERIC,
+    NULLIF(p.preapproval, '')::SMALLINT,
+    NULLIF(p.action_taken, '')::SMALLINT,
+    k.location_id,
+    NULLIF(p.applicant_ethnicity, '')::SMALLINT,
+    NULLIF(p.co_applicant_ethnicity, '')::SMALLINT,
+    NULLIF(p.applicant_sex, '')::SMALLINT,
+    NULLIF(p.co_applicant_sex, '')::SMALLINT,
+    NULLIF(p.applicant_income_000s, '')::NUMERIC,
+    NULLIF(p.purchaser_type, '')::SMALLINT,
+    NULLIF(p.rate_spread, ''),
+    NULLIF(p.hoepa_status, '')::SMALLINT,
+    NULLIF(p.lien_status, '')::SMALLINT,
+    NULLIF(p.edit_status, '')::SMALLINT,
+    NULLIF(p.sequence_number, ''),
+    NULLIF(p.application_date_indicator, '')::SMALLINT
+FROM Preliminary p
+JOIN LocationKey k ON k.location_key = md5(
+        COALESCE(p.msamd, '') || '|' ||
+        COALESCE(p.state_code, '') || '|' ||
+        COALESCE(p.county_code, '') || '|' ||
+        COALESCE(p.census_tract_number, '') || '|' ||
+        COALESCE(p.population, '') || '|' ||
+        COALESCE(p.minority_population, '') || '|' ||
+        COALESCE(p.hud_median_family_income, '') || '|' ||
+        COALESCE(p.tract_to_msamd_income, '') || '|' ||
+        COALESCE(p.number_of_owner_occupied_units, '') || '|' ||
+        COALESCE(p.number_of_1_to_4_family_units, '')
+    );
+
+-- append the batch's junction rows
+INSERT INTO ApplicantRace (ID, race_number, race_code)
+SELECT p.ID, v.race_number, NULLIF(v.race_code, '')::SMALLINT
+FROM Preliminary p
+CROSS JOIN LATERAL (VALUES
+    (1, p.applicant_race_1),
+    (2, p.applicant_race_2),
+    (3, p.applicant_race_3),
+    (4, p.applicant_race_4),
+    (5, p.applicant_race_5)
+) AS v(race_number, race_code)
+WHERE v.race_code != '';
+
+INSERT INTO CoApplicantRace (ID, race_number, race_code)
+SELECT p.ID, v.race_number, NULLIF(v.race_code, '')::SMALLINT
+FROM Preliminary p
+CROSS JOIN LATERAL (VALUES
+    (1, p.co_applicant_race_1),
+    (2, p.co_applicant_race_2),
+    (3, p.co_applicant_race_3),
+    (4, p.co_applicant_race_4),
+    (5, p.co_applicant_race_5)
+) AS v(race_number, race_code)
+WHERE v.race_code != '';
+
+INSERT INTO DenialReasons (ID, reason_number, denial_reason_code)
+SELECT p.ID, v.reason_number, NULLIF(v.denial_reason_code, '')::SMALLINT
+FROM Preliminary p
+CROSS JOIN LATERAL (VALUES
+    (1, p.denial_reason_1),
+    (2, p.denial_reason_2),
+    (3, p.denial_reason_3)
+) AS v(reason_number, denial_reason_code)
+WHERE v.denial_reason_code != '';
+
+-- remove temp tables
+DROP TABLE temp_new_location;
+DROP TABLE temp_batch_location;
@@ -0,0 +1,700 @@
+r'''
+bulk_load.py
+
+Parallel bulk loader for raw HMDA CSV files.
+
+Instead of running project_1.sql against a Preliminary table loaded by hand,
+this script:
+
+1. creates the 3NF tables from project_1.sql without their foreign keys (and
+   without the primary keys of the large tables),
+2. streams the CSV files into an UNLOGGED Preliminary staging table with
+   COPY FROM STDIN, in chunks spread over several connections, validating
+   every row on the way (rows with the wrong number of fields or values that
+   won't cast are written to a reject file instead of failing the load),
+3. checks the staged rows as a set with validate_staging.sql (duplicate IDs,
+   codes without a lookup name, respondents without an agency, values that
+   overflow their column) and moves failing rows to the Quarantine table,
+4. fills the 3NF tables in dependency order with the INSERT ... SELECT
+   statements of project_1.sql, which cast the staged text,
+5. adds the deferred primary keys and foreign keys in parallel, and
+6. reports rows/sec for every stage.
+
+With --append the schema is kept and the CSVs are added as a new batch with
+append_batch.sql, in one transaction: lookups are upserted, only unseen
+respondents and locations are inserted, and the batch's applications and
+junction rows are appended. Every load is recorded in the LoadBatch manifest
+by a checksum of its files, so appending the same files again does nothing.
+Appended batches are checked against the loaded data the same way. Loads
+of the same database take an advisory lock and run one at a time.
+
+--summaries builds the indexes and rollup views of summary_layer.sql after a
+full load; appends refresh the rollups when they exist.
+
+Usage:
+    python3 bulk_load.py 2016.csv 2017.csv
+    python3 bulk_load.py --dsn "dbname=hmda host=localhost" --workers 8 hmda.csv
+    HMDA_DSN="postgresql://me@localhost/hmda" python3 bulk_load.py hmda.csv --keep-staging
+    python3 bulk_load.py --summaries 2016.csv 2017.csv
+    python3 bulk_load.py --append 2018.csv
+    python3 bulk_load.py --no-validate hmda.csv
+    python3 bulk_load.py --schema project_1_partitioned.sql 2016.csv 2017.csv
+
+The connection string defaults to HMDA_DSN, or to the usual PGHOST / PGUSER /
+PGDATABASE environment variables when that is unset, so a local Postgres works
+out of the box.
+'''
+
+import argparse
+import csv
+import hashlib
+import io
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_SCRIPT = os.path.join(SCRIPT_DIR, "project_1.sql")
+APPEND_SCRIPT = os.path.join(SCRIPT_DIR, "append_batch.sql")
+SUMMARY_SCRIPT = os.path.join(SCRIPT_DIR, "summary_layer.sql")
+REFRESH_SCRIPT = os.path.join(SCRIPT_DIR, "refresh_summaries.sql")
+VALIDATE_SCRIPT = os.path.join(SCRIPT_DIR, "validate_staging.sql")
+
+DEFAULT_WORKERS = 4
+CHUNK_ROWS = 50000
+
+# tables big enough that building their primary key after the load is cheaper
+DEFERRED_PK_TABLES = {"location", "loanapplication", "applicantrace", "coapplicantrace", "denialreasons"}
+
+STAGING_TABLE = "Preliminary"
+
+# advisory lock key held by every load; they share the staging table and the ID range
+LOAD_LOCK_KEY = 336
+
+_INTEGER = re.compile(r"^-?\d+$")
+_NUMERIC = re.compile(r"^-?(\d+\.?\d*|\.\d+)$")
+
+# staged column -> cast target, as used by the NULLIF(...)::type casts in project_1.sql
+_CAST_PATTERN = re.compile(r"NULLIF\(\s*(?:\w+\.)?(\w+)\s*,\s*''\s*\)::(SMALLINT|INTEGER|NUMERIC)", re.IGNORECASE)
+
+_DOLLAR_QUOTE = re.compile(r"\$\w*\$")
+
+
+def split_statements(script):
+    '''
+    split a SQL script into statements, dropping -- comments; DO $$ ... $$ bodies stay whole
+    '''
+    statements = []
+    current = []
+    in_string = False
+    i = 0
+    while i < len(script):
+        ch = script[i]
+        dollar = _DOLLAR_QUOTE.match(script, i) if ch == "$" and not in_string else None
+        if dollar:
+            end = script.find(dollar.group(), dollar.end())
+            end = len(script) if end == -1 else end + len(dollar.group())
+            current.append(script[i:end])
+            i = end
+            continue
+        if in_string:
+            current.append(ch)
+            if ch == "'":
+                in_string = False
+        elif ch == "'":
+            in_string = True
+            current.append(ch)
+        elif script.startswith("--", i):
+            newline = script.find("\n", i)
+            i = len(script) if newline == -1 else newline
+            continue
+        elif ch == ";":
+            statement = "".join(current).strip()
+            if statement:
+                statements.append(statement)
+            current = []
+        else:
+            current.append(ch)
+        i += 1
+
+    statement = "".join(current).strip()
+    if statement:
+        statements.append(statement)
+    return statements
+
+
+def _split_items(body):
+    items = []
+    depth = 0
+    start = 0
+    for i, ch in enumerate(body):
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            items.append(body[start:i].strip())
+            start = i + 1
+    items.append(body[start:].strip())
+    return [item for item in items if item]
+
+
+def defer_constraints(create_statement):
+    '''
+    split a CREATE TABLE into the statement to run before the load and the
+    ALTER TABLE statements (primary keys, foreign keys) to run after it
+    '''
+    match = re.match(r"CREATE\s+TABLE\s+(\w+)\s*\(", create_statement, re.IGNORECASE)
+    table = match.group(1)
+    depth = 1
+    close = match.end()
+    while depth:
+        depth += {"(": 1, ")": -1}.get(create_statement[close], 0)
+        close += 1
+    body = create_statement[match.end():close - 1]
+    # e.g. PARTITION BY RANGE (as_of_year)
+    suffix = create_statement[close:].strip()
+    defer_pk = table.lower() in DEFERRED_PK_TABLES
+
+    kept = []
+    primary_keys = []
+    foreign_keys = []
+    for item in _split_items(body):
+        upper = item.upper()
+        if upper.startswith("FOREIGN KEY"):
+            foreign_keys.append(f"ALTER TABLE {table} ADD {item}")
+        elif upper.startswith("PRIMARY KEY") and defer_pk:
+            primary_keys.append(f"ALTER TABLE {table} ADD {item}")
+        elif defer_pk and re.search(r"\bPRIMARY\s+KEY\b", item, re.IGNORECASE):
+            column = item.split()[0]
+            kept.append(re.sub(r"\s+PRIMARY\s+KEY\b", "", item, flags=re.IGNORECASE))
+            primary_keys.append(f"ALTER TABLE {table} ADD PRIMARY KEY ({column})")
+        else:
+            kept.append(item)
+
+    create = f"CREATE TABLE {table} (\n    " + ",\n    ".join(kept) + "\n)" + (f" {suffix}" if suffix else "")
+    return table, create, primary_keys, foreign_keys
+
+
+def load_plan(schema_script=SCHEMA_SCRIPT):
+    '''
+    read project_1.sql (or a variant like project_1_partitioned.sql) into the load stages:
+    drops, creates, fill statements and deferred constraints
+    '''
+    with open(schema_script, 'r') as f:
+        statements = split_statements(f.read())
+
+    plan = {"drop": [], "create": [], "fill": [], "primary_keys": [], "foreign_keys": [], "tables": []}
+    for statement in statements:
+        upper = statement.upper()
+        if upper.startswith("SET "):
+            # the loader manages its own session settings
+            continue
+        if upper.startswith("DROP TABLE IF EXISTS"):
+            plan["drop"].append(statement)
+        elif re.match(r"CREATE\s+TABLE\s+\w+\s+PARTITION\s+OF\s", upper):
+            # partitions take their columns and constraints from the parent
+            plan["create"].append(statement)
+        elif re.match(r"CREATE\s+TABLE\s", upper):
+            table, create, primary_keys, foreign_keys = defer_constraints(statement)
+            plan["tables"].append(table)
+            plan["create"].append(create)
+            plan["primary_keys"] += primary_keys
+            plan["foreign_keys"] += foreign_keys
+        else:
+            plan["fill"].append(statement)
+    return plan
+
+
+def staged_casts(plan):
+    '''
+    staged column -> cast type for every column the fill statements cast
+    '''
+    casts = {}
+    for statement in plan["fill"]:
+        for column, type_name in _CAST_PATTERN.findall(statement):
+            casts[column.lower()] = type_name.upper()
+    return casts
+
+
+def validate_row(row, width, checks):
+    '''
+    reason the row can't be loaded, or None if it is fine
+    '''
+    if len(row) != width:
+        return f"expected {width} fields, got {len(row)}"
+    for index, column, pattern in checks:
+        value = row[index].strip()
+        if value and not pattern.match(value):
+            return f"{column}: {value!r} is not a number"
+    return None
+
+
+def batch_checksum(csv_paths):
+    '''
+    sha256 over the contents of the batch's files, in order
+    '''
+    digest = hashlib.sha256()
+    for csv_path in csv_paths:
+        with open(csv_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def describe_target(target):
+    return f"{target[:60]}..." if len(target) > 60 else target
+
+
+class Stats:
+    '''
+    rows and seconds per stage, printed as rows/sec at the end
+    '''
+
+    def __init__(self):
+        self.stages = []
+
+    def add(self, stage, rows, seconds):
+        self.stages.append({"stage": stage, "rows": rows, "seconds": seconds})
+        rate = f"{rows / seconds:,.0f} rows/s" if seconds > 0 and rows else ""
+        print(f"  {stage:<48}{rows:>12,}{seconds:>10.2f}s  {rate}")
+
+    def total_seconds(self):
+        return sum(s["seconds"] for s in self.stages)
+
+
+def connect(dsn):
+    '''
+    open an autocommit connection with no statement timeout
+    '''
+    # imported here so the planning helpers can be used without a database driver
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("SET statement_timeout = 0")
+    return conn
+
+
+def lock_loads(cur):
+    '''
+    wait until no other load runs against this database; held until the connection closes
+    '''
+    cur.execute("SELECT pg_try_advisory_lock(%s)", (LOAD_LOCK_KEY,))
+    if not cur.fetchone()[0]:
+        print("Another load is running on this database, waiting for it to finish...")
+        cur.execute("SELECT pg_advisory_lock(%s)", (LOAD_LOCK_KEY,))
+
+
+def create_staging(cur, header):
+    columns = ", ".join(f'"{c}" INTEGER' if c == "id" else f'"{c}" TEXT' for c in header)
+    cur.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+    # unlogged: staging is rebuilt from the CSVs anyway, so skip the WAL
+    cur.execute(f"CREATE UNLOGGED TABLE {STAGING_TABLE} ({columns})")
+
+
+def read_header(csv_path):
+    with open(csv_path, 'r', newline='') as f:
+        return [h.strip().lower() for h in next(csv.reader(f))]
+
+
+def produce_chunks(csv_paths, data_columns, casts, chunks, rejects_path, start_id=1, chunk_rows=CHUNK_ROWS):
+    '''
+    read the CSVs, validate and number their rows, and queue them as COPY-ready chunks;
+    returns (rows queued, rows rejected)
+    '''
+    has_id = "id" in data_columns
+    width = len(data_columns)
+    checks = [
+        (i, column, _INTEGER if casts[column] in ("SMALLINT", "INTEGER") else _NUMERIC)
+        for i, column in enumerate(data_columns) if column in casts
+    ]
+
+    next_id = start_id
+    queued = 0
+    rejected = 0
+    reject_file = None
+    reject_writer = None
+    try:
+        for csv_path in csv_paths:
+            with open(csv_path, 'r', newline='') as f:
+                reader = csv.reader(f)
+                file_header = [h.strip().lower() for h in next(reader)]
+                if file_header != data_columns:
+                    raise ValueError(f"{csv_path} has a different header than {csv_paths[0]}")
+
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                rows_in_chunk = 0
+                for line_number, row in enumerate(reader, 2):
+                    reason = validate_row(row, width, checks)
+                    if reason:
+                        if reject_writer is None:
+                            reject_file = open(rejects_path, 'w', newline='')
+                            reject_writer = csv.writer(reject_file)
+                            reject_writer.writerow(["file", "line", "reason"] + data_columns)
+                        reject_writer.writerow([csv_path, line_number, reason] + row)
+                        rejected += 1
+                        continue
+
+                    writer.writerow(row if has_id else [next_id] + row)
+                    next_id += 1
+                    rows_in_chunk += 1
+                    if rows_in_chunk >= chunk_rows:
+                        chunks.put((buffer, rows_in_chunk))
+                        queued += rows_in_chunk
+                        buffer = io.StringIO()
+                        writer = csv.writer(buffer)
+                        rows_in_chunk = 0
+
+                if rows_in_chunk:
+                    chunks.put((buffer, rows_in_chunk))
+                    queued += rows_in_chunk
+    finally:
+        if reject_file:
+            reject_file.close()
+
+    return queued, rejected
+
+
+def copy_worker(dsn, header, chunks, errors):
+    '''
+    COPY queued chunks into the staging table over one connection until the queue is closed
+    '''
+    conn = None
+    copy_sql = f"COPY {STAGING_TABLE} ({', '.join(chr(34) + c + chr(34) for c in header)}) FROM STDIN WITH (FORMAT csv)"
+    try:
+        conn = connect(dsn)
+        with conn.cursor() as cur:
+            while True:
+                item = chunks.get()
+                if item is None:
+                    break
+                buffer, _ = item
+                buffer.seek(0)
+                cur.copy_expert(copy_sql, buffer)
+    except Exception as e:
+        errors.append(e)
+        # keep draining so the producer never blocks on a full queue
+        while chunks.get() is not None:
+            pass
+    finally:
+        if conn:
+            conn.close()
+
+
+def stage_csvs(dsn, csv_paths, data_header, casts, workers, rejects_path, start_id=1):
+    '''
+    stream the CSVs into staging with parallel COPY; returns (rows staged, rows rejected)
+    '''
+    header = data_header if "id" in data_header else ["id"] + data_header
+    chunks = queue.Queue(maxsize=workers * 2)
+    errors = []
+    threads = [threading.Thread(target=copy_worker, args=(dsn, header, chunks, errors)) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        staged, rejected = produce_chunks(csv_paths, data_header, casts, chunks, rejects_path, start_id)
+    finally:
+        for _ in threads:
+            chunks.put(None)
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+    return staged, rejected
+
+
+def run_timed(cur, statement, stats, stage=None):
+    start = time.perf_counter()
+    cur.execute(statement)
+    rows = cur.rowcount if cur.rowcount and cur.rowcount > 0 else 0
+    stats.add(stage or describe_target(" ".join(statement.split())), rows, time.perf_counter() - start)
+
+
+def run_parallel(dsn, statements, workers, stats, label):
+    '''
+    run independent DDL statements over a small pool of connections
+    '''
+    if not statements:
+        return
+
+    local = threading.local()
+    connections = []
+    lock = threading.Lock()
+
+    def run(statement):
+        if not hasattr(local, "conn"):
+            local.conn = connect(dsn)
+            with lock:
+                connections.append(local.conn)
+        start = time.perf_counter()
+        with local.conn.cursor() as cur:
+            cur.execute(statement)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(run, statements))
+    finally:
+        for conn in connections:
+            conn.close()
+    stats.add(f"{label} ({len(statements)} statements)", 0, time.perf_counter() - start)
+
+
+def table_rows(cur, tables):
+    counts = {}
+    for table in tables:
+        cur.execute(f"SELECT COUNT(*) FROM {table}")
+        counts[table] = cur.fetchone()[0]
+    return counts
+
+
+def check_header(casts, header, script):
+    missing = sorted(set(casts) - set(header))
+    if missing:
+        raise ValueError(f"CSV is missing columns used by {os.path.basename(script)}: {', '.join(missing)}")
+
+
+def record_batch(cur, checksum, csv_paths):
+    '''
+    add the staged batch to the LoadBatch manifest and return its batch_id
+    '''
+    cur.execute(
+        f"""
+        INSERT INTO LoadBatch (checksum, source_files, as_of_years, first_id, last_id, row_count)
+        SELECT %s, %s, string_agg(DISTINCT as_of_year, ',' ORDER BY as_of_year), MIN(id), MAX(id), COUNT(*)
+        FROM {STAGING_TABLE}
+        RETURNING batch_id
+        """,
+        (checksum, ", ".join(os.path.basename(p) for p in csv_paths)),
+    )
+    return cur.fetchone()[0]
+
+
+def loaded_batch(cur, checksum):
+    '''
+    batch_id of an earlier load of the same files, or None
+    '''
+    cur.execute("SELECT batch_id FROM LoadBatch WHERE checksum = %s", (checksum,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def run_script(cur, script, stats):
+    '''
+    run every statement of a SQL script in order, timing each
+    '''
+    with open(script, 'r') as f:
+        statements = split_statements(f.read())
+    for statement in statements:
+        if statement.upper().startswith("SET "):
+            continue
+        run_timed(cur, statement, stats)
+
+
+def validate_staging(cur, stats, checksum):
+    '''
+    move staged rows that would fail the fill to Quarantine, tagged with the batch
+    checksum; returns (rows quarantined, rows per reason)
+    '''
+    cur.execute("SELECT set_config('bulk_load.batch_checksum', %s, false)", (checksum,))
+    run_script(cur, VALIDATE_SCRIPT, stats)
+    cur.execute("SELECT COUNT(*) FROM temp_quarantine")
+    quarantined = cur.fetchone()[0]
+    cur.execute(
+        "SELECT reason, COUNT(*) FROM temp_quarantine, unnest(reasons) AS reason GROUP BY reason ORDER BY 2 DESC, 1"
+    )
+    reasons = dict(cur.fetchall())
+    cur.execute("DROP TABLE temp_quarantine")
+    if quarantined:
+        print(f"  {quarantined:,} rows quarantined, see the Quarantine table")
+        for reason, count in reasons.items():
+            print(f"    {reason:<44}{count:>12,}")
+    return quarantined, reasons
+
+
+def bulk_load(dsn, csv_paths, workers=DEFAULT_WORKERS, schema_script=SCHEMA_SCRIPT, keep_staging=False, rejects_path=None,
+              summaries=False, validate=True):
+    '''
+    load the CSV files into a fresh 3NF schema and return the per-stage stats
+    '''
+    plan = load_plan(schema_script)
+    casts = staged_casts(plan)
+    data_header = read_header(csv_paths[0])
+    header = data_header if "id" in data_header else ["id"] + data_header
+    check_header(casts, header, schema_script)
+
+    rejects_path = rejects_path or os.path.splitext(csv_paths[0])[0] + ".rejects.csv"
+    checksum = batch_checksum(csv_paths)
+    stats = Stats()
+    conn = connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            lock_loads(cur)
+            print("Creating tables (constraints deferred)...")
+            start = time.perf_counter()
+            for statement in plan["drop"] + plan["create"]:
+                cur.execute(statement)
+            # quarantined rows belong to the data being replaced
+            cur.execute("DROP TABLE IF EXISTS Quarantine")
+            create_staging(cur, header)
+            stats.add("create tables", 0, time.perf_counter() - start)
+
+            print(f"Staging {len(csv_paths)} file(s) with {workers} COPY workers...")
+            start = time.perf_counter()
+            staged, rejected = stage_csvs(dsn, csv_paths, data_header, casts, workers, rejects_path)
+            stats.add("copy into staging", staged, time.perf_counter() - start)
+            if rejected:
+                print(f"  {rejected:,} rows rejected, see {rejects_path}")
+            run_timed(cur, f"ANALYZE {STAGING_TABLE}", stats, "analyze staging")
+            if validate:
+                print("Checking staged rows...")
+                quarantined, _ = validate_staging(cur, stats, checksum)
+                staged -= quarantined
+                rejected += quarantined
+
+            print("Filling 3NF tables...")
+            for statement in plan["fill"]:
+                run_timed(cur, statement, stats)
+            batch_id = record_batch(cur, checksum, csv_paths)
+
+            print("Adding deferred constraints...")
+            run_parallel(dsn, plan["primary_keys"], workers, stats, "primary keys")
+            run_parallel(dsn, plan["foreign_keys"], workers, stats, "foreign keys")
+            run_parallel(dsn, [f"ANALYZE {t}" for t in plan["tables"]], workers, stats, "analyze")
+
+            if summaries:
+                print("Building indexes and rollups...")
+                run_script(cur, SUMMARY_SCRIPT, stats)
+
+            if not keep_staging:
+                cur.execute(f"DROP TABLE {STAGING_TABLE}")
+
+            counts = table_rows(cur, plan["tables"])
+    finally:
+        conn.close()
+
+    print(f"Recorded as batch {batch_id}")
+    return stats, counts, staged, rejected
+
+
+def append_load(dsn, csv_paths, workers=DEFAULT_WORKERS, append_script=APPEND_SCRIPT, keep_staging=False, rejects_path=None,
+                validate=True):
+    '''
+    append the CSV files to an existing database as one batch; a batch that was
+    already loaded is skipped. returns the same tuple as bulk_load, without table counts
+    '''
+    with open(append_script, 'r') as f:
+        statements = split_statements(f.read())
+    casts = staged_casts({"fill": statements})
+    data_header = read_header(csv_paths[0])
+    if "id" in data_header:
+        raise ValueError("appended CSVs must not carry their own ID column, IDs continue after the loaded data")
+    header = ["id"] + data_header
+    check_header(casts, header, append_script)
+
+    rejects_path = rejects_path or os.path.splitext(csv_paths[0])[0] + ".rejects.csv"
+    checksum = batch_checksum(csv_paths)
+    stats = Stats()
+    conn = connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            # the manifest check, MAX(ID) and the staging table are only safe with other loads locked out
+            lock_loads(cur)
+            cur.execute("SELECT to_regclass('loadbatch') IS NOT NULL AND to_regclass('locationkey') IS NOT NULL")
+            if not cur.fetchone()[0]:
+                raise ValueError("no LoadBatch manifest in this database, run a full load first")
+
+            batch_id = loaded_batch(cur, checksum)
+            if batch_id is not None:
+                print(f"These files were already loaded as batch {batch_id}, nothing to do.")
+                return stats, None, 0, 0
+
+            cur.execute("SELECT COALESCE(MAX(ID), 0) + 1 FROM LoanApplication")
+            start_id = cur.fetchone()[0]
+
+            print(f"Staging {len(csv_paths)} file(s) with {workers} COPY workers (IDs from {start_id:,})...")
+            start = time.perf_counter()
+            create_staging(cur, header)
+            staged, rejected = stage_csvs(dsn, csv_paths, data_header, casts, workers, rejects_path, start_id)
+            stats.add("copy into staging", staged, time.perf_counter() - start)
+            if rejected:
+                print(f"  {rejected:,} rows rejected, see {rejects_path}")
+            run_timed(cur, f"ANALYZE {STAGING_TABLE}", stats, "analyze staging")
+            if validate:
+                print("Checking staged rows...")
+                quarantined, _ = validate_staging(cur, stats, checksum)
+                staged -= quarantined
+                rejected += quarantined
+
+            print("Appending batch...")
+            conn.autocommit = False
+            try:
+                for statement in statements:
+                    run_timed(cur, statement, stats)
+                batch_id = record_batch(cur, checksum, csv_paths)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.autocommit = True
+
+            if not keep_staging:
+                cur.execute(f"DROP TABLE {STAGING_TABLE}")
+
+            cur.execute("SELECT to_regclass('loansbystateyear') IS NOT NULL")
+            if cur.fetchone()[0]:
+                print("Refreshing rollups...")
+                run_script(cur, REFRESH_SCRIPT, stats)
+    finally:
+        conn.close()
+
+    print(f"Recorded as batch {batch_id}")
+    return stats, None, staged, rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load raw HMDA CSV files into the project_1 schema.")
+    parser.add_argument("csv", nargs="+", help="HMDA CSV files with the same header")
+    parser.add_argument("--dsn", default=os.getenv("HMDA_DSN", ""), help="libpq connection string (default: HMDA_DSN or PG* variables)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="parallel COPY / DDL connections")
+    parser.add_argument("--append", action="store_true", help="add the files as a new batch instead of rebuilding the database")
+    parser.add_argument("--schema", default=SCHEMA_SCRIPT, help="schema and fill script to load with")
+    parser.add_argument("--append-script", default=APPEND_SCRIPT, help="script used to append a batch")
+    parser.add_argument("--rejects", help="where to write rejected rows (default: <first csv>.rejects.csv)")
+    parser.add_argument("--keep-staging", action="store_true", help="keep the Preliminary staging table")
+    parser.add_argument("--summaries", action="store_true", help="build summary_layer.sql after a full load")
+    parser.add_argument("--no-validate", dest="validate", action="store_false",
+                        help="skip validate_staging.sql and load every staged row")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        if args.append:
+            stats, counts, staged, rejected = append_load(args.dsn, args.csv, args.workers, args.append_script,
+                                                          args.keep_staging, args.rejects, args.validate)
+        else:
+            stats, counts, staged, rejected = bulk_load(args.dsn, args.csv, args.workers, args.schema,
+                                                        args.keep_staging, args.rejects, args.summaries, args.validate)
+    except Exception as e:
+        print(f"Error loading data: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    elapsed = time.perf_counter() - start
+    print(f"\nLoaded {staged:,} rows ({rejected:,} rejected or quarantined) in {elapsed:.1f}s, {staged / elapsed:,.0f} rows/s overall")
+    for table, count in (counts or {}).items():
+        print(f"  {table:<20}{count:>12,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
+-- export_csv.py writes the same columns from parallel ID ranges, resolving names
+-- from in-memory lookups instead of this 20-table join; the view stays the reference.
+
 -- create a view that reconstructs the original data format
 DROP VIEW IF EXISTS to_csv;
 CREATE VIEW to_csv AS
@@ -123,6 +126,8 @@ LEFT JOIN RespondentAgency ra ON la.as_of_year = ra.as_of_year AND la.respondent
 LEFT JOIN Agency a ON ra.agency_code = a.agency_code;
 
 -- export the view to a CSV file
-\COPY (SELECT * from to_csv) TO '/Users/tylerho/Docs/GitHub/cs336-rutgers/project_1/recreated_mortgage_data.csv' WITH CSV HEADER DELIMITER ',';
+-- ordered by ID so the file comes out in the original row order with either layout
+-- (a partitioned LoanApplication, see project_1_partitioned.sql, returns rows partition by partition)
+\COPY (SELECT * from to_csv ORDER BY ID::INTEGER) TO '/Users/tylerho/Docs/GitHub/cs336-rutgers/project_1/recreated_mortgage_data.csv' WITH CSV HEADER DELIMITER ',';
 
 
@@ -0,0 +1,374 @@
+r'''
+export_csv.py
+
+Parallel export of the database back to the original HMDA CSV layout.
+
+Produces the same columns as the to_csv view in convert_db_to_csv.sql, but
+instead of one serial pass over a 20-table join it:
+
+1. loads the lookup tables (names, agencies, locations with their MSA, state
+   and county) into small dictionaries once,
+2. splits LoanApplication into ID ranges and, over --workers processes with
+   one connection each, streams every range with COPY (SELECT ...) TO STDOUT:
+   the raw application columns plus the range's race and denial junction rows,
+3. fills in the names from the dictionaries and writes each range as a
+   gzip / zstd / plain chunk file, and
+4. reports rows/sec and MB/sec per chunk and overall.
+
+Chunk files are written to --output-dir (each with a header), or concatenated
+into one --output file (gzip members and zstd frames concatenate into a valid
+stream).
+
+Usage:
+    python3 export_csv.py --output-dir export/ --compress gzip
+    python3 export_csv.py --output recreated_mortgage_data.csv.zst --compress zstd --workers 8
+    python3 export_csv.py --output hmda_2017.csv --year 2017
+'''
+
+import argparse
+import csv
+import gzip
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bulk_load import connect
+
+DEFAULT_WORKERS = 4
+RANGE_ROWS = 100000
+
+COMPRESSION_SUFFIX = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+# output columns, in the order of the to_csv view
+HEADER = [
+    "id", "as_of_year", "respondent_id", "agency_name", "agency_abbr", "agency_code",
+    "loan_type_name", "loan_type", "property_type_name", "property_type",
+    "loan_purpose_name", "loan_purpose", "owner_occupancy_name", "owner_occupancy",
+    "loan_amount_000s", "preapproval_name", "preapproval", "action_taken_name", "action_taken",
+    "msamd_name", "msamd", "state_name", "state_abbr", "state_code", "county_name", "county_code",
+    "census_tract_number",
+    "applicant_ethnicity_name", "applicant_ethnicity", "co_applicant_ethnicity_name", "co_applicant_ethnicity",
+] + [
+    f"{prefix}{n}" for n in range(1, 6) for prefix in ("applicant_race_name_", "applicant_race_")
+] + [
+    f"{prefix}{n}" for n in range(1, 6) for prefix in ("co_applicant_race_name_", "co_applicant_race_")
+] + [
+    "applicant_sex_name", "applicant_sex", "co_applicant_sex_name", "co_applicant_sex",
+    "applicant_income_000s", "purchaser_type_name", "purchaser_type",
+] + [
+    f"{prefix}{n}" for n in range(1, 4) for prefix in ("denial_reason_name_", "denial_reason_")
+] + [
+    "rate_spread", "hoepa_status_name", "hoepa_status", "lien_status_name", "lien_status",
+    "edit_status_name", "edit_status", "sequence_number",
+    "population", "minority_population", "hud_median_family_income", "tract_to_msamd_income",
+    "number_of_owner_occupied_units", "number_of_1_to_4_family_units", "application_date_indicator",
+]
+
+# raw LoanApplication columns streamed per range
+LOAN_COLUMNS = [
+    "ID", "as_of_year", "respondent_id", "loan_type", "property_type", "loan_purpose",
+    "owner_occupancy", "loan_amount_000s", "preapproval", "action_taken", "location_id",
+    "applicant_ethnicity", "co_applicant_ethnicity", "applicant_sex", "co_applicant_sex",
+    "applicant_income_000s", "purchaser_type", "rate_spread", "hoepa_status", "lien_status",
+    "edit_status", "sequence_number", "application_date_indicator",
+]
+
+# lookup dictionary -> query returning (code, name) as text
+NAME_QUERIES = {
+    "loan_type": "SELECT loan_type::text, loan_type_name FROM LoanType",
+    "property_type": "SELECT property_type::text, property_type_name FROM PropertyType",
+    "loan_purpose": "SELECT loan_purpose::text, loan_purpose_name FROM LoanPurpose",
+    "owner_occupancy": "SELECT owner_occupancy::text, owner_occupancy_name FROM OwnerOccupancy",
+    "preapproval": "SELECT preapproval::text, preapproval_name FROM Preapproval",
+    "action_taken": "SELECT action_taken::text, action_taken_name FROM ActionTaken",
+    "ethnicity": "SELECT ethnicity_code::text, ethnicity_name FROM Ethnicity",
+    "race": "SELECT race_code::text, race_name FROM Race",
+    "sex": "SELECT sex_code::text, sex_name FROM Sex",
+    "purchaser_type": "SELECT purchaser_type::text, purchaser_type_name FROM PurchaserType",
+    "denial_reason": "SELECT denial_reason_code::text, denial_reason_name FROM DenialReason",
+    "hoepa_status": "SELECT hoepa_status::text, hoepa_status_name FROM HOEPAStatus",
+    "lien_status": "SELECT lien_status::text, lien_status_name FROM LienStatus",
+    "edit_status": "SELECT edit_status::text, edit_status_name FROM EditStatus",
+}
+
+LOCATION_QUERY = '''
+    SELECT
+        loc.location_id::text, m.msamd_name, loc.msamd, s.state_name, s.state_abbr, loc.state_code,
+        c.county_name, loc.county_code, loc.census_tract_number,
+        loc.population::text, loc.minority_population::text, loc.hud_median_family_income::text,
+        loc.tract_to_msamd_income::text, loc.number_of_owner_occupied_units::text,
+        loc.number_of_1_to_4_family_units::text
+    FROM Location loc
+    LEFT JOIN MSA m ON loc.msamd = m.msamd
+    LEFT JOIN State s ON loc.state_code = s.state_code
+    LEFT JOIN County c ON loc.county_code = c.county_code AND loc.state_code = c.state_code
+'''
+
+AGENCY_QUERY = '''
+    SELECT ra.as_of_year::text, ra.respondent_id, ra.agency_code::text, a.agency_name, a.agency_abbr
+    FROM RespondentAgency ra
+    LEFT JOIN Agency a ON ra.agency_code = a.agency_code
+'''
+
+# a location is 14 values: msamd_name .. census_tract_number go before the ethnicity
+# columns, population .. number_of_1_to_4_family_units after sequence_number
+_EMPTY_LOCATION = ("",) * 14
+_EMPTY_AGENCY = ("", "", "")
+
+
+def load_lookups(cur):
+    '''
+    read every lookup table into dictionaries keyed by the code's text form
+    '''
+    lookups = {}
+    for name, query in NAME_QUERIES.items():
+        cur.execute(query)
+        lookups[name] = {code: value or "" for code, value in cur.fetchall()}
+
+    cur.execute(LOCATION_QUERY)
+    lookups["location"] = {row[0]: tuple(v or "" for v in row[1:]) for row in cur.fetchall()}
+
+    cur.execute(AGENCY_QUERY)
+    lookups["agency"] = {(year, respondent): (code or "", name or "", abbr or "")
+                         for year, respondent, code, name, abbr in cur.fetchall()}
+    return lookups
+
+
+def id_ranges(cur, year=None, range_rows=RANGE_ROWS):
+    '''
+    split the applications (of one year) into ID ranges of about range_rows rows
+    '''
+    where = "WHERE as_of_year = %s" if year is not None else ""
+    cur.execute(f"SELECT MIN(ID), MAX(ID), COUNT(*) FROM LoanApplication {where}", (year,) if where else None)
+    low, high, count = cur.fetchone()
+    if not count:
+        return [], 0
+
+    # IDs are dense, so an even split of the ID space gives evenly sized ranges
+    span = high - low + 1
+    ranges_needed = max(1, -(-count // range_rows))
+    step = -(-span // ranges_needed)
+    return [(start, min(start + step - 1, high)) for start in range(low, high + 1, step)], count
+
+
+def copy_rows(cur, query):
+    '''
+    stream a query with COPY TO STDOUT and parse it back into rows
+    '''
+    buffer = io.StringIO()
+    cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", buffer)
+    buffer.seek(0)
+    return csv.reader(buffer)
+
+
+def junction_codes(rows):
+    '''
+    {ID: {number: code}} from (ID, number, code) rows
+    '''
+    codes = {}
+    for row_id, number, code in rows:
+        codes.setdefault(row_id, {})[number] = code
+    return codes
+
+
+def assemble_row(loan, lookups, races, co_races, denials):
+    '''
+    one output row in HEADER order from a LoanApplication row and the range's junction codes
+    '''
+    (row_id, year, respondent, loan_type, property_type, loan_purpose, owner_occupancy, loan_amount,
+     preapproval, action_taken, location_id, ethnicity, co_ethnicity, sex, co_sex, income,
+     purchaser_type, rate_spread, hoepa_status, lien_status, edit_status, sequence_number,
+     date_indicator) = loan
+
+    agency_code, agency_name, agency_abbr = lookups["agency"].get((year, respondent), _EMPTY_AGENCY)
+    location = lookups["location"].get(location_id, _EMPTY_LOCATION)
+    race_names = lookups["race"]
+    denial_names = lookups["denial_reason"]
+
+    row = [
+        row_id, year, respondent, agency_name, agency_abbr, agency_code,
+        lookups["loan_type"].get(loan_type, ""), loan_type,
+        lookups["property_type"].get(property_type, ""), property_type,
+        lookups["loan_purpose"].get(loan_purpose, ""), loan_purpose,
+        lookups["owner_occupancy"].get(owner_occupancy, ""), owner_occupancy,
+        loan_amount,
+        lookups["preapproval"].get(preapproval, ""), preapproval,
+        lookups["action_taken"].get(action_taken, ""), action_taken,
+    ]
+    row += location[:8]
+    row += [
+        lookups["ethnicity"].get(ethnicity, ""), ethnicity,
+        lookups["ethnicity"].get(co_ethnicity, ""), co_ethnicity,
+    ]
+    for codes, count in ((races.get(row_id, {}), 5), (co_races.get(row_id, {}), 5)):
+        for n in range(1, count + 1):
+            code = codes.get(str(n), "")
+            row += [race_names.get(code, ""), code]
+    row += [
+        lookups["sex"].get(sex, ""), sex,
+        lookups["sex"].get(co_sex, ""), co_sex,
+        income,
+        lookups["purchaser_type"].get(purchaser_type, ""), purchaser_type,
+    ]
+    codes = denials.get(row_id, {})
+    for n in range(1, 4):
+        code = codes.get(str(n), "")
+        row += [denial_names.get(code, ""), code]
+    row += [
+        rate_spread,
+        lookups["hoepa_status"].get(hoepa_status, ""), hoepa_status,
+        lookups["lien_status"].get(lien_status, ""), lien_status,
+        lookups["edit_status"].get(edit_status, ""), edit_status,
+        sequence_number,
+    ]
+    row += location[8:]
+    row.append(date_indicator)
+    return row
+
+
+def open_output(path, compress, level):
+    if compress == "gzip":
+        return io.TextIOWrapper(gzip.open(path, 'wb', compresslevel=level), encoding='utf-8', newline='')
+    if compress == "zstd":
+        import zstandard
+
+        raw = open(path, 'wb')
+        return io.TextIOWrapper(zstandard.ZstdCompressor(level=level).stream_writer(raw), encoding='utf-8', newline='')
+    return open(path, 'w', newline='')
+
+
+# per-process state of the export workers
+_worker = {}
+
+
+def init_worker(dsn, lookups):
+    _worker["conn"] = connect(dsn)
+    _worker["lookups"] = lookups
+
+
+def export_range(index, low, high, year, path, compress, level, header):
+    '''
+    export one ID range to a chunk file; returns (index, rows, seconds, bytes written)
+    '''
+    start = time.perf_counter()
+    lookups = _worker["lookups"]
+    year_filter = f" AND as_of_year = {int(year)}" if year is not None else ""
+    ids = f"ID BETWEEN {int(low)} AND {int(high)}"
+
+    with _worker["conn"].cursor() as cur:
+        races = junction_codes(copy_rows(cur, f"SELECT ID, race_number, race_code FROM ApplicantRace WHERE {ids}"))
+        co_races = junction_codes(copy_rows(cur, f"SELECT ID, race_number, race_code FROM CoApplicantRace WHERE {ids}"))
+        denials = junction_codes(copy_rows(
+            cur, f"SELECT ID, reason_number, denial_reason_code FROM DenialReasons WHERE {ids}"))
+        loans = copy_rows(cur, f"SELECT {', '.join(LOAN_COLUMNS)} FROM LoanApplication "
+                               f"WHERE {ids}{year_filter} ORDER BY ID")
+
+        rows = 0
+        with open_output(path, compress, level) as out:
+            writer = csv.writer(out)
+            if header:
+                writer.writerow(HEADER)
+            for loan in loans:
+                writer.writerow(assemble_row(loan, lookups, races, co_races, denials))
+                rows += 1
+
+    return index, rows, time.perf_counter() - start, os.path.getsize(path)
+
+
+def concatenate(chunk_paths, output):
+    with open(output, 'wb') as out:
+        for path in chunk_paths:
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, out, 1 << 20)
+
+
+def export(dsn, output=None, output_dir=None, compress="gzip", level=None, workers=DEFAULT_WORKERS,
+           year=None, range_rows=RANGE_ROWS):
+    '''
+    export the database to chunk files in output_dir, or to a single output file
+    '''
+    if compress == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            raise ValueError("zstd compression needs the zstandard package (pip install zstandard)")
+    level = level if level is not None else (3 if compress == "zstd" else 6)
+
+    start = time.perf_counter()
+    conn = connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            lookups = load_lookups(cur)
+            ranges, expected = id_ranges(cur, year, range_rows)
+    finally:
+        conn.close()
+    print(f"Loaded lookups ({len(lookups['location']):,} locations) in {time.perf_counter() - start:.2f}s")
+    if not ranges:
+        print("No applications to export.")
+        return 0
+
+    single = output is not None
+    chunk_dir = tempfile.mkdtemp(prefix="hmda_export_", dir=os.path.dirname(os.path.abspath(output))) if single else output_dir
+    os.makedirs(chunk_dir, exist_ok=True)
+    suffix = COMPRESSION_SUFFIX[compress]
+    chunk_paths = [os.path.join(chunk_dir, f"part-{i + 1:05d}.csv{suffix}") for i in range(len(ranges))]
+
+    print(f"Exporting {expected:,} applications in {len(ranges)} ranges with {workers} workers...")
+    export_start = time.perf_counter()
+    total_rows = 0
+    total_bytes = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(dsn, lookups)) as pool:
+            futures = [
+                pool.submit(export_range, i, low, high, year, chunk_paths[i], compress, level,
+                            not single or i == 0)
+                for i, (low, high) in enumerate(ranges)
+            ]
+            for future in as_completed(futures):
+                index, rows, seconds, size = future.result()
+                total_rows += rows
+                total_bytes += size
+                rate = rows / seconds if seconds > 0 else 0
+                print(f"  part {index + 1:>5}  IDs {ranges[index][0]:>10,}-{ranges[index][1]:<10,}"
+                      f"{rows:>10,} rows  {seconds:>6.2f}s  {rate:>10,.0f} rows/s")
+
+        if single:
+            concatenate(chunk_paths, output)
+    finally:
+        if single:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - export_start
+    target = output if single else chunk_dir
+    print(f"\nExported {total_rows:,} rows to {target} in {elapsed:.1f}s: "
+          f"{total_rows / elapsed:,.0f} rows/s, {total_bytes / elapsed / 1e6:,.1f} MB/s written ({total_bytes / 1e6:,.1f} MB)")
+    return total_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the HMDA database to the original CSV layout in parallel.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--output", help="single output file")
+    target.add_argument("--output-dir", help="directory for per-range chunk files")
+    parser.add_argument("--dsn", default=os.getenv("HMDA_DSN", ""), help="libpq connection string (default: HMDA_DSN or PG* variables)")
+    parser.add_argument("--compress", choices=sorted(COMPRESSION_SUFFIX), default="gzip", help="chunk compression")
+    parser.add_argument("--level", type=int, help="compression level (default: 6 for gzip, 3 for zstd)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="parallel export processes")
+    parser.add_argument("--year", type=int, help="only export this as_of_year")
+    parser.add_argument("--range-rows", type=int, default=RANGE_ROWS, help="applications per ID range")
+    args = parser.parse_args()
+
+    try:
+        export(args.dsn, args.output, args.output_dir, args.compress, args.level, args.workers,
+               args.year, args.range_rows)
+    except Exception as e:
+        print(f"Error exporting data: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
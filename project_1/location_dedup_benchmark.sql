@@ -0,0 +1,218 @@
+-- timing benchmark for the Location normalization step of project_1.sql
+--
+-- builds a synthetic Preliminary-shaped table (1M rows by default) in temp
+-- tables only, then times the hashed-key method used by project_1.sql and,
+-- optionally, the old 10-column NULL-safe join it replaced.
+--
+-- usage:
+--   psql -f location_dedup_benchmark.sql
+--   psql -v rows=2000000 -v locations=80000 -f location_dedup_benchmark.sql
+--   psql -v rows=100000 -v locations=5000 -v run_old=1 -f location_dedup_benchmark.sql
+--
+-- the old method grows with (distinct locations)^2, keep rows/locations small when running it.
+
+\set ON_ERROR_STOP on
+
+\if :{?rows}
+\else
+\set rows 1000000
+\endif
+\if :{?locations}
+\else
+\set locations 50000
+\endif
+\if :{?run_old}
+\else
+\set run_old 0
+\endif
+
+SET statement_timeout = 0;
+
+\echo 'generating' :rows 'rows over' :locations 'locations'
+
+-- every row gets one of :locations location combinations, with some missing values
+DROP TABLE IF EXISTS bench_preliminary;
+CREATE TEMPORARY TABLE bench_preliminary AS
+SELECT
+    g AS ID,
+    CASE WHEN k % 97 = 0 THEN '' ELSE lpad((10000 + k % 300)::text, 5, '0') END AS msamd,
+    lpad((1 + k % 50)::text, 2, '0') AS state_code,
+    lpad((1 + k % 200)::text, 3, '0') AS county_code,
+    CASE WHEN k % 89 = 0 THEN '' ELSE lpad((k % 10000)::text, 4, '0') || '.' || lpad((k % 100)::text, 2, '0') END AS census_tract_number,
+    (1000 + k % 9000)::text AS population,
+    CASE WHEN k % 13 = 0 THEN '' ELSE round((k % 10000) / 100.0, 2)::text END AS minority_population,
+    (40000 + k % 60000)::text AS hud_median_family_income,
+    round((k % 20000) / 100.0, 2)::text AS tract_to_msamd_income,
+    (100 + k % 3000)::text AS number_of_owner_occupied_units,
+    CASE WHEN k % 7 = 0 THEN '' ELSE (100 + k % 4000)::text END AS number_of_1_to_4_family_units
+FROM (
+    SELECT g, (g::BIGINT * 7919) % :locations AS k
+    FROM generate_series(1, :rows) AS g
+) AS s;
+ANALYZE bench_preliminary;
+
+\timing on
+
+-- ===================== hashed key (project_1.sql) =====================
+\echo '--- hashed key: build temp_location with ids'
+DROP TABLE IF EXISTS bench_location_new;
+CREATE TEMPORARY TABLE bench_location_new AS
+SELECT
+    ROW_NUMBER() OVER (ORDER BY location_key) AS location_id,
+    d.*
+FROM (
+    SELECT DISTINCT
+        md5(
+            COALESCE(msamd, '') || '|' ||
+            COALESCE(state_code, '') || '|' ||
+            COALESCE(county_code, '') || '|' ||
+            COALESCE(census_tract_number, '') || '|' ||
+            COALESCE(population, '') || '|' ||
+            COALESCE(minority_population, '') || '|' ||
+            COALESCE(hud_median_family_income, '') || '|' ||
+            COALESCE(tract_to_msamd_income, '') || '|' ||
+            COALESCE(number_of_owner_occupied_units, '') || '|' ||
+            COALESCE(number_of_1_to_4_family_units, '')
+        ) AS location_key,
+        NULLIF(msamd, '') AS msamd,
+        NULLIF(state_code, '') AS state_code,
+        NULLIF(county_code, '') AS county_code,
+        NULLIF(census_tract_number, '') AS census_tract_number,
+        NULLIF(population, '')::INTEGER AS population,
+        NULLIF(minority_population, '')::NUMERIC AS minority_population,
+        NULLIF(hud_median_family_income, '')::INTEGER AS hud_median_family_income,
+        NULLIF(tract_to_msamd_income, '')::NUMERIC AS tract_to_msamd_income,
+        NULLIF(number_of_owner_occupied_units, '')::INTEGER AS number_of_owner_occupied_units,
+        NULLIF(number_of_1_to_4_family_units, '')::INTEGER AS number_of_1_to_4_family_units
+    FROM bench_preliminary
+) AS d;
+
+\echo '--- hashed key: index the key'
+CREATE UNIQUE INDEX bench_location_new_key_idx ON bench_location_new (location_key);
+ANALYZE bench_location_new;
+
+\echo '--- hashed key: map every row to its location_id'
+DROP TABLE IF EXISTS bench_mapping_new;
+CREATE TEMPORARY TABLE bench_mapping_new AS
+SELECT p.ID, loc.location_id
+FROM bench_preliminary p
+JOIN bench_location_new loc ON loc.location_key = md5(
+        COALESCE(p.msamd, '') || '|' ||
+        COALESCE(p.state_code, '') || '|' ||
+        COALESCE(p.county_code, '') || '|' ||
+        COALESCE(p.census_tract_number, '') || '|' ||
+        COALESCE(p.population, '') || '|' ||
+        COALESCE(p.minority_population, '') || '|' ||
+        COALESCE(p.hud_median_family_income, '') || '|' ||
+        COALESCE(p.tract_to_msamd_income, '') || '|' ||
+        COALESCE(p.number_of_owner_occupied_units, '') || '|' ||
+        COALESCE(p.number_of_1_to_4_family_units, '')
+    );
+
+\timing off
+SELECT
+    (SELECT COUNT(*) FROM bench_location_new) AS locations,
+    (SELECT COUNT(*) FROM bench_mapping_new) AS mapped_rows,
+    (SELECT COUNT(*) FROM bench_preliminary) AS preliminary_rows;
+
+-- ===================== old 10-column join =====================
+\if :run_old
+\timing on
+
+\echo '--- old: build temp_location with concatenated key'
+DROP TABLE IF EXISTS bench_temp_location_old;
+CREATE TEMPORARY TABLE bench_temp_location_old AS
+SELECT DISTINCT
+    NULLIF(msamd, '') AS msamd,
+    NULLIF(state_code, '') AS state_code,
+    NULLIF(county_code, '') AS county_code,
+    NULLIF(census_tract_number, '') AS census_tract_number,
+    NULLIF(population, '')::INTEGER AS population,
+    NULLIF(minority_population, '')::NUMERIC AS minority_population,
+    NULLIF(hud_median_family_income, '')::INTEGER AS hud_median_family_income,
+    NULLIF(tract_to_msamd_income, '')::NUMERIC AS tract_to_msamd_income,
+    NULLIF(number_of_owner_occupied_units, '')::INTEGER AS number_of_owner_occupied_units,
+    NULLIF(number_of_1_to_4_family_units, '')::INTEGER AS number_of_1_to_4_family_units,
+    CONCAT(
+        COALESCE(msamd, ''), '|',
+        COALESCE(state_code, ''), '|',
+        COALESCE(county_code, ''), '|',
+        COALESCE(census_tract_number, ''), '|',
+        COALESCE(population, ''), '|',
+        COALESCE(minority_population, ''), '|',
+        COALESCE(hud_median_family_income, ''), '|',
+        COALESCE(tract_to_msamd_income, ''), '|',
+        COALESCE(number_of_owner_occupied_units, ''), '|',
+        COALESCE(number_of_1_to_4_family_units, '')
+    ) AS location_key
+FROM bench_preliminary;
+
+\echo '--- old: insert locations'
+DROP TABLE IF EXISTS bench_location_old;
+CREATE TEMPORARY TABLE bench_location_old (
+    location_id SERIAL PRIMARY KEY,
+    msamd VARCHAR(5),
+    state_code CHAR(2),
+    county_code CHAR(3),
+    census_tract_number VARCHAR(8),
+    population INTEGER,
+    minority_population NUMERIC,
+    hud_median_family_income INTEGER,
+    tract_to_msamd_income NUMERIC,
+    number_of_owner_occupied_units INTEGER,
+    number_of_1_to_4_family_units INTEGER
+);
+INSERT INTO bench_location_old (
+    msamd, state_code, county_code, census_tract_number, population, minority_population,
+    hud_median_family_income, tract_to_msamd_income, number_of_owner_occupied_units,
+    number_of_1_to_4_family_units
+)
+SELECT
+    msamd, state_code, county_code, census_tract_number, population, minority_population,
+    hud_median_family_income, tract_to_msamd_income, number_of_owner_occupied_units,
+    number_of_1_to_4_family_units
+FROM bench_temp_location_old;
+
+\echo '--- old: match locations back with the NULL-safe 10-column join'
+DROP TABLE IF EXISTS bench_temp_location_id_old;
+CREATE TEMPORARY TABLE bench_temp_location_id_old AS
+SELECT
+    temp.location_key,
+    loc.location_id
+FROM bench_temp_location_old temp
+JOIN bench_location_old loc ON
+    (temp.msamd = loc.msamd OR (temp.msamd IS NULL AND loc.msamd IS NULL)) AND
+    (temp.state_code = loc.state_code OR (temp.state_code IS NULL AND loc.state_code IS NULL)) AND
+    (temp.county_code = loc.county_code OR (temp.county_code IS NULL AND loc.county_code IS NULL)) AND
+    (temp.census_tract_number = loc.census_tract_number OR (temp.census_tract_number IS NULL AND loc.census_tract_number IS NULL)) AND
+    (temp.population = loc.population OR (temp.population IS NULL AND loc.population IS NULL)) AND
+    (temp.minority_population = loc.minority_population OR (temp.minority_population IS NULL AND loc.minority_population IS NULL)) AND
+    (temp.hud_median_family_income = loc.hud_median_family_income OR (temp.hud_median_family_income IS NULL AND loc.hud_median_family_income IS NULL)) AND
+    (temp.tract_to_msamd_income = loc.tract_to_msamd_income OR (temp.tract_to_msamd_income IS NULL AND loc.tract_to_msamd_income IS NULL)) AND
+    (temp.number_of_owner_occupied_units = loc.number_of_owner_occupied_units OR (temp.number_of_owner_occupied_units IS NULL AND loc.number_of_owner_occupied_units IS NULL)) AND
+    (temp.number_of_1_to_4_family_units = loc.number_of_1_to_4_family_units OR (temp.number_of_1_to_4_family_units IS NULL AND loc.number_of_1_to_4_family_units IS NULL));
+
+\echo '--- old: map every row through the CONCAT key'
+DROP TABLE IF EXISTS bench_mapping_old;
+CREATE TEMPORARY TABLE bench_mapping_old AS
+SELECT p.ID, loc.location_id
+FROM bench_preliminary p
+JOIN bench_temp_location_id_old loc ON
+    CONCAT(
+        COALESCE(p.msamd, ''), '|',
+        COALESCE(p.state_code, ''), '|',
+        COALESCE(p.county_code, ''), '|',
+        COALESCE(p.census_tract_number, ''), '|',
+        COALESCE(p.population, ''), '|',
+        COALESCE(p.minority_population, ''), '|',
+        COALESCE(p.hud_median_family_income, ''), '|',
+        COALESCE(p.tract_to_msamd_income, ''), '|',
+        COALESCE(p.number_of_owner_occupied_units, ''), '|',
+        COALESCE(p.number_of_1_to_4_family_units, '')
+    ) = loc.location_key;
+
+\timing off
+SELECT
+    (SELECT COUNT(*) FROM bench_location_old) AS locations,
+    (SELECT COUNT(*) FROM bench_mapping_old) AS mapped_rows;
+\endif
@@ -0,0 +1,188 @@
+r'''
+partition_benchmark.py
+
+Compares the plain (project_1.sql) and partitioned (project_1_partitioned.sql)
+layouts on SQL for the project_2 test question set.
+
+Load the same CSVs into two databases first, e.g.:
+    python3 bulk_load.py --dsn "dbname=hmda" 2016.csv 2017.csv
+    python3 bulk_load.py --dsn "dbname=hmda_part" --schema project_1_partitioned.sql 2016.csv 2017.csv
+
+then run:
+    python3 partition_benchmark.py --heap-dsn "dbname=hmda" --partitioned-dsn "dbname=hmda_part"
+    python3 partition_benchmark.py --heap-dsn ... --partitioned-dsn ... --repeat 5 --report results.json
+
+Every query runs under EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON). The report shows
+the median execution time, the number of LoanApplication partitions the plan
+actually scanned (after planning-time and run-time pruning) and the shared
+buffers touched, for each layout. The test questions are answered as written,
+plus year- and state-scoped versions of them, since the test set itself never
+filters by year; {year} and {state} are filled with the latest loaded year and
+the state with the most applications.
+'''
+
+import argparse
+import json
+import statistics
+import sys
+
+from bulk_load import connect
+
+# SQL answers to test_querys.txt (numbered as there) and scoped variants of them
+QUERIES = [
+    ("1", "average loan amount",
+     "SELECT AVG(loan_amount_000s) FROM LoanApplication"),
+    ("2", "most common denial reason",
+     "SELECT dr.denial_reason_name, COUNT(*) AS n FROM DenialReasons d "
+     "JOIN DenialReason dr ON d.denial_reason_code = dr.denial_reason_code "
+     "GROUP BY dr.denial_reason_name ORDER BY n DESC LIMIT 1"),
+    ("3", "loan value greater than income",
+     "SELECT COUNT(*) FROM LoanApplication WHERE loan_amount_000s > applicant_income_000s"),
+    ("4", "average income of owner occupied",
+     "SELECT AVG(applicant_income_000s) FROM LoanApplication WHERE owner_occupancy = 1"),
+    ("5", "top 3 loan types by income",
+     "SELECT lt.loan_type_name, AVG(la.applicant_income_000s) AS avg_income FROM LoanApplication la "
+     "JOIN LoanType lt ON la.loan_type = lt.loan_type "
+     "GROUP BY lt.loan_type_name ORDER BY avg_income DESC LIMIT 3"),
+    ("7", "approved, income < 50K, owner occupied",
+     "SELECT COUNT(*) FROM LoanApplication "
+     "WHERE action_taken = 1 AND applicant_income_000s < 50 AND owner_occupancy = 1"),
+    ("8", "state with highest average loan",
+     "SELECT s.state_name, AVG(la.loan_amount_000s) AS avg_loan FROM LoanApplication la "
+     "JOIN Location loc ON la.location_id = loc.location_id JOIN State s ON loc.state_code = s.state_code "
+     "GROUP BY s.state_name ORDER BY avg_loan DESC LIMIT 1"),
+    ("9", "loan amount trend by year",
+     "SELECT as_of_year, AVG(loan_amount_000s) FROM LoanApplication GROUP BY as_of_year ORDER BY as_of_year"),
+    ("13", "states with > 1000 DTI denials",
+     "SELECT loc.state_code, COUNT(*) AS n FROM LoanApplication la "
+     "JOIN DenialReasons d ON d.ID = la.ID JOIN Location loc ON la.location_id = loc.location_id "
+     "WHERE la.action_taken = 3 AND d.denial_reason_code = 1 "
+     "GROUP BY loc.state_code HAVING COUNT(*) > 1000"),
+    ("15", "approved to denied ratio by state",
+     "SELECT loc.state_code, SUM(CASE WHEN la.action_taken = 1 THEN 1 ELSE 0 END)::NUMERIC "
+     "/ NULLIF(SUM(CASE WHEN la.action_taken = 3 THEN 1 ELSE 0 END), 0) AS ratio "
+     "FROM LoanApplication la JOIN Location loc ON la.location_id = loc.location_id GROUP BY loc.state_code"),
+    ("18", "counties with most minority applicants",
+     "SELECT loc.state_code, loc.county_code, AVG(loc.minority_population) AS minority FROM LoanApplication la "
+     "JOIN Location loc ON la.location_id = loc.location_id "
+     "GROUP BY loc.state_code, loc.county_code ORDER BY minority DESC LIMIT 10"),
+    ("1/year", "average loan amount in {year}",
+     "SELECT AVG(loan_amount_000s) FROM LoanApplication WHERE as_of_year = {year}"),
+    ("7/year", "approved, income < 50K, owner occupied, {year}",
+     "SELECT COUNT(*) FROM LoanApplication "
+     "WHERE as_of_year = {year} AND action_taken = 1 AND applicant_income_000s < 50 AND owner_occupancy = 1"),
+    ("9/year", "loan amounts since {year}",
+     "SELECT as_of_year, AVG(loan_amount_000s) FROM LoanApplication WHERE as_of_year >= {year} GROUP BY as_of_year"),
+    ("13/year", "DTI denials by state in {year}",
+     "SELECT loc.state_code, COUNT(*) AS n FROM LoanApplication la "
+     "JOIN DenialReasons d ON d.ID = la.ID JOIN Location loc ON la.location_id = loc.location_id "
+     "WHERE la.as_of_year = {year} AND la.action_taken = 3 AND d.denial_reason_code = 1 "
+     "GROUP BY loc.state_code"),
+    ("8/state", "average loan in state {state}",
+     "SELECT AVG(la.loan_amount_000s) FROM LoanApplication la "
+     "JOIN Location loc ON la.location_id = loc.location_id WHERE loc.state_code = '{state}'"),
+    ("15/both", "approved to denied ratio in state {state}, {year}",
+     "SELECT SUM(CASE WHEN la.action_taken = 1 THEN 1 ELSE 0 END)::NUMERIC "
+     "/ NULLIF(SUM(CASE WHEN la.action_taken = 3 THEN 1 ELSE 0 END), 0) AS ratio "
+     "FROM LoanApplication la JOIN Location loc ON la.location_id = loc.location_id "
+     "WHERE la.as_of_year = {year} AND loc.state_code = '{state}'"),
+]
+
+
+def scope_values(cur):
+    cur.execute("SELECT MAX(as_of_year) FROM LoanApplication")
+    year = cur.fetchone()[0]
+    cur.execute(
+        "SELECT loc.state_code FROM LoanApplication la JOIN Location loc ON la.location_id = loc.location_id "
+        "WHERE loc.state_code IS NOT NULL GROUP BY loc.state_code ORDER BY COUNT(*) DESC LIMIT 1"
+    )
+    row = cur.fetchone()
+    return {"year": year, "state": row[0] if row else ""}
+
+
+def scanned_relations(node, scanned=None):
+    '''
+    walk an EXPLAIN JSON plan, collecting the LoanApplication relations that were actually scanned
+    '''
+    if scanned is None:
+        scanned = set()
+    relation = node.get("Relation Name", "")
+    # subplans pruned at run time are listed but never executed
+    if relation.lower().startswith("loanapplication") and node.get("Actual Loops", 0) > 0:
+        scanned.add(relation.lower())
+    for child in node.get("Plans", []):
+        scanned_relations(child, scanned)
+    return scanned
+
+
+def measure(cur, sql, repeat):
+    '''
+    median execution time (ms), partitions scanned and buffers of one query
+    '''
+    times = []
+    for _ in range(repeat):
+        cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")
+        explain = cur.fetchone()[0]
+        explain = explain[0] if isinstance(explain, list) else json.loads(explain)[0]
+        times.append(explain["Execution Time"])
+    plan = explain["Plan"]
+    return {
+        "ms": statistics.median(times),
+        "partitions": len(scanned_relations(plan)),
+        # buffer counts of a node include its children
+        "buffers": plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0),
+    }
+
+
+def run_benchmark(heap_dsn, partitioned_dsn, repeat):
+    heap = connect(heap_dsn)
+    partitioned = connect(partitioned_dsn)
+    results = []
+    try:
+        with heap.cursor() as heap_cur, partitioned.cursor() as part_cur:
+            scope = scope_values(heap_cur)
+            part_cur.execute("SELECT COUNT(*) FROM pg_inherits WHERE inhparent = 'loanapplication'::regclass")
+            total_partitions = part_cur.fetchone()[0]
+            print(f"Scoped queries use year {scope['year']} and state {scope['state']}; "
+                  f"partitioned LoanApplication has {total_partitions} partitions\n")
+
+            print(f"{'query':<10}{'heap ms':>10}{'part ms':>10}{'speedup':>9}{'parts':>7}{'heap buf':>10}{'part buf':>10}  question")
+            for query_id, question, template in QUERIES:
+                sql = template.format(**scope)
+                label = question.format(**scope)
+                heap_stats = measure(heap_cur, sql, repeat)
+                part_stats = measure(part_cur, sql, repeat)
+                speedup = heap_stats["ms"] / part_stats["ms"] if part_stats["ms"] else 0.0
+                print(f"{query_id:<10}{heap_stats['ms']:>10.1f}{part_stats['ms']:>10.1f}{speedup:>8.2f}x"
+                      f"{part_stats['partitions']:>4}/{total_partitions:<2}"
+                      f"{heap_stats['buffers']:>10,}{part_stats['buffers']:>10,}  {label}")
+                results.append({"id": query_id, "question": label, "sql": sql,
+                                "heap": heap_stats, "partitioned": part_stats})
+    finally:
+        heap.close()
+        partitioned.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare query plans of the plain and partitioned HMDA layouts.")
+    parser.add_argument("--heap-dsn", required=True, help="database loaded with project_1.sql")
+    parser.add_argument("--partitioned-dsn", required=True, help="database loaded with project_1_partitioned.sql")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per query, the median is reported")
+    parser.add_argument("--report", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    try:
+        results = run_benchmark(args.heap_dsn, args.partitioned_dsn, args.repeat)
+    except Exception as e:
+        print(f"Error running benchmark: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nReport written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
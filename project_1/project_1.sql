@@ -2,6 +2,8 @@
 SET statement_timeout = '10min';
 
 -- drop previous tables to reduce conflict when rerunning
+DROP TABLE IF EXISTS LoadBatch CASCADE;
+DROP TABLE IF EXISTS LocationKey CASCADE;
 DROP TABLE IF EXISTS DenialReasons CASCADE;
 DROP TABLE IF EXISTS CoApplicantRace CASCADE;
 DROP TABLE IF EXISTS ApplicantRace CASCADE;
@@ -219,6 +221,26 @@ CREATE TABLE DenialReasons (
     FOREIGN KEY (denial_reason_code) REFERENCES DenialReason(denial_reason_code)
 );
 
+-- hashed key of each distinct location (see temp_location below), so appended
+-- batches can find existing locations instead of duplicating them
+CREATE TABLE LocationKey (
+    location_key CHAR(32) PRIMARY KEY,
+    location_id INTEGER NOT NULL,
+    FOREIGN KEY (location_id) REFERENCES Location(location_id)
+);
+
+-- manifest of loaded CSV batches, filled by bulk_load.py
+CREATE TABLE LoadBatch (
+    batch_id SERIAL PRIMARY KEY,
+    checksum CHAR(64) NOT NULL UNIQUE,
+    source_files TEXT NOT NULL,
+    as_of_years VARCHAR(100),
+    first_id INTEGER,
+    last_id INTEGER,
+    row_count INTEGER NOT NULL,
+    loaded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
 -- fill lookup tables with distinct values
 INSERT INTO Agency (agency_code, agency_name, agency_abbr)
 SELECT DISTINCT
@@ -436,32 +458,47 @@ FROM Preliminary
 WHERE as_of_year != '' AND respondent_id != '' AND agency_code != ''
 ON CONFLICT (as_of_year, respondent_id) DO NOTHING;
 
--- create temp table to handle location data
+-- create temp table to handle location data.
+-- every distinct combination of location columns is identified by one hashed
+-- key (md5 of the raw values; '' and NULL both mean missing, like the NULLIF
+-- casts), so the joins below are single-column hash joins instead of
+-- 10-column NULL-safe comparisons.
+-- location ids are assigned here in key order, which gives the key -> id
+-- mapping directly without matching inserted rows back by value.
 CREATE TEMPORARY TABLE temp_location AS
-SELECT DISTINCT
-    NULLIF(msamd, '') AS msamd,
-    NULLIF(state_code, '') AS state_code,
-    NULLIF(county_code, '') AS county_code,
-    NULLIF(census_tract_number, '') AS census_tract_number,
-    NULLIF(population, '')::INTEGER AS population,
-    NULLIF(minority_population, '')::NUMERIC AS minority_population,
-    NULLIF(hud_median_family_income, '')::INTEGER AS hud_median_family_income,
-    NULLIF(tract_to_msamd_income, '')::NUMERIC AS tract_to_msamd_income,
-    NULLIF(number_of_owner_occupied_units, '')::INTEGER AS number_of_owner_occupied_units,
-    NULLIF(number_of_1_to_4_family_units, '')::INTEGER AS number_of_1_to_4_family_units,
-    CONCAT(
-        COALESCE(msamd, ''), '|',
-        COALESCE(state_code, ''), '|',
-        COALESCE(county_code, ''), '|',
-        COALESCE(census_tract_number, ''), '|',
-        COALESCE(population, ''), '|',
-        COALESCE(minority_population, ''), '|',
-        COALESCE(hud_median_family_income, ''), '|',
-        COALESCE(tract_to_msamd_income, ''), '|',
-        COALESCE(number_of_owner_occupied_units, ''), '|',
-        COALESCE(number_of_1_to_4_family_units, '')
-    ) as location_key
-FROM Preliminary;
+SELECT
+    ROW_NUMBER() OVER (ORDER BY location_key) AS location_id,
+    d.*
+FROM (
+    SELECT DISTINCT
+        md5(
+            COALESCE(msamd, '') || '|' ||
+            COALESCE(state_code, '') || '|' ||
+            COALESCE(county_code, '') || '|' ||
+            COALESCE(census_tract_number, '') || '|' ||
+            COALESCE(population, '') || '|' ||
+            COALESCE(minority_population, '') || '|' ||
+            COALESCE(hud_median_family_income, '') || '|' ||
+            COALESCE(tract_to_msamd_income, '') || '|' ||
+            COALESCE(number_of_owner_occupied_units, '') || '|' ||
+            COALESCE(number_of_1_to_4_family_units, '')
+        ) AS location_key,
+        NULLIF(msamd, '') AS msamd,
+        NULLIF(state_code, '') AS state_code,
+        NULLIF(county_code, '') AS county_code,
+        NULLIF(census_tract_number, '') AS census_tract_number,
+        NULLIF(population, '')::INTEGER AS population,
+        NULLIF(minority_population, '')::NUMERIC AS minority_population,
+        NULLIF(hud_median_family_income, '')::INTEGER AS hud_median_family_income,
+        NULLIF(tract_to_msamd_income, '')::NUMERIC AS tract_to_msamd_income,
+        NULLIF(number_of_owner_occupied_units, '')::INTEGER AS number_of_owner_occupied_units,
+        NULLIF(number_of_1_to_4_family_units, '')::INTEGER AS number_of_1_to_4_family_units
+    FROM Preliminary
+) AS d;
+
+-- index the key for the LoanApplication join
+CREATE UNIQUE INDEX temp_location_key_idx ON temp_location (location_key);
+ANALYZE temp_location;
 
 -- ensure every msamd in the location data exists in MSA.
 INSERT INTO MSA (msamd, msamd_name)
@@ -470,8 +507,9 @@ FROM temp_location
 WHERE msamd IS NOT NULL
   AND msamd NOT IN (SELECT msamd FROM MSA);
 
--- fill location table with values from temp table
+-- fill location table with values and pre-assigned ids from temp table
 INSERT INTO Location (
+    location_id,
     msamd,
     state_code,
     county_code,
@@ -484,6 +522,7 @@ INSERT INTO Location (
     number_of_1_to_4_family_units
 )
 SELECT
+    location_id,
     msamd,
     state_code,
     county_code,
@@ -496,23 +535,12 @@ SELECT
     number_of_1_to_4_family_units
 FROM temp_location;
 
--- create temp table for creating location_id
-CREATE TEMPORARY TABLE temp_location_id AS
-SELECT 
-    temp.location_key,
-    loc.location_id
-from temp_location temp
-JOIN Location loc ON 
-    (temp.msamd = loc.msamd OR (temp.msamd IS NULL AND loc.msamd IS NULL)) AND
-    (temp.state_code = loc.state_code OR (temp.state_code IS NULL AND loc.state_code IS NULL)) AND
-    (temp.county_code = loc.county_code OR (temp.county_code IS NULL AND loc.county_code IS NULL)) AND
-    (temp.census_tract_number = loc.census_tract_number OR (temp.census_tract_number IS NULL AND loc.census_tract_number IS NULL)) AND
-    (temp.population = loc.population OR (temp.population IS NULL AND loc.population IS NULL)) AND
-    (temp.minority_population = loc.minority_population OR (temp.minority_population IS NULL AND loc.minority_population IS NULL)) AND
-    (temp.hud_median_family_income = loc.hud_median_family_income OR (temp.hud_median_family_income IS NULL AND loc.hud_median_family_income IS NULL)) AND
-    (temp.tract_to_msamd_income = loc.tract_to_msamd_income OR (temp.tract_to_msamd_income IS NULL AND loc.tract_to_msamd_income IS NULL)) AND
-    (temp.number_of_owner_occupied_units = loc.number_of_owner_occupied_units OR (temp.number_of_owner_occupied_units IS NULL AND loc.number_of_owner_occupied_units IS NULL)) AND
-    (temp.number_of_1_to_4_family_units = loc.number_of_1_to_4_family_units OR (temp.number_of_1_to_4_family_units IS NULL AND loc.number_of_1_to_4_family_units IS NULL));
+INSERT INTO LocationKey (location_key, location_id)
+SELECT location_key, location_id
+FROM temp_location;
+
+-- keep the serial in step with the explicit ids
+SELECT setval(pg_get_serial_sequence('location', 'location_id'), COALESCE(MAX(location_id), 0) + 1, false) FROM Location;
 
 -- use temp table to modify LoanApplication table to include location_id
 INSERT INTO LoanApplication (
@@ -548,19 +576,18 @@ SELECT
     NULLIF(p.sequence_number, ''),
     NULLIF(p.application_date_indicator, '')::SMALLINT
 FROM Preliminary p
-JOIN temp_location_id loc ON
-    CONCAT(
-        COALESCE(p.msamd, ''), '|',
-        COALESCE(p.state_code, ''), '|',
-        COALESCE(p.county_code, ''), '|',
-        COALESCE(p.census_tract_number, ''), '|',
-        COALESCE(p.population, ''), '|',
-        COALESCE(p.minority_population, ''), '|',
-        COALESCE(p.hud_median_family_income, ''), '|',
-        COALESCE(p.tract_to_msamd_income, ''), '|',
-        COALESCE(p.number_of_owner_occupied_units, ''), '|',
+JOIN temp_location loc ON loc.location_key = md5(
+        COALESCE(p.msamd, '') || '|' ||
+        COALESCE(p.state_code, '') || '|' ||
+        COALESCE(p.county_code, '') || '|' ||
+        COALESCE(p.census_tract_number, '') || '|' ||
+        COALESCE(p.population, '') || '|' ||
+        COALESCE(p.minority_population, '') || '|' ||
+        COALESCE(p.hud_median_family_income, '') || '|' ||
+        COALESCE(p.tract_to_msamd_income, '') || '|' ||
+        COALESCE(p.number_of_owner_occupied_units, '') || '|' ||
         COALESCE(p.number_of_1_to_4_family_units, '')
-    ) = loc.location_key;
+    );
 
     -- fill ApplicantRace table
 INSERT INTO ApplicantRace (ID, race_number, race_code)
@@ -631,5 +658,4 @@ FROM Preliminary
 WHERE denial_reason_3 != '';
 
 -- remove temp tables
-DROP TABLE temp_location;
-DROP TABLE temp_location_id;
\ No newline at end of file
+DROP TABLE temp_location;
\ No newline at end of file
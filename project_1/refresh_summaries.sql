@@ -0,0 +1,15 @@
+-- rebuild the rollups of summary_layer.sql after new data was loaded
+--
+-- usage: psql -f refresh_summaries.sql
+-- CONCURRENTLY keeps the views readable while they refresh (it relies on
+-- their unique key indexes).
+
+SET statement_timeout = '10min';
+
+REFRESH MATERIALIZED VIEW CONCURRENTLY LoansByStateYear;
+REFRESH MATERIALIZED VIEW CONCURRENTLY LoansByAgencyYear;
+REFRESH MATERIALIZED VIEW CONCURRENTLY DenialsByReason;
+
+ANALYZE LoansByStateYear;
+ANALYZE LoansByAgencyYear;
+ANALYZE DenialsByReason;
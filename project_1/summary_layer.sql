@@ -0,0 +1,99 @@
+-- indexes and precomputed rollups for the common question shapes
+--
+-- run after project_1.sql (or project_1_partitioned.sql) has loaded the data;
+-- bulk_load.py --summaries does this automatically. every statement is
+-- idempotent, so the script can be rerun at any time.
+-- the rollups are materialized views: rebuild them after loading new data
+-- with refresh_summaries.sql (bulk_load.py --append does so when they exist).
+
+SET statement_timeout = '10min';
+
+-- ===================== indexes =====================
+
+-- joins to Location and geography filters
+CREATE INDEX IF NOT EXISTS loanapplication_location_idx ON LoanApplication (location_id);
+CREATE INDEX IF NOT EXISTS location_state_county_idx ON Location (state_code, county_code, location_id);
+
+-- approved / denied filters, covering the measures most questions aggregate
+CREATE INDEX IF NOT EXISTS loanapplication_action_idx
+    ON LoanApplication (action_taken, as_of_year)
+    INCLUDE (location_id, owner_occupancy, loan_amount_000s, applicant_income_000s);
+
+-- lender questions join through RespondentAgency
+CREATE INDEX IF NOT EXISTS loanapplication_respondent_idx ON LoanApplication (as_of_year, respondent_id);
+CREATE INDEX IF NOT EXISTS respondentagency_agency_idx ON RespondentAgency (agency_code);
+
+-- breakdowns by loan / property type and by applicant sex
+CREATE INDEX IF NOT EXISTS loanapplication_type_idx
+    ON LoanApplication (loan_type, property_type)
+    INCLUDE (loan_amount_000s, applicant_income_000s);
+CREATE INDEX IF NOT EXISTS loanapplication_sex_idx
+    ON LoanApplication (applicant_sex)
+    INCLUDE (loan_amount_000s, applicant_income_000s);
+
+-- junction tables are looked up by code ("denied due to credit history", "by race")
+CREATE INDEX IF NOT EXISTS denialreasons_code_idx ON DenialReasons (denial_reason_code, ID);
+CREATE INDEX IF NOT EXISTS applicantrace_code_idx ON ApplicantRace (race_code, ID);
+CREATE INDEX IF NOT EXISTS coapplicantrace_code_idx ON CoApplicantRace (race_code, ID);
+
+-- ===================== rollups =====================
+-- averages are total / count over the rows that have a value, so rollups
+-- can be summed across years and states without skewing the result.
+
+-- applications by year, state and action taken
+CREATE MATERIALIZED VIEW IF NOT EXISTS LoansByStateYear AS
+SELECT
+    la.as_of_year,
+    loc.state_code,
+    la.action_taken,
+    COUNT(*) AS application_count,
+    SUM(la.loan_amount_000s) AS total_loan_amount_000s,
+    COUNT(la.loan_amount_000s) AS loan_amount_count,
+    SUM(la.applicant_income_000s) AS total_applicant_income_000s,
+    COUNT(la.applicant_income_000s) AS applicant_income_count
+FROM LoanApplication la
+JOIN Location loc ON la.location_id = loc.location_id
+GROUP BY la.as_of_year, loc.state_code, la.action_taken;
+
+CREATE UNIQUE INDEX IF NOT EXISTS loansbystateyear_key_idx
+    ON LoansByStateYear (as_of_year, state_code, action_taken);
+
+-- applications by year, agency and action taken
+CREATE MATERIALIZED VIEW IF NOT EXISTS LoansByAgencyYear AS
+SELECT
+    la.as_of_year,
+    ra.agency_code,
+    la.action_taken,
+    COUNT(*) AS application_count,
+    SUM(la.loan_amount_000s) AS total_loan_amount_000s,
+    COUNT(la.loan_amount_000s) AS loan_amount_count,
+    SUM(la.applicant_income_000s) AS total_applicant_income_000s,
+    COUNT(la.applicant_income_000s) AS applicant_income_count
+FROM LoanApplication la
+JOIN RespondentAgency ra ON la.as_of_year = ra.as_of_year AND la.respondent_id = ra.respondent_id
+GROUP BY la.as_of_year, ra.agency_code, la.action_taken;
+
+CREATE UNIQUE INDEX IF NOT EXISTS loansbyagencyyear_key_idx
+    ON LoansByAgencyYear (as_of_year, agency_code, action_taken);
+
+-- denial reasons cited, by year and state (one count per application and reason)
+CREATE MATERIALIZED VIEW IF NOT EXISTS DenialsByReason AS
+SELECT
+    la.as_of_year,
+    loc.state_code,
+    d.denial_reason_code,
+    dr.denial_reason_name,
+    COUNT(*) AS denial_count
+FROM DenialReasons d
+JOIN LoanApplication la ON la.ID = d.ID
+JOIN Location loc ON la.location_id = loc.location_id
+JOIN DenialReason dr ON d.denial_reason_code = dr.denial_reason_code
+GROUP BY la.as_of_year, loc.state_code, d.denial_reason_code, dr.denial_reason_name;
+
+CREATE UNIQUE INDEX IF NOT EXISTS denialsbyreason_key_idx
+    ON DenialsByReason (as_of_year, state_code, denial_reason_code);
+
+ANALYZE LoanApplication;
+ANALYZE LoansByStateYear;
+ANALYZE LoansByAgencyYear;
+ANALYZE DenialsByReason;
@@ -0,0 +1,453 @@
+-- set-based integrity check of the staged Preliminary data
+--
+-- run after the CSVs are staged and the project_1 tables exist (empty for a
+-- full load), before the fill. every row that would make an INSERT of
+-- project_1.sql or append_batch.sql fail is moved to the Quarantine table with
+-- the reasons it failed, so the fill only ever sees clean rows and can't roll
+-- back late. bulk_load.py runs this for full loads and appends.
+--
+-- quarantined rows carry the checksum of their batch (bulk_load.py sets
+-- bulk_load.batch_checksum first), and a rerun of the same files replaces that
+-- batch's rows instead of adding them again.
+--
+-- the staged rows are scanned twice: once to aggregate lookup codes and
+-- respondents, once to check every row against those aggregates, the
+-- existing tables and the column constraints.
+--
+-- reason codes (":column" or ":lookup" says where):
+--   MISSING_ID              ID is empty
+--   DUPLICATE_ID            ID appears earlier in the batch (the first row is kept)
+--   ID_EXISTS               ID is already in LoanApplication
+--   NOT_NULL:column         required LoanApplication column is empty
+--   BAD_NUMBER:column       value doesn't cast to the column's numeric type
+--   OUT_OF_RANGE:column     number doesn't fit SMALLINT / INTEGER
+--   TOO_LONG:column         text longer than the column allows
+--   MISSING_NAME:lookup     code has no name here and isn't in the lookup table yet
+--   NAME_CONFLICT:lookup    code's name differs from the name most rows give it
+--   NO_RESPONDENT           no agency_code for this as_of_year / respondent_id,
+--                           in the batch or in RespondentAgency
+
+CREATE TABLE IF NOT EXISTS Quarantine (
+    quarantine_id SERIAL PRIMARY KEY,
+    ID INTEGER,
+    reasons TEXT[] NOT NULL,
+    row_data JSONB NOT NULL,
+    quarantined_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    batch_checksum TEXT
+);
+
+-- tables created before quarantined rows were tagged with their batch
+ALTER TABLE Quarantine ADD COLUMN IF NOT EXISTS batch_checksum TEXT;
+
+DROP TABLE IF EXISTS temp_lookup_problems;
+DROP TABLE IF EXISTS temp_known_respondents;
+DROP TABLE IF EXISTS temp_quarantine;
+
+-- every (lookup, code, name) the batch uses; agency and state names pair the
+-- name and abbreviation, county codes pair county and state
+CREATE TEMPORARY TABLE temp_lookup_problems AS
+WITH pairs AS (
+    SELECT v.lookup, v.code, COALESCE(v.name, '') AS name, COUNT(*) AS n
+    FROM Preliminary p
+    CROSS JOIN LATERAL (VALUES
+        ('agency', p.agency_code, NULLIF(p.agency_name, '') || '|' || NULLIF(p.agency_abbr, '')),
+        ('loan_type', p.loan_type, p.loan_type_name),
+        ('property_type', p.property_type, p.property_type_name),
+        ('loan_purpose', p.loan_purpose, p.loan_purpose_name),
+        ('owner_occupancy', p.owner_occupancy, p.owner_occupancy_name),
+        ('preapproval', p.preapproval, p.preapproval_name),
+        ('action_taken', p.action_taken, p.action_taken_name),
+        ('state', p.state_code, NULLIF(p.state_name, '') || '|' || NULLIF(p.state_abbr, '')),
+        ('county', NULLIF(p.county_code, '') || '|' || NULLIF(p.state_code, ''), p.county_name),
+        ('ethnicity', p.applicant_ethnicity, p.applicant_ethnicity_name),
+        ('ethnicity', p.co_applicant_ethnicity, p.co_applicant_ethnicity_name),
+        ('race', p.applicant_race_1, p.applicant_race_name_1),
+        ('race', p.applicant_race_2, p.applicant_race_name_2),
+        ('race', p.applicant_race_3, p.applicant_race_name_3),
+        ('race', p.applicant_race_4, p.applicant_race_name_4),
+        ('race', p.applicant_race_5, p.applicant_race_name_5),
+        ('race', p.co_applicant_race_1, p.co_applicant_race_name_1),
+        ('race', p.co_applicant_race_2, p.co_applicant_race_name_2),
+        ('race', p.co_applicant_race_3, p.co_applicant_race_name_3),
+        ('race', p.co_applicant_race_4, p.co_applicant_race_name_4),
+        ('race', p.co_applicant_race_5, p.co_applicant_race_name_5),
+        ('sex', p.applicant_sex, p.applicant_sex_name),
+        ('sex', p.co_applicant_sex, p.co_applicant_sex_name),
+        ('purchaser_type', p.purchaser_type, p.purchaser_type_name),
+        ('denial_reason', p.denial_reason_1, p.denial_reason_name_1),
+        ('denial_reason', p.denial_reason_2, p.denial_reason_name_2),
+        ('denial_reason', p.denial_reason_3, p.denial_reason_name_3),
+        ('hoepa_status', p.hoepa_status, p.hoepa_status_name),
+        ('lien_status', p.lien_status, p.lien_status_name),
+        ('edit_status', p.edit_status, p.edit_status_name)
+    ) AS v(lookup, code, name)
+    WHERE NULLIF(v.code, '') IS NOT NULL
+    GROUP BY v.lookup, v.code, COALESCE(v.name, '')
+),
+existing AS (
+SELECT 'agency', agency_code::text FROM Agency
+UNION ALL
+SELECT 'loan_type', loan_type::text FROM LoanType
+UNION ALL
+SELECT 'property_type', property_type::text FROM PropertyType
+UNION ALL
+SELECT 'loan_purpose', loan_purpose::text FROM LoanPurpose
+UNION ALL
+SELECT 'owner_occupancy', owner_occupancy::text FROM OwnerOccupancy
+UNION ALL
+SELECT 'preapproval', preapproval::text FROM Preapproval
+UNION ALL
+SELECT 'action_taken', action_taken::text FROM ActionTaken
+UNION ALL
+SELECT 'state', state_code FROM State
+UNION ALL
+SELECT 'county', county_code || '|' || state_code FROM County
+UNION ALL
+SELECT 'ethnicity', ethnicity_code::text FROM Ethnicity
+UNION ALL
+SELECT 'race', race_code::text FROM Race
+UNION ALL
+SELECT 'sex', sex_code::text FROM Sex
+UNION ALL
+SELECT 'purchaser_type', purchaser_type::text FROM PurchaserType
+UNION ALL
+SELECT 'denial_reason', denial_reason_code::text FROM DenialReason
+UNION ALL
+SELECT 'hoepa_status', hoepa_status::text FROM HOEPAStatus
+UNION ALL
+SELECT 'lien_status', lien_status::text FROM LienStatus
+UNION ALL
+SELECT 'edit_status', edit_status::text FROM EditStatus
+),
+ranked AS (
+    SELECT lookup, code, name, ROW_NUMBER() OVER (PARTITION BY lookup, code ORDER BY n DESC, name) AS rank
+    FROM pairs
+    WHERE name != ''
+)
+SELECT lookup, code, name, 'NAME_CONFLICT' AS problem
+FROM ranked
+WHERE rank > 1
+UNION ALL
+SELECT pairs.lookup, pairs.code, pairs.name, 'MISSING_NAME'
+FROM pairs
+LEFT JOIN existing e ON e.lookup = pairs.lookup AND e.code = pairs.code
+WHERE pairs.name = '' AND e.code IS NULL;
+
+-- respondents that have an agency, from this batch or earlier loads
+CREATE TEMPORARY TABLE temp_known_respondents AS
+SELECT DISTINCT as_of_year, respondent_id
+FROM Preliminary
+WHERE as_of_year ~ '^\d{1,9}$' AND respondent_id != '' AND agency_code ~ '^\d{1,4}$'
+UNION
+SELECT as_of_year::text, respondent_id
+FROM RespondentAgency;
+
+ANALYZE temp_lookup_problems;
+ANALYZE temp_known_respondents;
+
+-- one pass over the batch collecting every reason a row can't be loaded
+CREATE TEMPORARY TABLE temp_quarantine AS
+SELECT row_ctid, ID, reasons, row_data
+FROM (
+    SELECT
+        p.ctid AS row_ctid,
+        p.ID,
+        to_jsonb(p) AS row_data,
+        array_remove(ARRAY[
+        CASE WHEN p.ID IS NULL THEN 'MISSING_ID' END,
+        CASE WHEN p.ID IS NOT NULL AND ROW_NUMBER() OVER (PARTITION BY p.ID ORDER BY p.ctid) > 1 THEN 'DUPLICATE_ID' END,
+        CASE WHEN la.ID IS NOT NULL THEN 'ID_EXISTS' END,
+        CASE
+            WHEN p.as_of_year !~ '^\d{1,9}$' OR NULLIF(p.respondent_id, '') IS NULL THEN NULL
+            WHEN r.respondent_id IS NULL THEN 'NO_RESPONDENT'
+        END,
+        CASE
+            WHEN NULLIF(p.agency_code, '') IS NULL THEN NULL
+            WHEN p.agency_code !~ '^-?\d+$' THEN 'BAD_NUMBER:agency_code'
+            WHEN length(p.agency_code) > 6 OR p.agency_code::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:agency_code'
+        END,
+        CASE
+            WHEN NULLIF(p.loan_type, '') IS NULL THEN NULL
+            WHEN p.loan_type !~ '^-?\d+$' THEN 'BAD_NUMBER:loan_type'
+            WHEN length(p.loan_type) > 6 OR p.loan_type::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:loan_type'
+        END,
+        CASE
+            WHEN NULLIF(p.property_type, '') IS NULL THEN NULL
+            WHEN p.property_type !~ '^-?\d+$' THEN 'BAD_NUMBER:property_type'
+            WHEN length(p.property_type) > 6 OR p.property_type::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:property_type'
+        END,
+        CASE
+            WHEN NULLIF(p.loan_purpose, '') IS NULL THEN NULL
+            WHEN p.loan_purpose !~ '^-?\d+$' THEN 'BAD_NUMBER:loan_purpose'
+            WHEN length(p.loan_purpose) > 6 OR p.loan_purpose::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:loan_purpose'
+        END,
+        CASE
+            WHEN NULLIF(p.owner_occupancy, '') IS NULL THEN NULL
+            WHEN p.owner_occupancy !~ '^-?\d+$' THEN 'BAD_NUMBER:owner_occupancy'
+            WHEN length(p.owner_occupancy) > 6 OR p.owner_occupancy::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:owner_occupancy'
+        END,
+        CASE
+            WHEN NULLIF(p.preapproval, '') IS NULL THEN NULL
+            WHEN p.preapproval !~ '^-?\d+$' THEN 'BAD_NUMBER:preapproval'
+            WHEN length(p.preapproval) > 6 OR p.preapproval::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:preapproval'
+        END,
+        CASE
+            WHEN NULLIF(p.action_taken, '') IS NULL THEN NULL
+            WHEN p.action_taken !~ '^-?\d+$' THEN 'BAD_NUMBER:action_taken'
+            WHEN length(p.action_taken) > 6 OR p.action_taken::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:action_taken'
+        END,
+        CASE
+            WHEN NULLIF(p.applicant_ethnicity, '') IS NULL THEN NULL
+            WHEN p.applicant_ethnicity !~ '^-?\d+$' THEN 'BAD_NUMBER:applicant_ethnicity'
+            WHEN length(p.applicant_ethnicity) > 6 OR p.applicant_ethnicity::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:applicant_ethnicity'
+        END,
+        CASE
+            WHEN NULLIF(p.co_applicant_ethnicity, '') IS NULL THEN NULL
+            WHEN p.co_applicant_ethnicity !~ '^-?\d+$' THEN 'BAD_NUMBER:co_applicant_ethnicity'
+            WHEN length(p.co_applicant_ethnicity) > 6 OR p.co_applicant_ethnicity::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:co_applicant_ethnicity'
+        END,
+        CASE
+            WHEN NULLIF(p.applicant_race_1, '') IS NULL THEN NULL
+            WHEN p.applicant_race_1 !~ '^-?\d+$' THEN 'BAD_NUMBER:applicant_race_1'
+            WHEN length(p.applicant_race_1) > 6 OR p.applicant_race_1::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:applicant_race_1'
+        END,
+        CASE
+            WHEN NULLIF(p.applicant_race_2, '') IS NULL THEN NULL
+            WHEN p.applicant_race_2 !~ '^-?\d+$' THEN 'BAD_NUMBER:applicant_race_2'
+            WHEN length(p.applicant_race_2) > 6 OR p.applicant_race_2::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:applicant_race_2'
+        END,
+        CASE
+            WHEN NULLIF(p.applicant_race_3, '') IS NULL THEN NULL
+            WHEN p.applicant_race_3 !~ '^-?\d+$' THEN 'BAD_NUMBER:applicant_race_3'
+            WHEN length(p.applicant_race_3) > 6 OR p.applicant_race_3::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:applicant_race_3'
+        END,
+        CASE
+            WHEN NULLIF(p.applicant_race_4, '') IS NULL THEN NULL
+            WHEN p.applicant_race_4 !~ '^-?\d+$' THEN 'BAD_NUMBER:applicant_race_4'
+            WHEN length(p.applicant_race_4) > 6 OR p.applicant_race_4::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:applicant_race_4'
+        END,
+        CASE
+            WHEN NULLIF(p.applicant_race_5, '') IS NULL THEN NULL
+            WHEN p.applicant_race_5 !~ '^-?\d+$' THEN 'BAD_NUMBER:applicant_race_5'
+            WHEN length(p.applicant_race_5) > 6 OR p.applicant_race_5::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:applicant_race_5'
+        END,
+        CASE
+            WHEN NULLIF(p.co_applicant_race_1, '') IS NULL THEN NULL
+            WHEN p.co_applicant_race_1 !~ '^-?\d+$' THEN 'BAD_NUMBER:co_applicant_race_1'
+            WHEN length(p.co_applicant_race_1) > 6 OR p.co_applicant_race_1::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:co_applicant_race_1'
+        END,
+        CASE
+            WHEN NULLIF(p.co_applicant_race_2, '') IS NULL THEN NULL
+            WHEN p.co_applicant_race_2 !~ '^-?\d+$' THEN 'BAD_NUMBER:co_applicant_race_2'
+            WHEN length(p.co_applicant_race_2) > 6 OR p.co_applicant_race_2::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:co_applicant_race_2'
+        END,
+        CASE
+            WHEN NULLIF(p.co_applicant_race_3, '') IS NULL THEN NULL
+            WHEN p.co_applicant_race_3 !~ '^-?\d+$' THEN 'BAD_NUMBER:co_applicant_race_3'
+            WHEN length(p.co_applicant_race_3) > 6 OR p.co_applicant_race_3::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:co_applicant_race_3'
+        END,
+        CASE
+            WHEN NULLIF(p.co_applicant_race_4, '') IS NULL THEN NULL
+            WHEN p.co_applicant_race_4 !~ '^-?\d+$' THEN 'BAD_NUMBER:co_applicant_race_4'
+            WHEN length(p.co_applicant_race_4) > 6 OR p.co_applicant_race_4::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:co_applicant_race_4'
+        END,
+        CASE
+            WHEN NULLIF(p.co_applicant_race_5, '') IS NULL THEN NULL
+            WHEN p.co_applicant_race_5 !~ '^-?\d+$' THEN 'BAD_NUMBER:co_applicant_race_5'
+            WHEN length(p.co_applicant_race_5) > 6 OR p.co_applicant_race_5::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:co_applicant_race_5'
+        END,
+        CASE
+            WHEN NULLIF(p.applicant_sex, '') IS NULL THEN NULL
+            WHEN p.applicant_sex !~ '^-?\d+$' THEN 'BAD_NUMBER:applicant_sex'
+            WHEN length(p.applicant_sex) > 6 OR p.applicant_sex::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:applicant_sex'
+        END,
+        CASE
+            WHEN NULLIF(p.co_applicant_sex, '') IS NULL THEN NULL
+            WHEN p.co_applicant_sex !~ '^-?\d+$' THEN 'BAD_NUMBER:co_applicant_sex'
+            WHEN length(p.co_applicant_sex) > 6 OR p.co_applicant_sex::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:co_applicant_sex'
+        END,
+        CASE
+            WHEN NULLIF(p.purchaser_type, '') IS NULL THEN NULL
+            WHEN p.purchaser_type !~ '^-?\d+$' THEN 'BAD_NUMBER:purchaser_type'
+            WHEN length(p.purchaser_type) > 6 OR p.purchaser_type::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:purchaser_type'
+        END,
+        CASE
+            WHEN NULLIF(p.denial_reason_1, '') IS NULL THEN NULL
+            WHEN p.denial_reason_1 !~ '^-?\d+$' THEN 'BAD_NUMBER:denial_reason_1'
+            WHEN length(p.denial_reason_1) > 6 OR p.denial_reason_1::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:denial_reason_1'
+        END,
+        CASE
+            WHEN NULLIF(p.denial_reason_2, '') IS NULL THEN NULL
+            WHEN p.denial_reason_2 !~ '^-?\d+$' THEN 'BAD_NUMBER:denial_reason_2'
+            WHEN length(p.denial_reason_2) > 6 OR p.denial_reason_2::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:denial_reason_2'
+        END,
+        CASE
+            WHEN NULLIF(p.denial_reason_3, '') IS NULL THEN NULL
+            WHEN p.denial_reason_3 !~ '^-?\d+$' THEN 'BAD_NUMBER:denial_reason_3'
+            WHEN length(p.denial_reason_3) > 6 OR p.denial_reason_3::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:denial_reason_3'
+        END,
+        CASE
+            WHEN NULLIF(p.hoepa_status, '') IS NULL THEN NULL
+            WHEN p.hoepa_status !~ '^-?\d+$' THEN 'BAD_NUMBER:hoepa_status'
+            WHEN length(p.hoepa_status) > 6 OR p.hoepa_status::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:hoepa_status'
+        END,
+        CASE
+            WHEN NULLIF(p.lien_status, '') IS NULL THEN NULL
+            WHEN p.lien_status !~ '^-?\d+$' THEN 'BAD_NUMBER:lien_status'
+            WHEN length(p.lien_status) > 6 OR p.lien_status::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:lien_status'
+        END,
+        CASE
+            WHEN NULLIF(p.edit_status, '') IS NULL THEN NULL
+            WHEN p.edit_status !~ '^-?\d+$' THEN 'BAD_NUMBER:edit_status'
+            WHEN length(p.edit_status) > 6 OR p.edit_status::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:edit_status'
+        END,
+        CASE
+            WHEN NULLIF(p.application_date_indicator, '') IS NULL THEN NULL
+            WHEN p.application_date_indicator !~ '^-?\d+$' THEN 'BAD_NUMBER:application_date_indicator'
+            WHEN length(p.application_date_indicator) > 6 OR p.application_date_indicator::NUMERIC NOT BETWEEN -32768 AND 32767 THEN 'OUT_OF_RANGE:application_date_indicator'
+        END,
+        CASE
+            WHEN NULLIF(p.as_of_year, '') IS NULL THEN NULL
+            WHEN p.as_of_year !~ '^-?\d+$' THEN 'BAD_NUMBER:as_of_year'
+            WHEN length(p.as_of_year) > 11 OR p.as_of_year::NUMERIC NOT BETWEEN -2147483648 AND 2147483647 THEN 'OUT_OF_RANGE:as_of_year'
+        END,
+        CASE
+            WHEN NULLIF(p.population, '') IS NULL THEN NULL
+            WHEN p.population !~ '^-?\d+$' THEN 'BAD_NUMBER:population'
+            WHEN length(p.population) > 11 OR p.population::NUMERIC NOT BETWEEN -2147483648 AND 2147483647 THEN 'OUT_OF_RANGE:population'
+        END,
+        CASE
+            WHEN NULLIF(p.hud_median_family_income, '') IS NULL THEN NULL
+            WHEN p.hud_median_family_income !~ '^-?\d+$' THEN 'BAD_NUMBER:hud_median_family_income'
+            WHEN length(p.hud_median_family_income) > 11 OR p.hud_median_family_income::NUMERIC NOT BETWEEN -2147483648 AND 2147483647 THEN 'OUT_OF_RANGE:hud_median_family_income'
+        END,
+        CASE
+            WHEN NULLIF(p.number_of_owner_occupied_units, '') IS NULL THEN NULL
+            WHEN p.number_of_owner_occupied_units !~ '^-?\d+$' THEN 'BAD_NUMBER:number_of_owner_occupied_units'
+            WHEN length(p.number_of_owner_occupied_units) > 11 OR p.number_of_owner_occupied_units::NUMERIC NOT BETWEEN -2147483648 AND 2147483647 THEN 'OUT_OF_RANGE:number_of_owner_occupied_units'
+        END,
+        CASE
+            WHEN NULLIF(p.number_of_1_to_4_family_units, '') IS NULL THEN NULL
+            WHEN p.number_of_1_to_4_family_units !~ '^-?\d+$' THEN 'BAD_NUMBER:number_of_1_to_4_family_units'
+            WHEN length(p.number_of_1_to_4_family_units) > 11 OR p.number_of_1_to_4_family_units::NUMERIC NOT BETWEEN -2147483648 AND 2147483647 THEN 'OUT_OF_RANGE:number_of_1_to_4_family_units'
+        END,
+        CASE WHEN p.loan_amount_000s !~ '^(-?(\d+\.?\d*|\.\d+))?$' THEN 'BAD_NUMBER:loan_amount_000s' END,
+        CASE WHEN p.applicant_income_000s !~ '^(-?(\d+\.?\d*|\.\d+))?$' THEN 'BAD_NUMBER:applicant_income_000s' END,
+        CASE WHEN p.minority_population !~ '^(-?(\d+\.?\d*|\.\d+))?$' THEN 'BAD_NUMBER:minority_population' END,
+        CASE WHEN p.tract_to_msamd_income !~ '^(-?(\d+\.?\d*|\.\d+))?$' THEN 'BAD_NUMBER:tract_to_msamd_income' END,
+        CASE WHEN NULLIF(p.as_of_year, '') IS NULL THEN 'NOT_NULL:as_of_year' END,
+        CASE WHEN NULLIF(p.respondent_id, '') IS NULL THEN 'NOT_NULL:respondent_id' END,
+        CASE WHEN NULLIF(p.loan_type, '') IS NULL THEN 'NOT_NULL:loan_type' END,
+        CASE WHEN NULLIF(p.property_type, '') IS NULL THEN 'NOT_NULL:property_type' END,
+        CASE WHEN NULLIF(p.loan_purpose, '') IS NULL THEN 'NOT_NULL:loan_purpose' END,
+        CASE WHEN NULLIF(p.owner_occupancy, '') IS NULL THEN 'NOT_NULL:owner_occupancy' END,
+        CASE WHEN NULLIF(p.preapproval, '') IS NULL THEN 'NOT_NULL:preapproval' END,
+        CASE WHEN NULLIF(p.action_taken, '') IS NULL THEN 'NOT_NULL:action_taken' END,
+        CASE WHEN NULLIF(p.applicant_ethnicity, '') IS NULL THEN 'NOT_NULL:applicant_ethnicity' END,
+        CASE WHEN NULLIF(p.applicant_sex, '') IS NULL THEN 'NOT_NULL:applicant_sex' END,
+        CASE WHEN length(p.respondent_id) > 10 THEN 'TOO_LONG:respondent_id' END,
+        CASE WHEN length(p.msamd) > 5 THEN 'TOO_LONG:msamd' END,
+        CASE WHEN length(p.state_code) > 2 THEN 'TOO_LONG:state_code' END,
+        CASE WHEN length(p.county_code) > 3 THEN 'TOO_LONG:county_code' END,
+        CASE WHEN length(p.census_tract_number) > 8 THEN 'TOO_LONG:census_tract_number' END,
+        CASE WHEN length(p.rate_spread) > 10 THEN 'TOO_LONG:rate_spread' END,
+        CASE WHEN length(p.sequence_number) > 20 THEN 'TOO_LONG:sequence_number' END,
+        CASE WHEN length(p.agency_abbr) > 20 THEN 'TOO_LONG:agency_abbr' END,
+        CASE WHEN length(p.state_abbr) > 2 THEN 'TOO_LONG:state_abbr' END,
+        CASE WHEN length(p.agency_name) > 100 THEN 'TOO_LONG:agency_name' END,
+        CASE WHEN length(p.loan_type_name) > 100 THEN 'TOO_LONG:loan_type_name' END,
+        CASE WHEN length(p.property_type_name) > 100 THEN 'TOO_LONG:property_type_name' END,
+        CASE WHEN length(p.loan_purpose_name) > 100 THEN 'TOO_LONG:loan_purpose_name' END,
+        CASE WHEN length(p.owner_occupancy_name) > 100 THEN 'TOO_LONG:owner_occupancy_name' END,
+        CASE WHEN length(p.preapproval_name) > 100 THEN 'TOO_LONG:preapproval_name' END,
+        CASE WHEN length(p.action_taken_name) > 100 THEN 'TOO_LONG:action_taken_name' END,
+        CASE WHEN length(p.msamd_name) > 100 THEN 'TOO_LONG:msamd_name' END,
+        CASE WHEN length(p.state_name) > 100 THEN 'TOO_LONG:state_name' END,
+        CASE WHEN length(p.county_name) > 100 THEN 'TOO_LONG:county_name' END,
+        CASE WHEN length(p.applicant_ethnicity_name) > 100 THEN 'TOO_LONG:applicant_ethnicity_name' END,
+        CASE WHEN length(p.co_applicant_ethnicity_name) > 100 THEN 'TOO_LONG:co_applicant_ethnicity_name' END,
+        CASE WHEN length(p.applicant_race_name_1) > 100 THEN 'TOO_LONG:applicant_race_name_1' END,
+        CASE WHEN length(p.applicant_race_name_2) > 100 THEN 'TOO_LONG:applicant_race_name_2' END,
+        CASE WHEN length(p.applicant_race_name_3) > 100 THEN 'TOO_LONG:applicant_race_name_3' END,
+        CASE WHEN length(p.applicant_race_name_4) > 100 THEN 'TOO_LONG:applicant_race_name_4' END,
+        CASE WHEN length(p.applicant_race_name_5) > 100 THEN 'TOO_LONG:applicant_race_name_5' END,
+        CASE WHEN length(p.co_applicant_race_name_1) > 100 THEN 'TOO_LONG:co_applicant_race_name_1' END,
+        CASE WHEN length(p.co_applicant_race_name_2) > 100 THEN 'TOO_LONG:co_applicant_race_name_2' END,
+        CASE WHEN length(p.co_applicant_race_name_3) > 100 THEN 'TOO_LONG:co_applicant_race_name_3' END,
+        CASE WHEN length(p.co_applicant_race_name_4) > 100 THEN 'TOO_LONG:co_applicant_race_name_4' END,
+        CASE WHEN length(p.co_applicant_race_name_5) > 100 THEN 'TOO_LONG:co_applicant_race_name_5' END,
+        CASE WHEN length(p.applicant_sex_name) > 100 THEN 'TOO_LONG:applicant_sex_name' END,
+        CASE WHEN length(p.co_applicant_sex_name) > 100 THEN 'TOO_LONG:co_applicant_sex_name' END,
+        CASE WHEN length(p.purchaser_type_name) > 100 THEN 'TOO_LONG:purchaser_type_name' END,
+        CASE WHEN length(p.denial_reason_name_1) > 100 THEN 'TOO_LONG:denial_reason_name_1' END,
+        CASE WHEN length(p.denial_reason_name_2) > 100 THEN 'TOO_LONG:denial_reason_name_2' END,
+        CASE WHEN length(p.denial_reason_name_3) > 100 THEN 'TOO_LONG:denial_reason_name_3' END,
+        CASE WHEN length(p.hoepa_status_name) > 100 THEN 'TOO_LONG:hoepa_status_name' END,
+        CASE WHEN length(p.lien_status_name) > 100 THEN 'TOO_LONG:lien_status_name' END,
+        CASE WHEN length(p.edit_status_name) > 100 THEN 'TOO_LONG:edit_status_name' END
+
+        ], NULL)
+        || ARRAY(
+            SELECT lp.problem || ':' || lp.lookup
+            FROM (VALUES
+                ('agency', p.agency_code, NULLIF(p.agency_name, '') || '|' || NULLIF(p.agency_abbr, '')),
+                ('loan_type', p.loan_type, p.loan_type_name),
+                ('property_type', p.property_type, p.property_type_name),
+                ('loan_purpose', p.loan_purpose, p.loan_purpose_name),
+                ('owner_occupancy', p.owner_occupancy, p.owner_occupancy_name),
+                ('preapproval', p.preapproval, p.preapproval_name),
+                ('action_taken', p.action_taken, p.action_taken_name),
+                ('state', p.state_code, NULLIF(p.state_name, '') || '|' || NULLIF(p.state_abbr, '')),
+                ('county', NULLIF(p.county_code, '') || '|' || NULLIF(p.state_code, ''), p.county_name),
+                ('ethnicity', p.applicant_ethnicity, p.applicant_ethnicity_name),
+                ('ethnicity', p.co_applicant_ethnicity, p.co_applicant_ethnicity_name),
+                ('race', p.applicant_race_1, p.applicant_race_name_1),
+                ('race', p.applicant_race_2, p.applicant_race_name_2),
+                ('race', p.applicant_race_3, p.applicant_race_name_3),
+                ('race', p.applicant_race_4, p.applicant_race_name_4),
+                ('race', p.applicant_race_5, p.applicant_race_name_5),
+                ('race', p.co_applicant_race_1, p.co_applicant_race_name_1),
+                ('race', p.co_applicant_race_2, p.co_applicant_race_name_2),
+                ('race', p.co_applicant_race_3, p.co_applicant_race_name_3),
+                ('race', p.co_applicant_race_4, p.co_applicant_race_name_4),
+                ('race', p.co_applicant_race_5, p.co_applicant_race_name_5),
+                ('sex', p.applicant_sex, p.applicant_sex_name),
+                ('sex', p.co_applicant_sex, p.co_applicant_sex_name),
+                ('purchaser_type', p.purchaser_type, p.purchaser_type_name),
+                ('denial_reason', p.denial_reason_1, p.denial_reason_name_1),
+                ('denial_reason', p.denial_reason_2, p.denial_reason_name_2),
+                ('denial_reason', p.denial_reason_3, p.denial_reason_name_3),
+                ('hoepa_status', p.hoepa_status, p.hoepa_status_name),
+                ('lien_status', p.lien_status, p.lien_status_name),
+                ('edit_status', p.edit_status, p.edit_status_name)
+            ) AS v(lookup, code, name)
+            JOIN temp_lookup_problems lp
+              ON lp.lookup = v.lookup AND lp.code = v.code AND lp.name = COALESCE(v.name, '')
+        ) AS reasons
+    FROM Preliminary p
+    LEFT JOIN LoanApplication la ON la.ID = p.ID
+    LEFT JOIN temp_known_respondents r ON r.as_of_year = p.as_of_year AND r.respondent_id = p.respondent_id
+) AS checked
+WHERE cardinality(reasons) > 0;
+
+-- keep the bad rows with their reasons and take them out of the load,
+-- replacing whatever an earlier run of the same batch quarantined
+DELETE FROM Quarantine
+WHERE batch_checksum = NULLIF(current_setting('bulk_load.batch_checksum', true), '');
+
+INSERT INTO Quarantine (ID, reasons, row_data, batch_checksum)
+SELECT ID, reasons, row_data, NULLIF(current_setting('bulk_load.batch_checksum', true), '')
+FROM temp_quarantine;
+
+DELETE FROM Preliminary p
+USING temp_quarantine q
+WHERE p.ctid = q.row_ctid;
+
+-- quarantined rows by reason (temp_quarantine lasts until the session ends)
+SELECT reason, COUNT(*) AS row_count
+FROM temp_quarantine, unnest(reasons) AS reason
+GROUP BY reason
+ORDER BY row_count DESC, reason;
+
+DROP TABLE temp_lookup_problems;
+DROP TABLE temp_known_respondents;
@@ -0,0 +1,302 @@
+r'''
+benchmark.py
+
+In-process benchmark of the NL database pipeline.
+
+Imports database_llm directly and keeps both models resident, so models stay
+warm between questions (--single-model loads one at a time on GPUs that can't
+hold both). Queries always run against the database unless --result-cache is
+given, so repeats measure execution rather than cache lookups. Runs each question of a question set one or more times, and writes
+a JSON report with per-stage timings (from the tracing spans), correction
+attempts and success. A report can be compared against a stored baseline to
+flag latency regressions; reports run with different settings are not compared.
+
+Usage:
+    KMP_DUPLICATE_LIB_OK=TRUE python3 benchmark.py
+    python3 benchmark.py --questions questions.jsonl --repeat 3
+    python3 benchmark.py --single-model
+    python3 benchmark.py --repeat 3 --result-cache
+    python3 benchmark.py --compare benchmark_results/baseline.json
+    python3 benchmark.py --backend local --local-db local_hmda.sqlite
+    python3 benchmark.py --backend local --llm-backend replay --token-latency 0.02
+    python3 benchmark.py --report new.json --compare baseline.json --no-run
+
+Question sets are either test_querys.txt style files or JSONL with one
+{"question": "..."} object per line.
+'''
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+
+import tracing
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_QUESTIONS = os.path.join(SCRIPT_DIR, "test_querys.txt")
+RESULTS_DIR = os.path.join(SCRIPT_DIR, "benchmark_results")
+
+# a stage is a regression if its p50 grows by more than this fraction and this many ms
+REGRESSION_THRESHOLD = 0.20
+REGRESSION_MIN_MS = 50.0
+
+# report fields that change what the timings measure; reports only compare when they match
+RUN_SETTINGS = ("backend", "llm_backend", "max_loaded_models", "result_cache")
+
+
+def load_questions(path):
+    '''
+    read a question set from test_querys.txt format or JSONL
+    '''
+    with open(path, 'r') as f:
+        content = f.read()
+
+    if path.endswith(".jsonl"):
+        questions = []
+        for line in content.splitlines():
+            line = line.strip()
+            if line:
+                questions.append(json.loads(line)["question"])
+        return questions
+
+    # numbered description followed by the quoted question
+    pattern = r'\d+\.\s+.*?:\s+"(.*?)"'
+    return [match.strip() for match in re.findall(pattern, content, re.DOTALL)]
+
+
+def stage_totals(trace):
+    '''
+    milliseconds per stage in a finished trace, summing repeated spans
+    '''
+    totals = defaultdict(float)
+    if trace is None:
+        return totals
+    for s in trace.spans:
+        totals[s["stage"]] += s["duration_ms"]
+    return totals
+
+
+def run_benchmark(questions, repeat, backend, verbose=False):
+    '''
+    answer every question `repeat` times in this process and collect the runs
+    '''
+    # imported here so --no-run comparisons don't need the model stack installed
+    import database_llm
+    import llm_manager
+
+    context = llm_manager.load_schema()
+    catalog = database_llm.load_value_catalog(backend)
+    results = []
+
+    for i, question in enumerate(questions, 1):
+        runs = []
+        for rep in range(repeat):
+            print(f"[{i}/{len(questions)}] run {rep + 1}/{repeat}: {question}")
+            output = io.StringIO()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(sys.stdout if verbose else output):
+                try:
+                    outcome = database_llm.answer_question(question, context, backend, catalog=catalog)
+                except Exception as e:
+                    outcome = {"success": False, "status": "error", "attempts": 0,
+                               "final_query": None, "trace": None, "error": str(e)}
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            runs.append({
+                "success": outcome["success"],
+                "status": outcome["status"],
+                "attempts": outcome["attempts"],
+                "sql_source": outcome.get("sql_source"),
+                "final_query": outcome.get("final_query"),
+                "duration_ms": round(elapsed_ms, 3),
+                "stages": {k: round(v, 3) for k, v in stage_totals(outcome["trace"]).items()},
+            })
+
+        durations = [r["duration_ms"] for r in runs]
+        results.append({
+            "question": question,
+            "runs": runs,
+            "success_rate": sum(r["success"] for r in runs) / len(runs),
+            "p50_ms": tracing.percentile(durations, 50),
+            "p95_ms": tracing.percentile(durations, 95),
+        })
+
+    return results
+
+
+def summarize_stages(results):
+    '''
+    p50/p95 per stage over every run of every question
+    '''
+    per_stage = defaultdict(list)
+    for question in results:
+        for run in question["runs"]:
+            per_stage["question"].append(run["duration_ms"])
+            for stage, ms in run["stages"].items():
+                per_stage[stage].append(ms)
+
+    return {
+        stage: {
+            "count": len(values),
+            "p50_ms": tracing.percentile(values, 50),
+            "p95_ms": tracing.percentile(values, 95),
+        }
+        for stage, values in sorted(per_stage.items())
+    }
+
+
+def settings_mismatch(current, baseline):
+    '''
+    {setting: (baseline, current)} for every run setting the two reports disagree on
+    '''
+    return {
+        key: (baseline.get(key), current.get(key))
+        for key in RUN_SETTINGS
+        if baseline.get(key) != current.get(key)
+    }
+
+
+def compare_reports(current, baseline, threshold=REGRESSION_THRESHOLD, min_ms=REGRESSION_MIN_MS):
+    '''
+    list stages and questions whose p50 regressed against the baseline report
+    '''
+    regressions = []
+
+    def check(kind, name, new, old):
+        if old is None or new is None:
+            return
+        if new > old * (1 + threshold) and new - old > min_ms:
+            regressions.append({
+                "kind": kind,
+                "name": name,
+                "baseline_p50_ms": old,
+                "current_p50_ms": new,
+                "change": (new - old) / old if old else None,
+            })
+
+    for stage, row in current["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        check("stage", stage, row["p50_ms"], old["p50_ms"] if old else None)
+
+    baseline_questions = {q["question"]: q for q in baseline.get("questions", [])}
+    for question in current["questions"]:
+        old = baseline_questions.get(question["question"])
+        check("question", question["question"], question["p50_ms"], old["p50_ms"] if old else None)
+        if old and question["success_rate"] < old["success_rate"]:
+            regressions.append({
+                "kind": "success_rate",
+                "name": question["question"],
+                "baseline": old["success_rate"],
+                "current": question["success_rate"],
+            })
+
+    return regressions
+
+
+def print_summary(report):
+    print(f"\n{'stage':<24}{'count':>8}{'p50 ms':>12}{'p95 ms':>12}")
+    for stage, row in report["stages"].items():
+        print(f"{stage:<24}{row['count']:>8}{row['p50_ms']:>12.1f}{row['p95_ms']:>12.1f}")
+
+    total = len(report["questions"])
+    succeeded = sum(q["success_rate"] == 1 for q in report["questions"])
+    print(f"\n{succeeded}/{total} questions succeeded on every run")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the NL database pipeline in-process.")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="test_querys.txt style file or JSONL question set")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per question")
+    parser.add_argument("--report", help="where to write the JSON report (default: benchmark_results/<timestamp>.json)")
+    parser.add_argument("--compare", help="baseline report to check for latency regressions")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="allowed p50 growth fraction")
+    parser.add_argument("--no-run", action="store_true", help="only compare an existing --report against --compare")
+    parser.add_argument("--backend", choices=["ssh", "local"], help="execution backend (default: EXECUTION_BACKEND or ssh)")
+    parser.add_argument("--local-db", help="local SQLite database for --backend local")
+    parser.add_argument("--llm-backend", choices=["llama", "record", "replay"], help="LLM backend (default: LLM_BACKEND or llama)")
+    parser.add_argument("--token-latency", type=float, help="simulated seconds per generated token when replaying")
+    parser.add_argument("--single-model", action="store_true",
+                        help="load one model at a time instead of keeping both resident (for GPUs that can't hold both)")
+    parser.add_argument("--result-cache", action="store_true",
+                        help="answer repeated queries from the result cache instead of running them every time")
+    parser.add_argument("--verbose", action="store_true", help="show pipeline output")
+    args = parser.parse_args()
+
+    if args.no_run:
+        if not (args.report and args.compare):
+            parser.error("--no-run needs both --report and --compare")
+        with open(args.report, 'r') as f:
+            report = json.load(f)
+    else:
+        import database_llm
+        import llm_manager
+
+        # warm models are the point of benchmarking in-process
+        llm_manager.MAX_LOADED_MODELS = 1 if args.single_model else 2
+        if args.llm_backend:
+            llm_manager.LLM_BACKEND = args.llm_backend
+        if args.token_latency is not None:
+            llm_manager.REPLAY_TOKEN_LATENCY = args.token_latency
+
+        questions = load_questions(args.questions)
+        if not questions:
+            print(f"No questions found in {args.questions}")
+            sys.exit(1)
+
+        if args.local_db:
+            database_llm.local_db_path = args.local_db
+        database_llm.use_result_cache = args.result_cache
+        backend = database_llm.create_backend(args.backend)
+        try:
+            results = run_benchmark(questions, args.repeat, backend, args.verbose)
+        finally:
+            backend.close()
+
+        report = {
+            "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "questions_file": args.questions,
+            "repeat": args.repeat,
+            "backend": backend.name,
+            "llm_backend": llm_manager.LLM_BACKEND,
+            "max_loaded_models": llm_manager.MAX_LOADED_MODELS,
+            "result_cache": args.result_cache,
+            "stages": summarize_stages(results),
+            "questions": results,
+        }
+
+        report_path = args.report or os.path.join(RESULTS_DIR, time.strftime('%Y%m%d_%H%M%S') + ".json")
+        os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport saved to {report_path}")
+
+    print_summary(report)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        mismatch = settings_mismatch(report, baseline)
+        if mismatch:
+            print(f"\nNot comparing against {args.compare}, the reports were run with different settings:")
+            for key, (old, new) in mismatch.items():
+                print(f"  {key}: {old} -> {new}")
+            sys.exit(2)
+        regressions = compare_reports(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.compare}:")
+            for r in regressions:
+                if r["kind"] == "success_rate":
+                    print(f"  success rate  {r['name']}: {r['baseline']:.2f} -> {r['current']:.2f}")
+                else:
+                    print(f"  {r['kind']:<13} {r['name']}: {r['baseline_p50_ms']:.1f}ms -> {r['current_p50_ms']:.1f}ms (+{r['change']:.0%})")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+r'''
+cancellation.py
+
+Cooperative cancellation and per-stage deadlines for the question pipeline.
+
+A stage runs inside `with deadline("execute"):`. Long running work polls
+`check()` (or `should_stop()` where raising isn't possible, e.g. between
+generated tokens) and stops once the user pressed Ctrl-C (`cancel()`) or the
+stage ran past its deadline. `install_sigint_handler()` makes Ctrl-C call
+`cancel()` before raising KeyboardInterrupt, so work that swallows the
+interrupt, like a SQLite progress callback, still sees it. Remote queries are stopped by ssh_handler, which
+signals ilab_script and falls back to pg_cancel_backend on its backend PID.
+
+Environment Variables:
+    DEADLINE_BREAKDOWN, DEADLINE_SQL, DEADLINE_CORRECTION, DEADLINE_EXECUTE:
+        seconds allowed per stage (defaults in STAGE_DEADLINES)
+'''
+
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+
+# seconds each pipeline stage may take before it is abandoned
+STAGE_DEADLINES = {
+    "breakdown": 180.0,
+    "sql": 180.0,
+    "correction": 180.0,
+    "execute": 300.0,
+}
+
+for _stage in STAGE_DEADLINES:
+    _value = os.getenv(f"DEADLINE_{_stage.upper()}")
+    if _value:
+        STAGE_DEADLINES[_stage] = float(_value)
+
+_cancel_event = threading.Event()
+_cancel_reason = None
+
+# (stage, monotonic expiry) of the innermost active deadline
+_deadlines = []
+
+
+class Cancelled(Exception):
+    '''
+    raised when work is abandoned because of Ctrl-C or a stage deadline
+    '''
+
+    def __init__(self, reason, stage=None):
+        self.reason = reason
+        self.stage = stage
+        message = f"{stage} stage {reason}" if stage else reason
+        super().__init__(message)
+
+
+def cancel(reason="cancelled"):
+    '''
+    ask all running work to stop
+    '''
+    global _cancel_reason
+    _cancel_reason = reason
+    _cancel_event.set()
+
+
+def _handle_sigint(signum, frame):
+    cancel("cancelled by user")
+    signal.default_int_handler(signum, frame)
+
+
+def install_sigint_handler():
+    '''
+    make Ctrl-C cancel running work as well as raise KeyboardInterrupt (main thread only)
+    '''
+    signal.signal(signal.SIGINT, _handle_sigint)
+
+
+def reset():
+    '''
+    clear a previous cancellation before starting the next question
+    '''
+    global _cancel_reason
+    _cancel_reason = None
+    _cancel_event.clear()
+    _deadlines.clear()
+
+
+@contextmanager
+def deadline(stage, seconds=None):
+    '''
+    run a block under the stage's deadline; nested deadlines can only shorten it
+    '''
+    seconds = STAGE_DEADLINES.get(stage) if seconds is None else seconds
+    expires = time.monotonic() + seconds if seconds else float("inf")
+    if _deadlines:
+        expires = min(expires, _deadlines[-1][1])
+
+    _deadlines.append((stage, expires))
+    try:
+        yield
+    finally:
+        _deadlines.pop()
+
+
+def remaining():
+    '''
+    seconds left before the current deadline, or None without one
+    '''
+    if not _deadlines or _deadlines[-1][1] == float("inf"):
+        return None
+    return max(0.0, _deadlines[-1][1] - time.monotonic())
+
+
+def should_stop():
+    return _cancel_event.is_set() or remaining() == 0.0
+
+
+def check():
+    '''
+    raise Cancelled if the user cancelled or the current stage is past its deadline
+    '''
+    if _cancel_event.is_set():
+        raise Cancelled(_cancel_reason or "cancelled")
+    if remaining() == 0.0:
+        raise Cancelled("timed out", _deadlines[-1][0])
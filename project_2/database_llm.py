@@ -12,13 +12,19 @@ $env:KMP_DUPLICATE_LIB_OK="TRUE"; python project_2\database_llm.py
 macOS/Linux: KMP_DUPLICATE_LIB_OK=TRUE python project_2/database_llm.py
 '''
 
-import time
 import os
 import sys
 
+import cancellation
+import execution_backend
 import llm_manager
 import query_extraction
+import ra_compiler
+import result_cache
 import ssh_handler
+import structured_log
+import tracing
+import value_catalog
 from error_extraction import extract_error_from_result
 
 # ilab configuration
@@ -30,90 +36,111 @@ wd_path = "~/cs336/project_2"
 # set to False to use command-line args instead of stdin
 use_stdin = True  
 
+# parallel database connections ilab_script uses for batched queries
+batch_workers = int(os.getenv("BATCH_WORKERS", "1"))
+
 # Maximum number of correction attempts
 MAX_CORRECTION_ATTEMPTS = 3
 
-def main():
-    # get ssh credentials once at the beginning
-    try:
-        user, pwd = ssh_handler.get_ssh_credentials()
-        
-        # test the connection to make sure credentials work
-        print(f"Testing connection to {hostname}...")
-        if use_stdin:
-            test_result = ssh_handler.execute_query_stdin(hostname, user, pwd, "SELECT 1", wd_path, user, pwd)
+# where generated SQL runs: "ssh" (iLab) or "local" (SQLite copy built by local_engine.py)
+backend_kind = os.getenv("EXECUTION_BACKEND", "ssh")
+local_db_path = os.getenv("LOCAL_DB_PATH", execution_backend.local_engine.DEFAULT_DB_PATH)
 
-        else:
-            test_result = ssh_handler.execute_query(hostname, user, pwd, "SELECT 1", wd_path, user, pwd)
-            
-        if test_result is None:
-            print("Failed to connect to iLab. Please check your credentials and try again.")
-            sys.exit(1)
-            
-        print(f"Connection to {hostname} successful!")
-    except KeyboardInterrupt:
-        print("\nOperation cancelled by user.")
-        sys.exit(0)
-    except Exception as e:
-        print(f"Error connecting to iLab: {e}")
-        sys.exit(1)
+# answer repeated queries from memory until one of their tables changes
+use_result_cache = os.getenv("RESULT_CACHE", "1") != "0"
 
-    # load the database schema
-    context = llm_manager.load_schema()
+# put stored codes/names matching the question into the SQL prompt
+use_value_catalog = os.getenv("VALUE_CATALOG", "1") != "0"
 
-    print("\nYou can now ask questions about the database.")
-    print("Type 'exit' to quit the program.\n")
+# compile parseable relational algebra to SQL directly instead of asking sqlcoder
+use_ra_compiler = os.getenv("RA_COMPILER", "1") != "0"
 
-    # create logs directory if it doesn't exist
-    log_dir = os.path.join(os.path.dirname(__file__), 'logs')
-    os.makedirs(log_dir, exist_ok=True)
+# serve per-stage metrics in Prometheus format on this port if set
+metrics_port = os.getenv("METRICS_PORT")
 
-    # main loop
-    while True:
-        timestamp = time.strftime('%I:%M:%S %p %m/%d/%y', time.localtime(time.time()))
+def create_backend(kind=None):
+    '''
+    build the execution backend, asking for iLab credentials only when going over ssh
+    '''
+    kind = kind or backend_kind
+    if kind == "local":
+        backend = execution_backend.create_backend("local", db_path=local_db_path)
+    else:
+        user, pwd = ssh_handler.get_ssh_credentials()
+        backend = execution_backend.create_backend("ssh", host=hostname, user=user, pwd=pwd, wd_path=wd_path, use_stdin=use_stdin,
+                                                  batch_workers=batch_workers)
 
-        try:
-            question = input("Enter your question: ")
+    if use_result_cache:
+        backend = result_cache.CachedBackend(backend)
+    return backend
 
-            if question.lower() == "exit":
-                print("Exiting...")
-                break
+def load_value_catalog(backend):
+    '''
+    the cached value catalog, or None when value hints are turned off
+    '''
+    if not use_value_catalog:
+        return None
+    return value_catalog.load_catalog(backend)
 
-            print("\nProcessing your question...")
+def answer_question(question, context, backend, logger=None, schema_id=None, catalog=None):
+    '''
+    run one question through breakdown, SQL generation and the correction loop
 
-            # --- Step 1: Generate Query Breakdown ---
-            print("Generating query plan...")
+    Returns a dict with the outcome (success, status, query, final_query,
+    result, attempts) and the finished trace.
+    '''
+    outcome = {
+        "question": question,
+        "success": False,
+        "status": "failed",
+        "query": None,
+        "final_query": None,
+        "result": None,
+        "attempts": 0,
+        "sql_source": None,
+        "trace": None,
+    }
+
+    trace_id = tracing.start_trace(question).trace_id
+    cancellation.reset()
+
+    try:
+        # --- Step 1: Generate Query Breakdown ---
+        print("Generating query plan...")
+        with tracing.span("pipeline.breakdown"), cancellation.deadline("breakdown"):
             breakdown_prompt = llm_manager.build_breakdown_prompt(context, question)
             breakdown_llm = llm_manager.get_breakdown_llm()
             breakdown = llm_manager.query_llm(breakdown_llm, breakdown_prompt)
-            print(f"\nRelational Algebra Expression:\n{breakdown}\n")
-
-            # Log breakdown generation
-            with open(os.path.join(log_dir, 'llm_output.txt'), 'a') as f:
-                f.write("\n\n==================== LOG ENTRY START ====================\n")
-                f.write(f"Timestamp: {timestamp}\n")
-                f.write(f"Question: {question}\n\n")
-                f.write("--- Breakdown Prompt ---\n")
-                f.write(f"{breakdown_prompt}\n\n")
-                f.write("--- LLM Breakdown Response ---\n")
-                f.write(f"{breakdown}\n")
-                # Separator before SQL generation log
-                f.write("--------------------------------------------------------\n\n")
-
-            # --- Step 2: Generate SQL from Breakdown ---
+        print(f"\nRelational Algebra Expression:\n{breakdown}\n")
+
+        # Log breakdown generation
+        if logger:
+            logger.log("breakdown", trace_id=trace_id, template="breakdown", schema=schema_id,
+                       params={"question": question}, response=breakdown)
+
+        # --- Step 2: Generate SQL from Breakdown ---
+        # a breakdown that parses is compiled directly; sqlcoder only handles the rest
+        query = ra_compiler.try_compile(breakdown, context) if use_ra_compiler else None
+        if query is not None:
+            print(f"\nCompiled SQL Query (sqlcoder skipped):\n{query}\n")
+            outcome["sql_source"] = "ra_compiler"
+            if logger:
+                logger.log("sql", trace_id=trace_id, source="ra_compiler", params={"question": question, "breakdown": breakdown},
+                           response=query)
+        else:
             print("Generating SQL query from plan...")
-            sql_prompt = llm_manager.build_sql_from_breakdown_prompt(breakdown, context, question)
-            sql_llm = llm_manager.get_sql_llm()
-            response = llm_manager.query_llm(sql_llm, sql_prompt)
-
-            # Log SQL generation response (append to the same log entry)
-            with open(os.path.join(log_dir, 'llm_output.txt'), 'a') as f:
-                f.write("--- SQL Generation Prompt ---\n")
-                f.write(f"{sql_prompt}\n\n")
-                f.write("--- LLM SQL Response Start ---\n")
-                f.write(f"{response}\n")
-                f.write("--- LLM SQL Response End ---\n\n")
-                f.write("==================== LOG ENTRY END ======================\n\n")
+            with tracing.span("pipeline.sql"), cancellation.deadline("sql"):
+                value_hints = value_catalog.hints_for(catalog, question)
+                sql_prompt = llm_manager.build_sql_from_breakdown_prompt(breakdown, context, question, value_hints)
+                sql_llm = llm_manager.get_sql_llm()
+                # kept as a session so correction rounds only send the error
+                response = llm_manager.query_llm(sql_llm, sql_prompt, session_id=trace_id)
+
+            # Log SQL generation response
+            if logger:
+                logger.log("sql", trace_id=trace_id, template="sql_from_breakdown", schema=schema_id,
+                           params={"question": question, "breakdown": breakdown, "value_hints": value_hints},
+                           response=response)
 
             # extract SQL query from llm response
             try:
@@ -122,110 +149,187 @@ def main():
             except ValueError as e:
                 print(f"Error: {e}")
                 print("The LLM didn't generate a SQL query. Please try rephrasing your question.")
-                continue
+                return outcome
             except (AttributeError, IndexError) as e:
                 print(f"Error: Could not extract SQL query from LLM response.")
                 print("The LLM might not have generated a valid SQL query.")
                 print("Please try rephrasing your question.")
-                continue
+                return outcome
             except Exception as e:
                 print(f"Error extracting query: {e}")
                 print("Please try rephrasing your question.")
-                continue
+                return outcome
 
-            # execute the query on iLab with error feedback loop
-            print("Executing query on the database...")
-            
-            # Track the number of correction attempts
-            correction_attempts = 0
-            current_query = query
-            success = False
-            
-            while correction_attempts < MAX_CORRECTION_ATTEMPTS:
-                try:
-                    if use_stdin:
-                        result = ssh_handler.execute_query_stdin(hostname, user, pwd, current_query, wd_path, user, pwd)
-                    else:
-                        result = ssh_handler.execute_query(hostname, user, pwd, current_query, wd_path, user, pwd)
+            outcome["sql_source"] = "sqlcoder"
+
+        outcome["query"] = query
+
+        # execute the query on iLab with error feedback loop
+        print("Executing query on the database...")
+        
+        # Track the number of correction attempts
+        correction_attempts = 0
+        current_query = query
+        success = False
+        
+        while correction_attempts < MAX_CORRECTION_ATTEMPTS:
+            try:
+                with tracing.span("pipeline.execute", attempt=correction_attempts), cancellation.deadline("execute"):
+                    result = backend.execute(current_query)
+                outcome["final_query"] = current_query
+                outcome["result"] = result
+                
+                # Check if there's an error in the result
+                if result is None or "error" in result.lower():
+                    correction_attempts += 1
+                    outcome["attempts"] = correction_attempts
+                    tracing.increment("retries")
                     
-                    # Check if there's an error in the result
-                    if result is None or "error" in result.lower():
-                        correction_attempts += 1
-                        
-                        # On final attempt, give up and show error
-                        if correction_attempts == MAX_CORRECTION_ATTEMPTS:
-                            print(f"\nFailed to generate a valid SQL query after {MAX_CORRECTION_ATTEMPTS} attempts.")
-                            print("Query result:")
-                            print(result)
-                            print("\nDespite error feedback looping the LLM was unable to generate a valid SQL query for your query statement, please validate your query statement or consider using a better LLM model.")
-                            break
-                            
-                        print(f"Query encountered an error. Attempt {correction_attempts} of {MAX_CORRECTION_ATTEMPTS} to fix...")
-                        
-                        # Extract error message
-                        error_msg = extract_error_from_result(result)
+                    # On final attempt, give up and show error
+                    if correction_attempts == MAX_CORRECTION_ATTEMPTS:
+                        print(f"\nFailed to generate a valid SQL query after {MAX_CORRECTION_ATTEMPTS} attempts.")
+                        print("Query result:")
+                        print(result)
+                        print("\nDespite error feedback looping the LLM was unable to generate a valid SQL query for your query statement, please validate your query statement or consider using a better LLM model.")
+                        break
                         
-                        # Get the full schema for error correction
-                        full_schema = llm_manager.load_schema()
+                    print(f"Query encountered an error. Attempt {correction_attempts} of {MAX_CORRECTION_ATTEMPTS} to fix...")
+                    
+                    # Extract error message
+                    error_msg = extract_error_from_result(result)
+                    
+                    # Get corrected query from LLM: continue the SQL conversation with just the error,
+                    # or send the full correction prompt when there is no session to continue
+                    print("Generating corrected query...")
+                    with tracing.span("pipeline.correction", attempt=correction_attempts) as correction_span, \
+                            cancellation.deadline("correction"):
+                        correction_turn = llm_manager.build_correction_turn(question, current_query, error_msg)
+                        correction_response = llm_manager.continue_session(trace_id, correction_turn)
+                        correction_span["continued"] = correction_response is not None
+                        if correction_response is None:
+                            correction_prompt = llm_manager.build_correction_prompt(question, current_query, error_msg, context, breakdown)
+                            correction_llm = llm_manager.get_sql_llm()
+                            correction_response = llm_manager.query_llm(correction_llm, correction_prompt, session_id=trace_id)
+                    
+                    # Log the correction attempt
+                    if logger:
+                        logger.log("correction", trace_id=trace_id, attempt=correction_attempts,
+                                   template="correction_turn" if correction_span["continued"] else "correction",
+                                   schema=schema_id, original_query=query,
+                                   params={"question": question, "query": current_query,
+                                           "error_msg": error_msg, "breakdown": breakdown},
+                                   response=correction_response)
 
-                        # Build correction prompt 
-                        correction_prompt = llm_manager.build_correction_prompt(question, current_query, error_msg, full_schema, breakdown)
+                    # Extract corrected query
+                    try:
+                        corrected_query = query_extraction.extract_query_from_text(correction_response)
+                        print(f"\nCorrected SQL Query (Attempt {correction_attempts}):\n{corrected_query}\n")
                         
-                        # Get corrected query from LLM
-                        print("Generating corrected query...")
-                        correction_llm = llm_manager.get_sql_llm()
-                        correction_response = llm_manager.query_llm(correction_llm, correction_prompt)
+                        # Update the current query for the next attempt
+                        current_query = corrected_query
                         
-                        # Log the correction attempt
-                        with open(os.path.join(log_dir, 'query_corrections.txt'), 'a') as f:
-                            f.write(f"\n\n==================== CORRECTION LOG START (Attempt {correction_attempts}) ====================\n")
-                            f.write(f"Timestamp: {timestamp}\n")
-                            f.write(f"Question: {question}\n\n")
-                            f.write("--- Original Query ---\n")
-                            f.write(f"{query}\n\n") # Log the *initial* query generated
-                            f.write("--- Query Plan/Breakdown ---\n") # Log the breakdown used
-                            f.write(f"{breakdown}\n\n")
-                            f.write("--- Failed Query (Attempt {correction_attempts}) ---\n")
-                            f.write(f"{current_query}\n\n")
-                            f.write("--- Error Message ---\n")
-                            f.write(f"{error_msg}\n\n")
-                            f.write("--- Correction Prompt ---\n")
-                            f.write(f"{correction_prompt}\n\n")
-                            f.write("--- LLM Correction Response ---\n")
-                            f.write(f"{correction_response}\n\n")
-                            f.write(f"==================== CORRECTION LOG END (Attempt {correction_attempts}) ======================\n\n")
-
-                        # Extract corrected query
-                        try:
-                            corrected_query = query_extraction.extract_query_from_text(correction_response)
-                            print(f"\nCorrected SQL Query (Attempt {correction_attempts}):\n{corrected_query}\n")
-                            
-                            # Update the current query for the next attempt
-                            current_query = corrected_query
-                            
-                        except Exception as e:
-                            print(f"Error extracting corrected query: {e}")
-                            print("Could not generate a corrected query. Please try rephrasing your question.")
-                            break
-                    else:
-                        # Success! Display results and break the loop
-                        print("\nQuery Results:")
-                        print(result)
-                        success = True
+                    except Exception as e:
+                        print(f"Error extracting corrected query: {e}")
+                        print("Could not generate a corrected query. Please try rephrasing your question.")
                         break
-                        
-                except Exception as e:
-                    print(f"Error executing query: {e}")
+                else:
+                    # Success! Display results and break the loop
+                    print("\nQuery Results:")
+                    print(result)
+                    success = True
+                    outcome["success"] = True
+                    outcome["status"] = "success"
                     break
+                    
+            except cancellation.Cancelled:
+                raise
+            except Exception as e:
+                print(f"Error executing query: {e}")
+                break
+        
+        # If we made it through the loop without success, but didn't show the error yet
+        if not success and correction_attempts > 0 and correction_attempts < MAX_CORRECTION_ATTEMPTS:
+            print("\nNo results returned from the database. There might be an error with the query or connection.")
+
+        return outcome
+
+    except cancellation.Cancelled as e:
+        # the remote query and generation have already been stopped
+        outcome["status"] = "timeout" if e.stage else "cancelled"
+        print(f"\nStopped: {e}")
+        return outcome
+    except KeyboardInterrupt:
+        outcome["status"] = "cancelled"
+        raise
+    except Exception:
+        outcome["status"] = "error"
+        raise
+    finally:
+        llm_manager.end_session(trace_id)
+        outcome["trace"] = tracing.end_trace(outcome["status"])
+
+def main():
+    # Ctrl-C stops the current question through cancellation, including a running local query
+    cancellation.install_sigint_handler()
+
+    if metrics_port:
+        tracing.start_metrics_server(int(metrics_port))
+        print(f"Serving metrics on http://127.0.0.1:{metrics_port}/metrics")
+
+    # get ssh credentials once at the beginning
+    try:
+        backend = create_backend()
+        
+        # test the connection to make sure credentials work
+        target = hostname if backend.name == "ssh" else backend.db_path
+        print(f"Testing connection to {target}...")
+        tracing.start_trace("SELECT 1")
+        test_result = backend.execute("SELECT 1")
+            
+        if test_result is None:
+            print("Failed to connect to iLab. Please check your credentials and try again.")
+            sys.exit(1)
             
-            # If we made it through the loop without success, but didn't show the error yet
-            if not success and correction_attempts > 0 and correction_attempts < MAX_CORRECTION_ATTEMPTS:
-                print("\nNo results returned from the database. There might be an error with the query or connection.")
+        tracing.end_trace("startup")
+        print(f"Connection to {target} successful!")
+    except KeyboardInterrupt:
+        print("\nOperation cancelled by user.")
+        sys.exit(0)
+    except Exception as e:
+        print(f"Error connecting to iLab: {e}")
+        sys.exit(1)
+
+    # load the database schema and the stored values used to ground filter literals
+    context = llm_manager.load_schema()
+    catalog = load_value_catalog(backend)
+
+    print("\nYou can now ask questions about the database.")
+    print("Type 'exit' to quit the program.\n")
+
+    # llm interactions are logged from a background thread; the schema is stored once by hash
+    logger = structured_log.StructuredLogger()
+    schema_id = logger.register_schema(context)
+
+    # main loop
+    while True:
+        try:
+            question = input("Enter your question: ")
+
+            if question.lower() == "exit":
+                print("Exiting...")
+                break
+
+            print("\nProcessing your question...")
+            answer_question(question, context, backend, logger, schema_id, catalog)
                 
         except KeyboardInterrupt:
             print("\nOperation cancelled by user. Type 'exit' to quit the program.")
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
 
+    # flush queued log records before exiting
+    logger.close()
+    backend.close()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
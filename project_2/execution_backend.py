@@ -0,0 +1,209 @@
+r'''
+execution_backend.py
+
+Execution backends for generated SQL.
+
+A backend takes a SELECT query and returns the formatted result table as text,
+or an error string containing "error" (the contract the correction loop in
+database_llm relies on). SSHBackend runs ilab_script.py on iLab through
+ssh_handler; LocalBackend runs against the embedded SQLite copy built by
+local_engine.py, so the pipeline can be exercised and benchmarked offline.
+
+Environment Variables:
+    EXECUTION_BACKEND: "ssh" (default) or "local"
+    LOCAL_DB_PATH: path of the local SQLite database (default project_2/local_hmda.sqlite)
+'''
+
+import os
+import sqlite3
+
+import cancellation
+import local_engine
+import ssh_handler
+import tracing
+
+
+class ExecutionBackend:
+    '''
+    interface for running generated SQL somewhere
+    '''
+
+    name = "base"
+
+    def execute(self, query):
+        '''
+        run a SELECT query and return the formatted result or an error string
+        '''
+        raise NotImplementedError
+
+    def execute_batch(self, queries):
+        '''
+        run several queries and return their results in order; backends with a
+        per-call startup cost override this to share it across the batch
+        '''
+        return [self.execute(q) for q in queries]
+
+    def table_versions(self):
+        '''
+        version stamp per table (lowercase name), used to invalidate cached results;
+        empty if the backend can't tell
+        '''
+        return {}
+
+    def validate(self, query):
+        '''
+        dry-run a candidate query without fetching rows; returns None if it is valid,
+        otherwise the error string
+        '''
+        inner = query.strip().rstrip(";")
+        result = self.execute(f"SELECT * FROM ({inner}) AS candidate LIMIT 0")
+        if result is None or "error" in result.lower():
+            return result
+        return None
+
+    def validate_batch(self, queries):
+        '''
+        dry-run several candidates at once; returns None or the error string for each
+        '''
+        probes = [f"SELECT * FROM ({q.strip().rstrip(';')}) AS candidate LIMIT 0" for q in queries]
+        return [result if result is None or "error" in result.lower() else None
+                for result in self.execute_batch(probes)]
+
+    def close(self):
+        pass
+
+
+class SSHBackend(ExecutionBackend):
+    '''
+    runs queries through ilab_script.py on iLab over ssh
+    '''
+
+    name = "ssh"
+
+    def __init__(self, host, user, pwd, wd_path, db_user=None, db_pwd=None, use_stdin=True, batch_workers=1):
+        self.host = host
+        self.user = user
+        self.pwd = pwd
+        self.wd_path = wd_path
+        self.db_user = db_user or user
+        self.db_pwd = db_pwd if db_pwd is not None else pwd
+        self.use_stdin = use_stdin
+        self.batch_workers = batch_workers
+
+    def execute(self, query):
+        if self.use_stdin:
+            return ssh_handler.execute_query_stdin(self.host, self.user, self.pwd, query, self.wd_path, self.db_user, self.db_pwd)
+        return ssh_handler.execute_query(self.host, self.user, self.pwd, query, self.wd_path, self.db_user, self.db_pwd)
+
+    def execute_batch(self, queries):
+        # one ssh exec, one interpreter start and one connection (per worker) for the whole list
+        return ssh_handler.execute_batch(self.host, self.user, self.pwd, list(queries), self.wd_path,
+                                         self.db_user, self.db_pwd, self.batch_workers)
+
+    def table_versions(self):
+        # write counters change whenever a table is modified (or statistics are reset);
+        # Postgres counts rows written to a partitioned table on its partitions, so each
+        # partition's counters are also added to its parent's stamp
+        result = self.execute(
+            "SELECT relname, SUM(version) AS version, MAX(analyzed) AS analyzed FROM ("
+            "SELECT s.relname, s.n_tup_ins + s.n_tup_upd + s.n_tup_del AS version, "
+            "COALESCE(EXTRACT(EPOCH FROM GREATEST(s.last_analyze, s.last_autoanalyze)), 0)::bigint AS analyzed "
+            "FROM pg_stat_user_tables s "
+            "UNION ALL "
+            "SELECT parent.relname, s.n_tup_ins + s.n_tup_upd + s.n_tup_del, "
+            "COALESCE(EXTRACT(EPOCH FROM GREATEST(s.last_analyze, s.last_autoanalyze)), 0)::bigint "
+            "FROM pg_stat_user_tables s "
+            "JOIN pg_inherits i ON i.inhrelid = s.relid "
+            "JOIN pg_class parent ON parent.oid = i.inhparent"
+            ") AS stamps GROUP BY relname"
+        )
+        return parse_table_versions(result)
+
+
+class LocalBackend(ExecutionBackend):
+    '''
+    runs queries against the local SQLite HMDA database through the dialect shim
+    '''
+
+    name = "local"
+
+    def __init__(self, db_path=local_engine.DEFAULT_DB_PATH):
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(f"Local database not found at {db_path}. Build it with local_engine.py first.")
+        self.db_path = db_path
+        self.conn = local_engine.connect(db_path)
+        # abort a running query once the user cancels or the stage deadline passes
+        self.conn.set_progress_handler(cancellation.should_stop, 10000)
+
+    def execute(self, query):
+        # same safety rule as ilab_script.py
+        if not query.strip().upper().startswith("SELECT"):
+            return "Error: Only SELECT queries are allowed for security reasons"
+
+        try:
+            with tracing.span("local.execute") as execute_span:
+                cursor = self.conn.execute(local_engine.translate_sql(query))
+                column_names = [desc[0] for desc in cursor.description] if cursor.description else None
+                results = cursor.fetchall() if column_names else None
+                execute_span["rows"] = len(results) if results is not None else 0
+        except (sqlite3.Error, ValueError) as e:
+            cancellation.check()
+            if str(e) == "interrupted":
+                # Ctrl-C raised inside the progress handler, where sqlite3 swallows it
+                raise KeyboardInterrupt
+            return f"Error executing query.\nCommand error output:\nDatabase error: {local_engine.postgres_error_message(str(e))}"
+
+        return format_results(column_names, results)
+
+    def table_versions(self):
+        # the local copy only changes when local_engine.py rebuilds it
+        loaded_at = str(os.path.getmtime(self.db_path))
+        names = self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+        return {name.lower(): loaded_at for (name,) in names}
+
+    def close(self):
+        self.conn.close()
+
+
+def parse_table_versions(result):
+    '''
+    turn the formatted pg_stat_user_tables result into {table: stamp}
+    '''
+    versions = {}
+    if result is None or "error" in result.lower():
+        return versions
+
+    lines = result.splitlines()
+    for line in lines[1:]:
+        parts = line.split()
+        if len(parts) >= 2:
+            versions[parts[0].lower()] = " ".join(parts[1:])
+    return versions
+
+
+def format_results(column_names, results):
+    '''
+    format results like ilab_script.py does so both backends print the same tables
+    '''
+    if column_names is None or results is None:
+        return "Query executed successfully, but no results were returned."
+
+    if len(results) == 0:
+        return "Query returned no data."
+
+    # imported lazily, only the local backend formats results itself
+    import pandas as pd
+
+    df = pd.DataFrame(results, columns=column_names)
+    return df.to_string(index=False)
+
+
+def create_backend(kind, **options):
+    '''
+    build a backend by name; options are passed to its constructor
+    '''
+    if kind == "ssh":
+        return SSHBackend(**options)
+    if kind == "local":
+        return LocalBackend(**options)
+    raise ValueError(f"Unknown execution backend: {kind}")
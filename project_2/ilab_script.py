@@ -8,16 +8,40 @@ executes it, and formats the results using pandas.
 Usage:
     python3 ilab_script.py "SELECT * FROM Agency"
     echo "SELECT * FROM Agency" | python3 ilab_script.py
+    echo '["SELECT 1", "SELECT * FROM Agency"]' | python3 ilab_script.py --batch --workers 2
+    python3 ilab_script.py --cancel 12345        # pg_cancel_backend on a backend PID
+
+In batch mode stdin holds a JSON list of statements. They run on one
+connection (or a small pool with --workers) and stdout is a JSON list with a
+status, timing and formatted result or error per statement.
 
 Environment Variables:
     DB_USER: Your database username
     DB_PASSWORD: Your database password (if needed)
+    STATEMENT_TIMEOUT_MS: server side statement_timeout (optional)
+
+Stage timings (imports, db_connect, db_execute, format) are reported on stderr
+as a single "TIMING {json}" line so the client can attribute remote latency.
+
+The script's PID and each connection's Postgres backend PID are reported on
+stderr as "BACKEND {json}" lines as soon as they are known. SIGTERM or SIGHUP
+cancels the running statements (queries wait in Python via wait_select so the
+signal is handled mid-query), which is how the client stops abandoned work.
 """
 
+import time
+_script_start = time.perf_counter()
+
+import atexit
+import json
 import sys
 import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import psycopg2
+import psycopg2.extras
 from psycopg2 import sql
 import dotenv 
 
@@ -32,6 +56,43 @@ DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 DB_HOST = "postgres.cs.rutgers.edu"
 DB_PORT = "5432"
 
+# upper bound on parallel connections in batch mode
+MAX_BATCH_WORKERS = 4
+
+# server side limit so a query stops even if this process is lost
+STATEMENT_TIMEOUT_MS = os.getenv("STATEMENT_TIMEOUT_MS", "")
+
+# seconds spent per stage, reported to the client on exit
+stage_timings = {"imports": time.perf_counter() - _script_start}
+
+# open connections, cancelled when the client asks us to stop
+open_connections = []
+stop_requested = threading.Event()
+
+def report_process(**ids):
+    '''
+    tell the client which process / backend to cancel, as soon as it is known
+    '''
+    print("BACKEND " + json.dumps(ids), file=sys.stderr, flush=True)
+
+def handle_stop(signum, frame):
+    '''
+    SIGTERM/SIGHUP handler: cancel every running statement on the server
+    '''
+    stop_requested.set()
+    for conn in list(open_connections):
+        try:
+            conn.cancel()
+        except Exception:
+            pass
+
+def report_timings():
+    '''
+    print stage timings to stderr in a single machine readable line
+    '''
+    stage_timings["total"] = time.perf_counter() - _script_start
+    print("TIMING " + json.dumps(stage_timings), file=sys.stderr)
+
 def get_db_connection():
     '''
     connect to database on iLab
@@ -56,9 +117,14 @@ def get_db_connection():
         # Add password only if it's not empty
         if DB_PASSWORD:
             conn_params["password"] = DB_PASSWORD
+
+        if STATEMENT_TIMEOUT_MS:
+            conn_params["options"] = f"-c statement_timeout={int(STATEMENT_TIMEOUT_MS)}"
             
         # Connect to the database
         conn = psycopg2.connect(**conn_params)
+        open_connections.append(conn)
+        report_process(pid=os.getpid(), backend_pid=conn.get_backend_pid())
         return conn
     except psycopg2.OperationalError as e:
         print(f"Database connection error: {e}", file=sys.stderr)
@@ -71,13 +137,17 @@ def execute_query(query):
     """Execute the SQL query and return the results"""
     conn = None
     try:
+        start = time.perf_counter()
         conn = get_db_connection()
+        stage_timings["db_connect"] = time.perf_counter() - start
         
         # Create a cursor object
         cursor = conn.cursor()
         
         # Execute the query
+        start = time.perf_counter()
         cursor.execute(query)
+        stage_timings["db_execute"] = time.perf_counter() - start
         
         # Check if there are results to fetch
         if cursor.description is None:
@@ -89,6 +159,7 @@ def execute_query(query):
         
         # Fetch all results
         results = cursor.fetchall()
+        stage_timings["db_execute"] = time.perf_counter() - start
         
         # Close cursor and connection
         cursor.close()
@@ -125,8 +196,135 @@ def format_results(column_names, results):
         print(f"Error formatting results: {e}", file=sys.stderr)
         return f"Error formatting results: {e}"
 
+def run_statement(conn, query):
+    """Run one batch statement on an open connection and return its status entry"""
+    entry = {"query": query}
+    start = time.perf_counter()
+
+    if stop_requested.is_set():
+        entry["status"] = "error"
+        entry["error"] = "Error: Batch cancelled"
+        entry["seconds"] = 0.0
+        return entry
+
+    # same safety rule as single query mode, applied per statement
+    if not query.strip().upper().startswith("SELECT"):
+        entry["status"] = "error"
+        entry["error"] = "Error: Only SELECT queries are allowed for security reasons"
+        entry["seconds"] = 0.0
+        return entry
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query)
+        if cursor.description is None:
+            column_names, results = None, None
+        else:
+            column_names = [desc[0] for desc in cursor.description]
+            results = cursor.fetchall()
+        cursor.close()
+        # read only, but end the transaction so the next statement starts clean
+        conn.rollback()
+
+        entry["status"] = "ok"
+        entry["result"] = format_results(column_names, results)
+    except psycopg2.Error as e:
+        conn.rollback()
+        entry["status"] = "error"
+        entry["error"] = f"Database error: {e}"
+    except Exception as e:
+        entry["status"] = "error"
+        entry["error"] = f"Error executing query: {e}"
+
+    entry["seconds"] = time.perf_counter() - start
+    return entry
+
+def execute_batch(queries, workers=1):
+    """Run a list of statements over `workers` connections, keeping their order"""
+    workers = max(1, min(workers, MAX_BATCH_WORKERS, len(queries)))
+    local = threading.local()
+    connections = []
+    lock = threading.Lock()
+
+    def connection():
+        # one connection per worker thread, opened on first use
+        if not hasattr(local, "conn"):
+            start = time.perf_counter()
+            local.conn = get_db_connection()
+            with lock:
+                connections.append(local.conn)
+                stage_timings["db_connect"] = max(stage_timings.get("db_connect", 0.0), time.perf_counter() - start)
+        return local.conn
+
+    start = time.perf_counter()
+    try:
+        if workers == 1:
+            entries = [run_statement(connection(), q) for q in queries]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                entries = list(pool.map(lambda q: run_statement(connection(), q), queries))
+    finally:
+        for conn in connections:
+            conn.close()
+
+    stage_timings["db_execute"] = time.perf_counter() - start - stage_timings.get("db_connect", 0.0)
+    return entries
+
+def batch_main(args):
+    """Read a JSON list of statements from stdin and print a JSON list of results"""
+    workers = 1
+    if "--workers" in args:
+        try:
+            workers = int(args[args.index("--workers") + 1])
+        except (IndexError, ValueError):
+            print("Error: --workers needs a number", file=sys.stderr)
+            sys.exit(1)
+
+    try:
+        queries = json.loads(sys.stdin.read())
+    except Exception as e:
+        print(f"Error reading batch from stdin: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+        print("Error: batch input must be a JSON list of SQL strings", file=sys.stderr)
+        sys.exit(1)
+
+    entries = execute_batch(queries, workers) if queries else []
+    print(json.dumps(entries))
+
+def cancel_backend(backend_pid):
+    """Cancel the statement running on another backend of ours"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_cancel_backend(%s)", (backend_pid,))
+        print(cursor.fetchone()[0])
+    finally:
+        conn.close()
+
 def main():
     """Main function to process arguments and execute query"""
+    atexit.register(report_timings)
+
+    # wait for query results in python so a stop signal can cancel them mid-query
+    psycopg2.extensions.set_wait_callback(psycopg2.extras.wait_select)
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGHUP, handle_stop)
+    report_process(pid=os.getpid())
+
+    if "--cancel" in sys.argv[1:]:
+        try:
+            cancel_backend(int(sys.argv[sys.argv.index("--cancel") + 1]))
+        except (IndexError, ValueError):
+            print("Error: --cancel needs a backend PID", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    if "--batch" in sys.argv[1:]:
+        batch_main(sys.argv[1:])
+        return
+
     # Check if query is passed as argument or should be read from stdin
     if len(sys.argv) > 1:
         # Query is passed as an argument
@@ -155,7 +353,9 @@ def main():
     column_names, results = execute_query(query)
     
     # Format and print the results
+    start = time.perf_counter()
     formatted_results = format_results(column_names, results)
+    stage_timings["format"] = time.perf_counter() - start
     print(formatted_results)
 
 if __name__ == "__main__":
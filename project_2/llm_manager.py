@@ -1,9 +1,14 @@
 import contextlib
+import hashlib
+import json
 import os
+import time
+from collections import OrderedDict
 from pathlib import Path
 import gc
 
-from llama_cpp import Llama
+import cancellation
+import tracing
 
 # Model paths
 BREAKDOWN_MODEL = "Phi-3.5-mini-instruct-Q4_K_M.gguf"
@@ -13,6 +18,179 @@ SQL_MODEL = "sqlcoder-7b-q5_k_m.gguf"
 current_model = None
 current_llm = None
 
+# how many models may stay resident at once; 1 keeps us under the 4GB VRAM budget,
+# benchmarks on bigger machines can raise it to keep both models warm
+MAX_LOADED_MODELS = 1
+loaded_models = OrderedDict()
+
+# "llama" runs the GGUF models, "record" runs them and saves every completion,
+# "replay" serves saved completions without loading any model
+LLM_BACKEND = os.getenv("LLM_BACKEND", "llama")
+RECORDINGS_PATH = os.getenv("LLM_RECORDINGS", str(Path(__file__).parent / "recordings" / "llm_recordings.jsonl"))
+
+# simulated seconds per prompt token / generated token when replaying
+REPLAY_PROMPT_LATENCY = float(os.getenv("LLM_REPLAY_PROMPT_LATENCY", "0"))
+REPLAY_TOKEN_LATENCY = float(os.getenv("LLM_REPLAY_TOKEN_LATENCY", "0"))
+
+SYSTEM_PROMPT = "You are an expert PostgreSQL assistant."
+MAX_COMPLETION_TOKENS = 500
+
+# per-question chat sessions that correction rounds continue instead of re-sending the
+# whole prompt. a session's tokens stay in its model's context until another prompt
+# needs it; only then is the llama state saved, up to this many MB over all sessions
+SESSION_BUDGET_MB = float(os.getenv("LLM_SESSION_BUDGET_MB", "2048"))
+sessions = OrderedDict()
+context_owner = {}  # model name -> id of the session whose tokens fill its context
+
+def completion_key(model_name, messages, max_tokens):
+    '''
+    hash identifying a chat completion request, used to match recordings
+    '''
+    payload = json.dumps({"model": model_name, "messages": messages, "max_tokens": max_tokens}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def load_recordings(path=None):
+    '''
+    read recorded completions keyed by request hash; later recordings win
+    '''
+    path = path or RECORDINGS_PATH
+    recordings = {}
+    if not os.path.exists(path):
+        return recordings
+
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            recordings[entry["key"]] = entry["output"]
+    return recordings
+
+class RecordingLLM:
+    '''
+    wraps a real Llama and appends every chat completion to the recordings file
+    '''
+
+    def __init__(self, llm, model_name, path=None):
+        self.llm = llm
+        self.model_name = model_name
+        self.path = path or RECORDINGS_PATH
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def create_chat_completion(self, messages, max_tokens=None, stream=False, **kwargs):
+        if stream:
+            return self._record_stream(messages, max_tokens, **kwargs)
+        output = self.llm.create_chat_completion(messages=messages, max_tokens=max_tokens, **kwargs)
+        self._save(messages, max_tokens, output)
+        return output
+
+    def _record_stream(self, messages, max_tokens, **kwargs):
+        chunks = self.llm.create_chat_completion(messages=messages, max_tokens=max_tokens, stream=True, **kwargs)
+        pieces = []
+        finish_reason = None
+        try:
+            for chunk in chunks:
+                choice = chunk['choices'][0]
+                pieces.append(choice.get('delta', {}).get('content') or "")
+                finish_reason = choice.get('finish_reason') or finish_reason
+                yield chunk
+        finally:
+            chunks.close()
+
+        # only completions that ran to the end are worth replaying
+        content = "".join(pieces)
+        completion_tokens = sum(1 for p in pieces if p)
+        output = {
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+            "usage": estimate_usage(self.llm, completion_tokens),
+        }
+        self._save(messages, max_tokens, output)
+
+    def _save(self, messages, max_tokens, output):
+        entry = {
+            "key": completion_key(self.model_name, messages, max_tokens),
+            "model": self.model_name,
+            "output": output,
+        }
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def __getattr__(self, name):
+        # everything else (tokenizer, context, ...) comes from the real model
+        return getattr(self.llm, name)
+
+class ReplayLLM:
+    '''
+    stands in for a Llama by replaying recorded completions with simulated token latency
+    '''
+
+    def __init__(self, model_name, recordings, prompt_latency=None, token_latency=None):
+        self.model_name = model_name
+        self.recordings = recordings
+        self.prompt_latency = REPLAY_PROMPT_LATENCY if prompt_latency is None else prompt_latency
+        self.token_latency = REPLAY_TOKEN_LATENCY if token_latency is None else token_latency
+        self._last_perf = {}
+
+    def create_chat_completion(self, messages, max_tokens=None, stream=False, **kwargs):
+        key = completion_key(self.model_name, messages, max_tokens)
+        if key not in self.recordings:
+            raise LookupError(f"No recorded completion for this prompt ({self.model_name}, key {key[:12]}). Record it with LLM_BACKEND=record first.")
+
+        output = self.recordings[key]
+        usage = output.get('usage') or {}
+        prompt_s = usage.get('prompt_tokens', 0) * self.prompt_latency
+        decode_s = usage.get('completion_tokens', 0) * self.token_latency
+
+        self._last_perf = {
+            "prompt_eval_s": prompt_s,
+            "decode_s": decode_s,
+            "prompt_eval_tokens": usage.get('prompt_tokens', 0),
+            "decode_tokens": usage.get('completion_tokens', 0),
+        }
+
+        if stream:
+            return self._replay_stream(output, prompt_s)
+
+        time.sleep(prompt_s + decode_s)
+        return output
+
+    def _replay_stream(self, output, prompt_s):
+        # emit the recorded text as completion_tokens chunks, one token latency apart
+        content = output['choices'][0]['message']['content'] or ""
+        usage = output.get('usage') or {}
+        count = max(1, usage.get('completion_tokens', 0))
+        size = max(1, -(-len(content) // count))
+
+        time.sleep(prompt_s)
+        for start in range(0, len(content), size):
+            time.sleep(self.token_latency)
+            yield {"choices": [{"index": 0, "delta": {"content": content[start:start + size]}, "finish_reason": None}]}
+        yield {"choices": [{"index": 0, "delta": {}, "finish_reason": output['choices'][0].get('finish_reason')}], "usage": usage}
+
+    def perf_counters(self):
+        return self._last_perf
+
+class ChatSession:
+    '''
+    one question's conversation with a model; continuing it lets llama.cpp reuse the
+    KV cache of every turn so far and evaluate only the new one
+    '''
+
+    def __init__(self, model_name, messages, n_tokens):
+        self.model_name = model_name
+        self.messages = messages
+        self.n_tokens = n_tokens
+        self.state = None
+
+    def state_bytes(self):
+        if self.state is None:
+            return 0
+        return self.state.llama_state_size + self.state.scores.nbytes
+
 def load_schema():
     '''
     load database schema from cut-down project_1 sql file
@@ -20,24 +198,38 @@ def load_schema():
     
     context = ""
 
-    with open("./schema_context.sql", "r") as f:
+    with open(Path(__file__).parent / "schema_context.sql", "r") as f:
         context = f.read()
 
     return context
 
 def ensure_model_loaded(model_name):
     '''
-    Ensure the specified model is loaded, unloading the current model if necessary.
+    Ensure the specified model is loaded, unloading the least recently used model if necessary.
     '''
     global current_model, current_llm
     
     # If the requested model is already loaded, return it
-    if current_model == model_name and current_llm is not None:
+    if model_name in loaded_models:
+        tracing.increment("model_cache_hits")
+        loaded_models.move_to_end(model_name)
+        current_model = model_name
+        current_llm = loaded_models[model_name]
         return current_llm
+
+    if LLM_BACKEND == "replay":
+        llm = ReplayLLM(model_name, load_recordings())
+        loaded_models[model_name] = llm
+        current_llm = llm
+        current_model = model_name
+        return llm
+
+    tracing.increment("model_loads")
     
-    # Unload current model if it exists
-    if current_llm is not None:
-        del current_llm
+    # Unload least recently used models to make room
+    while loaded_models and len(loaded_models) >= MAX_LOADED_MODELS:
+        unloaded, _ = loaded_models.popitem(last=False)
+        drop_sessions(unloaded)
         current_llm = None
         current_model = None
         gc.collect()  # Force garbage collection
@@ -46,8 +238,11 @@ def ensure_model_loaded(model_name):
     script_dir = Path(__file__).parent
     model_file_path = script_dir / 'model' / model_name
 
+    # imported here so replay runs work on machines without llama-cpp-python
+    from llama_cpp import Llama
+
     # suppress stderr during Llama initialization
-    with open(os.devnull, 'w') as f, contextlib.redirect_stderr(f):
+    with open(os.devnull, 'w') as f, contextlib.redirect_stderr(f), tracing.span("llm.load", model=model_name):
         try:
             llm = Llama(
                 model_path=str(model_file_path),
@@ -56,6 +251,9 @@ def ensure_model_loaded(model_name):
                 n_ctx=4096,
                 verbose=False
             )
+            if LLM_BACKEND == "record":
+                llm = RecordingLLM(llm, model_name)
+            loaded_models[model_name] = llm
             current_llm = llm
             current_model = model_name
             return llm
@@ -97,9 +295,10 @@ def build_breakdown_prompt(context, question):
     """
     return prompt
 
-def build_sql_from_breakdown_prompt(breakdown, context, question):
+def build_sql_from_breakdown_prompt(breakdown, context, question, value_hints=""):
     '''
-    build prompt for LLM to generate SQL from a relational algebra expression
+    build prompt for LLM to generate SQL from a relational algebra expression;
+    value_hints lists stored codes/names matching the question (see value_catalog.py)
     '''
     specific_guidance = ""
     
@@ -130,6 +329,8 @@ def build_sql_from_breakdown_prompt(breakdown, context, question):
 
         {specific_guidance}
 
+        {value_hints}
+
         Original Question: {question}
 
         Relational Algebra Expression:
@@ -142,13 +343,56 @@ def build_sql_from_breakdown_prompt(breakdown, context, question):
     """
     return prompt
 
+def error_kind(error_msg):
+    '''
+    classify a database error for the correction hints
+    '''
+    error = error_msg.lower()
+    if "column" in error and "does not exist" in error:
+        return "missing_column"
+    if "cross join" in error or "missing join condition" in error:
+        return "missing_join"
+    if "ambiguous" in error and "column" in error:
+        return "ambiguous_column"
+    if "must appear in the group by clause" in error or "not in group by" in error:
+        return "group_by"
+    if "syntax error" in error:
+        return "syntax"
+    if "relation" in error and "does not exist" in error:
+        return "missing_table"
+    return None
+
+# one-line versions of the correction prompt's guidance, for continued sessions
+CORRECTION_HINTS = {
+    "missing_column": "Check the column name and table in the schema; names live in lookup tables, not junction tables.",
+    "missing_join": "Every JOIN needs an ON condition; junction tables join on ID, then on the lookup code.",
+    "ambiguous_column": "Qualify every column with its table alias.",
+    "group_by": "Every non-aggregated SELECT column must be in GROUP BY.",
+    "syntax": "Check keywords, commas, parentheses and quotes.",
+    "missing_table": "Use the exact table names from the schema, not aliases.",
+}
+
+def build_correction_turn(question, query, error_msg):
+    '''
+    short follow-up asking a continued session to fix its query: only the error and a targeted hint,
+    since the question, plan, schema and failed SQL are already in the conversation
+    '''
+    kind = error_kind(error_msg)
+    hints = [CORRECTION_HINTS[kind]] if kind in CORRECTION_HINTS else []
+    if "denial" in question.lower() or "denialreasons" in query.lower():
+        hints.append("DenialReasons has no denial_reason_name; join DenialReason on denial_reason_code.")
+
+    hint = "".join(f"\nHint: {h}" for h in hints)
+    return f"That query failed with this error:\n{error_msg}{hint}\nOutput only the corrected SQL query, wrapped in ```sql markdown tags."
+
 def build_correction_prompt(question, query, error_msg, full_schema, breakdown):
     '''
     Build a concise prompt for LLM to correct a SQL query error, using the original breakdown.
     '''
 
+    kind = error_kind(error_msg)
     specific_guidance = ""
-    if "column" in error_msg.lower() and "does not exist" in error_msg.lower():
+    if kind == "missing_column":
         specific_guidance = """
             Error Type Hint: Column Not Found.
             Possible Causes:
@@ -159,7 +403,7 @@ def build_correction_prompt(question, query, error_msg, full_schema, breakdown):
             Check the original Query Plan/Breakdown for intended logic.
         """
     # Missing JOIN condition
-    elif "cross join" in error_msg.lower() or "missing join condition" in error_msg.lower():
+    elif kind == "missing_join":
         specific_guidance = """
             Error Type Hint: Missing JOIN Condition.
             Possible Causes:
@@ -171,7 +415,7 @@ def build_correction_prompt(question, query, error_msg, full_schema, breakdown):
             Check the original Query Plan/Breakdown for intended JOINs.
         """
     # Ambiguous column reference
-    elif "ambiguous" in error_msg.lower() and "column" in error_msg.lower():
+    elif kind == "ambiguous_column":
         specific_guidance = """
             Error Type Hint: Ambiguous Column Reference.
             Possible Causes:
@@ -181,7 +425,7 @@ def build_correction_prompt(question, query, error_msg, full_schema, breakdown):
             Always use table aliases and qualify all columns when multiple tables are joined.
         """
     # Missing GROUP BY columns
-    elif "must appear in the group by clause" in error_msg.lower() or "not in group by" in error_msg.lower():
+    elif kind == "group_by":
         specific_guidance = """
             Error Type Hint: GROUP BY Error.
             Possible Causes:
@@ -191,7 +435,7 @@ def build_correction_prompt(question, query, error_msg, full_schema, breakdown):
             All non-aggregated columns in SELECT must be in GROUP BY.
         """
     # Syntax error
-    elif "syntax error" in error_msg.lower():
+    elif kind == "syntax":
         specific_guidance = """
             Error Type Hint: SQL Syntax Error.
             Possible Causes:
@@ -202,7 +446,7 @@ def build_correction_prompt(question, query, error_msg, full_schema, breakdown):
             Review the query structure carefully, comparing against standard SQL syntax and the original Query Plan/Breakdown.
         """
     # Table does not exist
-    elif "relation" in error_msg.lower() and "does not exist" in error_msg.lower():
+    elif kind == "missing_table":
         specific_guidance = """
             Error Type Hint: Table Not Found ('relation does not exist').
             Possible Causes:
@@ -267,32 +511,217 @@ def build_correction_prompt(question, query, error_msg, full_schema, breakdown):
     """
     return prompt
 
-def query_llm(llm, prompt):
+def _perf_counters(llm):
+    '''
+    read llama.cpp's prompt eval / decode counters for the last call, empty if unavailable
+    '''
+    if hasattr(llm, "perf_counters"):
+        return llm.perf_counters()
+
+    try:
+        import llama_cpp
+        data = llama_cpp.llama_perf_context(llm._ctx.ctx)
+        return {
+            "prompt_eval_s": data.t_p_eval_ms / 1000,
+            "decode_s": data.t_eval_ms / 1000,
+            "prompt_eval_tokens": data.n_p_eval,
+            "decode_tokens": data.n_eval,
+        }
+    except Exception:
+        return {}
+
+def _reset_perf_counters(llm):
+    try:
+        import llama_cpp
+        llama_cpp.llama_perf_context_reset(llm._ctx.ctx)
+    except Exception:
+        pass
+
+def estimate_usage(llm, completion_tokens):
+    '''
+    token usage of a streamed completion, which llama.cpp doesn't report;
+    the context holds the prompt plus every generated token
     '''
-    query the LLM with the given prompt
+    n_tokens = getattr(llm, "n_tokens", 0) or 0
+    prompt_tokens = max(0, n_tokens - completion_tokens)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+def stream_completion(llm, messages, max_tokens):
     '''
+    generate a chat completion token by token, stopping between tokens on Ctrl-C
+    or when the current stage passes its deadline
+    '''
+    pieces = []
+    usage = None
+    chunks = llm.create_chat_completion(messages=messages, max_tokens=max_tokens, stream=True)
+    try:
+        for chunk in chunks:
+            cancellation.check()
+            if chunk.get('usage'):
+                usage = chunk['usage']
+            content = chunk['choices'][0].get('delta', {}).get('content')
+            if content:
+                pieces.append(content)
+    finally:
+        # closing the generator stops llama.cpp from decoding any further tokens
+        chunks.close()
+
+    if usage is None:
+        usage = estimate_usage(llm, len(pieces))
+    return "".join(pieces), usage
+
+def generate(llm, messages):
+    '''
+    run one chat completion with tracing; exits on model errors like before
+    '''
+    _reset_perf_counters(llm)
 
-    # use create_chat_completion for instruction-tuned models
-    try: 
-        output = llm.create_chat_completion(
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert PostgreSQL assistant."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            max_tokens=500
-        )
-        
+    try:
+        with tracing.span("llm.generate", model=current_model) as generate_span:
+            content, usage = stream_completion(llm, messages=messages, max_tokens=MAX_COMPLETION_TOKENS)
+            generate_span["prompt_tokens"] = usage.get('prompt_tokens', 0)
+            generate_span["completion_tokens"] = usage.get('completion_tokens', 0)
+
+    except cancellation.Cancelled:
+        raise
     except Exception as e:
         print(f"Error querying LLM: {e}")
         quit()
-    
-    return output['choices'][0]['message']['content']
+
+    record_generation_stats(llm, generate_span)
+
+    return content
+
+def query_llm(llm, prompt, session_id=None):
+    '''
+    query the LLM with the given prompt; with a session_id the conversation is kept
+    so continue_session can add turns to it
+    '''
+    model_name = current_model
+    if session_id is not None:
+        end_session(session_id)
+    claim_context(llm, model_name, None)
+
+    # use create_chat_completion for instruction-tuned models
+    messages = [
+        {
+            "role": "system",
+            "content": SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+    content = generate(llm, messages)
+
+    if session_id is not None:
+        sessions[session_id] = ChatSession(model_name, messages + [{"role": "assistant", "content": content}],
+                                           getattr(llm, "n_tokens", 0))
+        context_owner[model_name] = session_id
+
+    return content
+
+def continue_session(session_id, follow_up):
+    '''
+    add a user turn to a kept conversation and return the reply, evaluating only the
+    new tokens; returns None when the session is gone and the full prompt is needed
+    '''
+    session = sessions.get(session_id)
+    if session is None or session.model_name not in loaded_models:
+        end_session(session_id)
+        return None
+
+    llm = ensure_model_loaded(session.model_name)
+    if hasattr(llm, "n_ctx") and hasattr(llm, "tokenize"):
+        needed = session.n_tokens + len(llm.tokenize(follow_up.encode('utf-8'), add_bos=False)) + 16 + MAX_COMPLETION_TOKENS
+        if needed > llm.n_ctx():
+            end_session(session_id)
+            return None
+
+    if context_owner.get(session.model_name) != session_id:
+        if session.state is None and hasattr(llm, "load_state"):
+            # its tokens were overwritten and never saved
+            end_session(session_id)
+            return None
+        # take the state out first so saving the previous owner can't evict it
+        state, session.state = session.state, None
+        claim_context(llm, session.model_name, session_id)
+        if state is not None:
+            llm.load_state(state)
+
+    messages = session.messages + [{"role": "user", "content": follow_up}]
+    try:
+        content = generate(llm, messages)
+    except BaseException:
+        # the context now holds a partial turn
+        end_session(session_id)
+        raise
+
+    session.messages = messages + [{"role": "assistant", "content": content}]
+    session.n_tokens = getattr(llm, "n_tokens", 0)
+    sessions.move_to_end(session_id)
+    tracing.increment("session_continuations")
+    return content
+
+def claim_context(llm, model_name, session_id):
+    '''
+    hand a model's context to a session (or a one-off prompt), first saving the state
+    of the session whose tokens it holds so that one can still be continued
+    '''
+    owner = context_owner.get(model_name)
+    if owner is not None and owner != session_id and owner in sessions and hasattr(llm, "save_state"):
+        with tracing.span("llm.save_session", model=model_name):
+            sessions[owner].state = llm.save_state()
+        enforce_session_budget()
+    context_owner[model_name] = session_id
+
+def enforce_session_budget():
+    '''
+    drop least recently used saved sessions until their states fit SESSION_BUDGET_MB
+    '''
+    budget = SESSION_BUDGET_MB * 1024 * 1024
+    for session_id in list(sessions):
+        if sum(s.state_bytes() for s in sessions.values()) <= budget:
+            break
+        if sessions[session_id].state is not None:
+            end_session(session_id)
+            tracing.increment("session_evictions")
+
+def end_session(session_id):
+    '''
+    forget a conversation and its saved state, e.g. when its question is answered
+    '''
+    session = sessions.pop(session_id, None)
+    if session is not None and context_owner.get(session.model_name) == session_id:
+        del context_owner[session.model_name]
+
+def drop_sessions(model_name):
+    '''
+    forget every conversation held by a model that is being unloaded
+    '''
+    for session_id in [k for k, s in sessions.items() if s.model_name == model_name]:
+        end_session(session_id)
+    context_owner.pop(model_name, None)
+
+def record_generation_stats(llm, generate_span):
+    '''
+    splits a generate span into prompt eval and decode and counts tokens
+    '''
+    perf = _perf_counters(llm)
+    tracing.increment("prompt_tokens", generate_span.get("prompt_tokens", 0))
+    tracing.increment("completion_tokens", generate_span.get("completion_tokens", 0))
+
+    if perf:
+        tracing.record_span("llm.prompt_eval", perf["prompt_eval_s"], tokens=perf["prompt_eval_tokens"])
+        tracing.record_span("llm.decode", perf["decode_s"], tokens=perf["decode_tokens"])
+        # prompt tokens llama.cpp didn't have to evaluate came from its prefix cache
+        reused = generate_span.get("prompt_tokens", 0) - perf["prompt_eval_tokens"]
+        tracing.increment("prompt_cache_hit_tokens", max(0, reused))
 
 def get_breakdown_llm():
     '''
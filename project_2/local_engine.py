@@ -0,0 +1,361 @@
+r'''
+local_engine.py
+
+Embedded SQLite copy of the HMDA database for offline runs.
+
+The database is built from an HMDA CSV extract (the original column layout,
+e.g. the file produced by project_1/convert_db_to_csv.sql) by staging it as the
+Preliminary table and running project_1/project_1.sql and
+project_1/summary_layer.sql through a small PostgreSQL -> SQLite dialect shim
+(the rollup materialized views become plain tables). The same shim translates the queries the
+LLM generates, so local validation runs and benchmarks need no ssh round trip.
+
+Usage:
+    python3 local_engine.py hmda_extract.csv                  # builds local_hmda.sqlite
+    python3 local_engine.py hmda_extract.csv other.sqlite
+    python3 local_engine.py hmda_extract.csv --keep-staging   # keep the Preliminary table
+'''
+
+import csv
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import sys
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.path.join(SCRIPT_DIR, "local_hmda.sqlite")
+SCHEMA_SCRIPT = os.path.join(SCRIPT_DIR, "..", "project_1", "project_1.sql")
+SUMMARY_SCRIPT = os.path.join(SCRIPT_DIR, "..", "project_1", "summary_layer.sql")
+
+# postgres cast targets -> sqlite type affinity
+CAST_TYPES = {
+    "smallint": "INTEGER",
+    "integer": "INTEGER",
+    "int": "INTEGER",
+    "int4": "INTEGER",
+    "bigint": "INTEGER",
+    "int8": "INTEGER",
+    "numeric": "REAL",
+    "decimal": "REAL",
+    "float": "REAL",
+    "float8": "REAL",
+    "real": "REAL",
+    "double precision": "REAL",
+    "text": "TEXT",
+    "varchar": "TEXT",
+    "char": "TEXT",
+    "bpchar": "TEXT",
+}
+
+# statements from the postgres load script that have no sqlite equivalent
+SKIPPED_STATEMENTS = re.compile(r"^\s*(SET\s|SELECT\s+setval\b|ANALYZE\b|VACUUM\b|REFRESH\b)", re.IGNORECASE)
+
+_CAST_TYPE_PATTERN = re.compile(r"\s*(double\s+precision|[A-Za-z_][A-Za-z_0-9]*)(\s*\(\s*\d+(?:\s*,\s*\d+)?\s*\))?")
+
+_SIMPLE_REWRITES = [
+    (re.compile(r"\bILIKE\b", re.IGNORECASE), "LIKE"),
+    (re.compile(r"\bSTRING_AGG\s*\(", re.IGNORECASE), "GROUP_CONCAT("),
+    (re.compile(r"\bJSONB?_AGG\s*\(", re.IGNORECASE), "json_group_array("),
+    (re.compile(r"\bJSONB?_BUILD_ARRAY\s*\(", re.IGNORECASE), "json_array("),
+    (re.compile(r"\bJSONB?_BUILD_OBJECT\s*\(", re.IGNORECASE), "json_object("),
+    (re.compile(r"\bNOW\s*\(\s*\)", re.IGNORECASE), "CURRENT_TIMESTAMP"),
+    (re.compile(r"\bSERIAL\s+PRIMARY\s+KEY\b", re.IGNORECASE), "INTEGER PRIMARY KEY"),
+    (re.compile(r"\s+CASCADE\s*$", re.IGNORECASE), ""),
+    (re.compile(r"\bCREATE\s+MATERIALIZED\s+VIEW\b", re.IGNORECASE), "CREATE TABLE"),
+    (re.compile(r"\s+INCLUDE\s*\([^)]*\)", re.IGNORECASE), ""),
+]
+
+
+def split_statements(script):
+    '''
+    split a SQL script into statements, dropping -- comments
+    '''
+    statements = []
+    current = []
+    in_string = False
+    i = 0
+    while i < len(script):
+        ch = script[i]
+        if in_string:
+            current.append(ch)
+            if ch == "'":
+                in_string = False
+        elif ch == "'":
+            in_string = True
+            current.append(ch)
+        elif script.startswith("--", i):
+            newline = script.find("\n", i)
+            i = len(script) if newline == -1 else newline
+            continue
+        elif ch == ";":
+            statement = "".join(current).strip()
+            if statement:
+                statements.append(statement)
+            current = []
+        else:
+            current.append(ch)
+        i += 1
+
+    statement = "".join(current).strip()
+    if statement:
+        statements.append(statement)
+    return statements
+
+
+def _matching_open(sql, close_idx):
+    depth = 0
+    for i in range(close_idx, -1, -1):
+        if sql[i] == ")":
+            depth += 1
+        elif sql[i] == "(":
+            depth -= 1
+            if depth == 0:
+                return i
+    raise ValueError("Unbalanced parentheses in SQL")
+
+
+def _matching_close(sql, open_idx):
+    depth = 0
+    in_string = False
+    for i in range(open_idx, len(sql)):
+        ch = sql[i]
+        if in_string:
+            if ch == "'":
+                in_string = False
+        elif ch == "'":
+            in_string = True
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    raise ValueError("Unbalanced parentheses in SQL")
+
+
+def _split_args(args):
+    parts = []
+    depth = 0
+    in_string = False
+    start = 0
+    for i, ch in enumerate(args):
+        if in_string:
+            if ch == "'":
+                in_string = False
+        elif ch == "'":
+            in_string = True
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            parts.append(args[start:i].strip())
+            start = i + 1
+    parts.append(args[start:].strip())
+    return parts
+
+
+def _operand_start(sql, end):
+    '''
+    start index of the expression ending at sql[end] (identifier, literal, call or parenthesized)
+    '''
+    i = end
+    while i >= 0 and sql[i].isspace():
+        i -= 1
+
+    if sql[i] == ")":
+        i = _matching_open(sql, i) - 1
+        # include the function name of a call like NULLIF(...)
+        while i >= 0 and (sql[i].isalnum() or sql[i] in "_."):
+            i -= 1
+        return i + 1
+
+    if sql[i] == "'":
+        i -= 1
+        while i >= 0 and sql[i] != "'":
+            i -= 1
+        return i
+
+    while i >= 0 and (sql[i].isalnum() or sql[i] in "_."):
+        i -= 1
+    return i + 1
+
+
+def _translate_casts(sql):
+    '''
+    rewrite postgres expr::type casts as CAST(expr AS affinity)
+    '''
+    idx = sql.find("::")
+    while idx != -1:
+        type_match = _CAST_TYPE_PATTERN.match(sql, idx + 2)
+        if not type_match:
+            idx = sql.find("::", idx + 2)
+            continue
+
+        type_name = " ".join(type_match.group(1).lower().split())
+        target = CAST_TYPES.get(type_name, "TEXT")
+        start = _operand_start(sql, idx - 1)
+        operand = sql[start:idx].strip()
+        replacement = f"CAST({operand} AS {target})"
+        sql = sql[:start] + replacement + sql[type_match.end():]
+        idx = sql.find("::", start + len(replacement))
+    return sql
+
+
+def _translate_concat(sql):
+    '''
+    rewrite CONCAT(a, b, ...) as a || b || ..., treating NULL as '' like postgres
+    '''
+    pattern = re.compile(r"\bCONCAT\s*\(", re.IGNORECASE)
+    match = pattern.search(sql)
+    while match:
+        open_idx = match.end() - 1
+        close_idx = _matching_close(sql, open_idx)
+        args = _split_args(sql[open_idx + 1:close_idx])
+        replacement = "(" + " || ".join(f"COALESCE({a}, '')" for a in args) + ")"
+        sql = sql[:match.start()] + replacement + sql[close_idx + 1:]
+        match = pattern.search(sql, match.start() + len(replacement))
+    return sql
+
+
+def translate_sql(sql):
+    '''
+    translate the postgres constructs used by the load script and generated queries to sqlite
+    '''
+    sql = sql.strip().rstrip(";")
+    sql = _translate_casts(sql)
+    sql = _translate_concat(sql)
+    for pattern, replacement in _SIMPLE_REWRITES:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+# sqlite error messages -> the postgres wording the correction hints look for
+_ERROR_REWRITES = [
+    (re.compile(r"no such column: (\S+)"), r"column \1 does not exist"),
+    (re.compile(r"no such table: (\S+)"), r'relation "\1" does not exist'),
+    (re.compile(r"ambiguous column name: (\S+)"), r'column reference "\1" is ambiguous'),
+    (re.compile(r'near "(.*?)": syntax error'), r'syntax error at or near "\1"'),
+]
+
+
+def postgres_error_message(message):
+    '''
+    reword a sqlite error the way postgres would report it
+    '''
+    for pattern, replacement in _ERROR_REWRITES:
+        message = pattern.sub(replacement, message)
+    return message
+
+
+def _md5(value):
+    if value is None:
+        return None
+    return hashlib.md5(str(value).encode('utf-8')).hexdigest()
+
+
+def connect(db_path=DEFAULT_DB_PATH):
+    '''
+    open the local database with the postgres functions the shim relies on registered
+    '''
+    conn = sqlite3.connect(db_path)
+    conn.create_function("md5", 1, _md5, deterministic=True)
+    conn.create_function("sqrt", 1, lambda x: None if x is None else math.sqrt(x), deterministic=True)
+    conn.create_function("power", 2, lambda x, y: None if x is None or y is None else x ** y, deterministic=True)
+    conn.create_function("floor", 1, lambda x: None if x is None else math.floor(x), deterministic=True)
+    conn.create_function("ceil", 1, lambda x: None if x is None else math.ceil(x), deterministic=True)
+    return conn
+
+
+def stage_csv(conn, csv_path):
+    '''
+    load a raw HMDA CSV as an all-text Preliminary table, numbering rows if it has no ID column
+    '''
+    with open(csv_path, 'r', newline='') as f:
+        reader = csv.reader(f)
+        header = [h.strip().lower() for h in next(reader)]
+        has_id = "id" in header
+        columns = header if has_id else ["id"] + header
+
+        column_defs = ", ".join(f'"{c}" INTEGER' if c == "id" else f'"{c}" TEXT' for c in columns)
+        conn.execute("DROP TABLE IF EXISTS Preliminary")
+        conn.execute(f"CREATE TABLE Preliminary ({column_defs})")
+
+        placeholders = ", ".join("?" for _ in columns)
+        insert = f"INSERT INTO Preliminary VALUES ({placeholders})"
+
+        count = 0
+        batch = []
+        for row in reader:
+            count += 1
+            batch.append(row if has_id else [count] + row)
+            if len(batch) >= 10000:
+                conn.executemany(insert, batch)
+                batch = []
+        if batch:
+            conn.executemany(insert, batch)
+
+    return count
+
+
+def build_database(csv_path, db_path=DEFAULT_DB_PATH, schema_script=SCHEMA_SCRIPT, keep_staging=False,
+                   summary_script=SUMMARY_SCRIPT):
+    '''
+    build the local database: stage the CSV, then run the project_1 load and summary scripts through the shim
+    '''
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    conn = connect(db_path)
+    try:
+        start = time.perf_counter()
+        rows = stage_csv(conn, csv_path)
+        print(f"Staged {rows} rows in {time.perf_counter() - start:.2f}s")
+
+        statements = []
+        for script in (schema_script, summary_script):
+            with open(script, 'r') as f:
+                statements += split_statements(f.read())
+
+        start = time.perf_counter()
+        for statement in statements:
+            if SKIPPED_STATEMENTS.match(statement):
+                continue
+            try:
+                conn.execute(translate_sql(statement))
+            except sqlite3.Error as e:
+                raise sqlite3.Error(f"{e} in statement:\n{statement[:300]}") from e
+
+        if not keep_staging:
+            conn.execute("DROP TABLE IF EXISTS Preliminary")
+        conn.commit()
+        print(f"Loaded schema and data in {time.perf_counter() - start:.2f}s")
+    finally:
+        conn.close()
+
+    return db_path
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if not args:
+        print("Usage: python3 local_engine.py hmda_extract.csv [local_hmda.sqlite] [--keep-staging]", file=sys.stderr)
+        sys.exit(1)
+
+    csv_path = args[0]
+    db_path = args[1] if len(args) > 1 else DEFAULT_DB_PATH
+
+    try:
+        build_database(csv_path, db_path, keep_staging="--keep-staging" in sys.argv)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Error building local database: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"Local database written to {db_path}")
+
+
+if __name__ == "__main__":
+    main()
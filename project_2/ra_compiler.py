@@ -0,0 +1,1040 @@
+r'''
+ra_compiler.py
+
+Compiles the relational algebra written by the breakdown model straight to
+PostgreSQL, so plans that parse never reach sqlcoder.
+
+The breakdown (π, σ, ⋈, γ, τ, ρ, ∪, ∩, −, ×) is tokenized and parsed into an
+AST, every table and column is resolved against the schema_context.sql
+catalog, and natural joins get their ON clause from the foreign keys between
+the joined tables (or from their shared column names when no key links them).
+Step-by-step plans (R1 ← σ ... (LoanApplication)) are inlined. Anything the
+parser or the resolver can't handle raises CompileError, and the pipeline
+falls back to sqlcoder.
+
+Every question counts as ra_compiler_bypassed or ra_compiler_fallback, and a
+bypass adds the sqlcoder time it saved (the p50 of earlier pipeline.sql spans,
+minus the compile time) to ra_compiler_saved_seconds. The counters are kept in
+the traces and on the metrics endpoint.
+
+Usage:
+    python3 ra_compiler.py "π state_name (σ action_taken = 3 (LoanApplication ⋈ Location ⋈ State))"
+    python3 ra_compiler.py --stats                    # bypass rate and time saved from logs/traces.jsonl
+    python3 ra_compiler.py --stats path/to/traces.jsonl
+
+Environment Variables:
+    RA_COMPILER: set to 0 to always generate SQL with sqlcoder
+'''
+
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+
+import tracing
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema_context.sql")
+
+# relational operators and the spellings the breakdown model uses for them
+UNARY_OPERATORS = {"π": "project", "Π": "project", "σ": "select", "γ": "group", "τ": "sort", "ρ": "rename"}
+BINARY_OPERATORS = {"⋈": "join", "⨝": "join", "×": "cross", "∪": "union", "∩": "intersect", "−": "except", "-": "except"}
+SET_OPERATORS = {"union": "UNION", "intersect": "INTERSECT", "except": "EXCEPT"}
+
+AGGREGATES = {"COUNT", "SUM", "AVG", "MIN", "MAX"}
+FUNCTIONS = AGGREGATES | {"ROUND", "ABS", "LOWER", "UPPER", "COALESCE", "NULLIF", "LENGTH"}
+
+# words that continue a condition, so a "(" after them is not the operand
+_CONTINUING_WORDS = {"AND", "OR", "NOT", "IN", "LIKE", "ILIKE", "BETWEEN", "IS", "AS"}
+
+_TOKEN = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<string>'(?:[^']|'')*'|"[^"]*"|“[^”]*”)
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<ident>(?:[A-Za-z]|_(?=\w))\w*(?:\.(?:\w+|\*))?)
+  | (?P<arrow>→|->|←|<-|:=)
+  | (?P<cmp><=|>=|<>|!=|≤|≥|≠|=|<|>)
+  | (?P<symbol>[πΠσ⋈⨝γτρθ∪∩×−∧∨¬(),;{}\[\]+\-*/_%])
+''', re.VERBOSE)
+
+# words that can't be table aliases
+_RESERVED_WORDS = _CONTINUING_WORDS | {"AT", "BY", "DO", "IF", "OF", "ON", "TO", "ALL", "ANY", "ASC", "END", "FOR",
+                                       "DESC", "FROM", "JOIN", "LIMIT", "ORDER", "SELECT", "TABLE", "USER", "WHERE"}
+
+# operator precedence used when printing scalar expressions
+_PRECEDENCE = {"OR": 1, "AND": 2, "NOT": 3, "CMP": 4, "+": 5, "-": 5, "*": 6, "/": 6, "%": 6}
+_SYMBOL_WORDS = {"∧": "AND", "∨": "OR", "¬": "NOT", "≤": "<=", "≥": ">=", "≠": "<>", "!=": "<>"}
+
+# historical sqlcoder time per question, read from the trace file on first use
+_historic_sql_seconds = None
+
+
+class CompileError(Exception):
+    '''
+    the breakdown can't be compiled; the caller should ask sqlcoder instead
+    '''
+
+
+class Token:
+
+    def __init__(self, kind, text):
+        self.kind = kind
+        self.text = text
+
+    def upper(self):
+        return self.text.upper() if self.kind == "ident" else self.text
+
+    def __repr__(self):
+        return f"{self.kind}:{self.text}"
+
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if not match:
+            raise CompileError(f"unexpected character {text[pos]!r}")
+        pos = match.end()
+        if match.lastgroup != "space":
+            tokens.append(Token(match.lastgroup, match.group()))
+    return tokens
+
+
+# ===================== catalog =====================
+
+def parse_catalog(schema_sql):
+    '''
+    tables of a CREATE TABLE / CREATE MATERIALIZED VIEW script:
+    lower name -> {"name", "columns", "foreign_keys": [(columns, referenced table, referenced columns)]}
+    '''
+    tables = {}
+    pattern = r"CREATE\s+(?:MATERIALIZED\s+VIEW|TABLE)\s+(\w+)\s*\((.*?)\);"
+    for name, body in re.findall(pattern, schema_sql, re.IGNORECASE | re.DOTALL):
+        table = {"name": name, "columns": [], "foreign_keys": []}
+        for item in _split_top_level(body):
+            fk = re.match(r"FOREIGN\s+KEY\s*\(([^)]*)\)\s*REFERENCES\s+(\w+)\s*\(([^)]*)\)", item, re.IGNORECASE)
+            if fk:
+                table["foreign_keys"].append((
+                    [c.strip().lower() for c in fk.group(1).split(",")],
+                    fk.group(2).lower(),
+                    [c.strip().lower() for c in fk.group(3).split(",")],
+                ))
+            elif item and not re.match(r"(PRIMARY\s+KEY|UNIQUE|CHECK|CONSTRAINT)\b", item, re.IGNORECASE):
+                table["columns"].append(item.split()[0])
+        tables[name.lower()] = table
+    return tables
+
+
+def _split_top_level(body):
+    items, depth, current = [], 0, []
+    for ch in body:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0:
+            items.append("".join(current).strip())
+            current = []
+        else:
+            current.append(ch)
+    items.append("".join(current).strip())
+    return [re.sub(r"--[^\n]*", "", item).strip() for item in items]
+
+
+_catalogs = {}
+
+
+def load_catalog(schema_sql=None):
+    '''
+    parsed catalog of a schema text (schema_context.sql by default), cached per text
+    '''
+    if schema_sql is None:
+        with open(SCHEMA_PATH, "r") as f:
+            schema_sql = f.read()
+    if schema_sql not in _catalogs:
+        _catalogs[schema_sql] = parse_catalog(schema_sql)
+    return _catalogs[schema_sql]
+
+
+# ===================== parsing =====================
+
+def extract_expression(text):
+    '''
+    the relational algebra of a breakdown response as tokens, plus the tokens
+    of any step definitions (R1 ← ...) it refers to
+    '''
+    lines = []
+    pending = ""
+    for line in text.replace("`", "").replace("**", "").splitlines():
+        line = line.strip()
+        line = re.sub(r"^(?:\d+[.)]|[-*•]|step\s*\d+\s*:)\s*", "", line, flags=re.IGNORECASE)
+        line = re.sub(r"^relational algebra(?: expression)?\s*:\s*", "", line, flags=re.IGNORECASE)
+        if not line or line.lower() == "sql":
+            continue
+        # an expression wrapped over several lines continues until its parentheses close
+        pending = f"{pending} {line}" if pending else line
+        if pending.count("(") > pending.count(")"):
+            continue
+        if any(op in pending for op in list(UNARY_OPERATORS) + ["⋈", "⨝", "×", "∪", "∩"]):
+            lines.append(pending)
+        pending = ""
+
+    if not lines:
+        raise CompileError("no relational algebra in the breakdown")
+
+    definitions = {}
+    expressions = []
+    for line in lines:
+        assignment = re.match(r"^(\w+)\s*(?:←|<-|:=)\s*(.+)$", line)
+        if assignment:
+            definitions[assignment.group(1).lower()] = tokenize(assignment.group(2))
+        else:
+            expressions.append(line)
+
+    if len(expressions) > 1:
+        raise CompileError("the breakdown has more than one expression")
+    if expressions:
+        return tokenize(expressions[0]), definitions
+    last = re.match(r"^(\w+)", lines[-1]).group(1).lower()
+    return definitions.pop(last), definitions
+
+
+class _Parser:
+    '''
+    recursive descent over relational algebra tokens; builds tuples like
+    ("select", condition, child) and ("join", left, right, condition)
+    '''
+
+    def __init__(self, tokens, definitions=None, depth=0):
+        self.tokens = tokens
+        self.pos = 0
+        self.definitions = definitions or {}
+        self.depth = depth
+
+    def peek(self, offset=0):
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise CompileError("expression ends early")
+        self.pos += 1
+        return token
+
+    def expect(self, text):
+        token = self.next()
+        if token.text != text:
+            raise CompileError(f"expected {text!r}, found {token.text!r}")
+        return token
+
+    def parse(self):
+        tree = self.parse_relation()
+        if self.peek() is not None:
+            raise CompileError(f"unexpected {self.peek().text!r} after the expression")
+        return tree
+
+    def parse_relation(self):
+        left = self.parse_unary()
+        while self.peek() is not None and self.peek().text in BINARY_OPERATORS:
+            op = BINARY_OPERATORS[self.next().text]
+            condition = None
+            if op == "join":
+                if self.peek() is not None and self.peek().text == "θ":
+                    self.next()
+                if self.peek() is not None and self.peek().text in ("_", "{", "["):
+                    condition = parse_scalar(self.subscript())
+            right = self.parse_unary()
+            left = (op, left, right, condition)
+        return left
+
+    def parse_unary(self):
+        token = self.next()
+        if token.text == "(":
+            tree = self.parse_relation()
+            self.expect(")")
+            return tree
+        if token.text in UNARY_OPERATORS:
+            op = UNARY_OPERATORS[token.text]
+            params = self.subscript() if self.peek() is not None and self.peek().text in ("_", "{", "[") else self.params()
+            if not params:
+                raise CompileError(f"{token.text} has no parameters")
+            child = self.parse_unary()
+            return (op, params, child)
+        if token.kind == "ident" and "." not in token.text:
+            name = token.text.lower()
+            if name in self.definitions:
+                if self.depth > 10:
+                    raise CompileError("step definitions refer to each other")
+                return _Parser(self.definitions[name], self.definitions, self.depth + 1).parse()
+            return ("relation", token.text)
+        raise CompileError(f"unexpected {token.text!r}")
+
+    def subscript(self):
+        '''
+        parameters written as a subscript: _{...}, _x, {...} or [...]
+        '''
+        if self.peek().text == "_":
+            self.next()
+            if self.peek() is None or self.peek().text not in ("{", "["):
+                return [self.next()]
+        close = "}" if self.next().text == "{" else "]"
+        params, depth = [], 0
+        while True:
+            token = self.next()
+            if token.text == close and depth == 0:
+                return params
+            if token.text in ("{", "["):
+                depth += 1
+            elif token.text in ("}", "]"):
+                depth -= 1
+            params.append(token)
+
+    def params(self):
+        '''
+        parameters written inline: everything up to the "(" that opens the operand,
+        i.e. a "(" right after a complete value that isn't a function call
+        '''
+        params, depth = [], 0
+        while True:
+            token = self.peek()
+            if token is None:
+                raise CompileError("operator has no operand")
+            if token.text == "(":
+                if depth == 0 and params and _ends_value(params):
+                    return params
+                depth += 1
+            elif token.text == ")":
+                if depth == 0:
+                    raise CompileError("operator has no operand")
+                depth -= 1
+            params.append(self.next())
+
+
+def _ends_value(params):
+    last = params[-1]
+    if len(params) > 1 and (params[-2].text in ("→", "->") or params[-2].upper() == "AS"):
+        return True
+    if last.kind == "ident":
+        return last.upper() not in _CONTINUING_WORDS and last.upper() not in FUNCTIONS
+    if last.text == "*":
+        return len(params) == 1 or params[-2].text in (",", ";")
+    return last.kind in ("number", "string") or last.text == ")"
+
+
+# ===================== scalar expressions =====================
+
+class _ScalarParser:
+    '''
+    conditions and select items; nodes are tuples like ("column", name) and ("binary", op, left, right)
+    '''
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self, offset=0):
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def peek_word(self, offset=0):
+        token = self.peek(offset)
+        if token is None:
+            return None
+        return _SYMBOL_WORDS.get(token.text, token.upper())
+
+    def next(self):
+        if self.pos >= len(self.tokens):
+            raise CompileError("condition ends early")
+        self.pos += 1
+        return self.tokens[self.pos - 1]
+
+    def expect(self, text):
+        token = self.next()
+        if token.upper() != text:
+            raise CompileError(f"expected {text!r}, found {token.text!r}")
+
+    def done(self):
+        return self.pos >= len(self.tokens)
+
+    def items(self):
+        '''
+        comma / semicolon separated items with optional aliases and sort directions
+        '''
+        items = []
+        while not self.done():
+            item = {"alias": None, "direction": None, "limit": None}
+            if self.peek_word() == "LIMIT" and self.peek(1) is not None and self.peek(1).kind == "number":
+                self.next()
+                item["limit"] = int(self.next().text)
+            elif self.peek(1) is not None and self.peek(1).text in ("←", "<-") and self.peek().kind == "ident":
+                item["alias"] = self.next().text
+                self.next()
+                item["expr"] = self.expression()
+            else:
+                item["expr"] = self.expression()
+                if self.peek_word() in ("AS", "→", "->"):
+                    self.next()
+                    alias = self.next()
+                    if alias.kind != "ident":
+                        raise CompileError(f"bad alias {alias.text!r}")
+                    item["alias"] = alias.text
+                if self.peek_word() in ("ASC", "DESC"):
+                    item["direction"] = self.next().upper()
+            items.append(item)
+            if not self.done():
+                if self.peek().text not in (",", ";"):
+                    raise CompileError(f"unexpected {self.peek().text!r}")
+                self.next()
+        return items
+
+    def expression(self):
+        return self.disjunction()
+
+    def disjunction(self):
+        node = self.conjunction()
+        while self.peek_word() == "OR":
+            self.next()
+            node = ("binary", "OR", node, self.conjunction())
+        return node
+
+    def conjunction(self):
+        node = self.negation()
+        while self.peek_word() == "AND":
+            self.next()
+            node = ("binary", "AND", node, self.negation())
+        return node
+
+    def negation(self):
+        if self.peek_word() == "NOT":
+            self.next()
+            return ("not", self.negation())
+        return self.comparison()
+
+    def comparison(self):
+        node = self.additive()
+        negated = False
+        if self.peek_word() == "NOT" and self.peek_word(1) in ("IN", "LIKE", "ILIKE", "BETWEEN"):
+            self.next()
+            negated = True
+        word = self.peek_word()
+        token = self.peek()
+        if token is not None and token.kind == "cmp":
+            self.next()
+            return ("binary", _SYMBOL_WORDS.get(token.text, token.text), node, self.additive())
+        if word == "IN":
+            self.next()
+            self.expect("(")
+            values = [self.additive()]
+            while self.peek() is not None and self.peek().text == ",":
+                self.next()
+                values.append(self.additive())
+            self.expect(")")
+            return ("in", node, values, negated)
+        if word in ("LIKE", "ILIKE"):
+            self.next()
+            return ("like", word, node, self.additive(), negated)
+        if word == "BETWEEN":
+            self.next()
+            low = self.additive()
+            self.expect("AND")
+            return ("between", node, low, self.additive(), negated)
+        if word == "IS":
+            self.next()
+            is_not = self.peek_word() == "NOT"
+            if is_not:
+                self.next()
+            self.expect("NULL")
+            return ("is_null", node, is_not)
+        return node
+
+    def additive(self):
+        node = self.multiplicative()
+        while self.peek() is not None and self.peek().text in ("+", "-"):
+            node = ("binary", self.next().text, node, self.multiplicative())
+        return node
+
+    def multiplicative(self):
+        node = self.unary()
+        while self.peek() is not None and self.peek().text in ("*", "/", "%"):
+            node = ("binary", self.next().text, node, self.unary())
+        return node
+
+    def unary(self):
+        if self.peek() is not None and self.peek().text == "-":
+            self.next()
+            return ("negative", self.unary())
+        return self.primary()
+
+    def primary(self):
+        token = self.next()
+        if token.kind == "number":
+            return ("literal", token.text)
+        if token.kind == "string":
+            value = token.text[1:-1]
+            if token.text[0] == "'":
+                value = value.replace("''", "'")
+            return ("literal", "'" + value.replace("'", "''") + "'")
+        if token.text == "*":
+            return ("star",)
+        if token.text == "(":
+            node = self.expression()
+            self.expect(")")
+            return node
+        if token.kind == "ident":
+            word = token.upper()
+            if word in ("NULL", "TRUE", "FALSE"):
+                return ("literal", word)
+            if self.peek() is not None and self.peek().text == "(":
+                if word not in FUNCTIONS:
+                    raise CompileError(f"unknown function {token.text}")
+                self.next()
+                distinct = self.peek_word() == "DISTINCT"
+                if distinct:
+                    self.next()
+                args = []
+                if self.peek() is not None and self.peek().text != ")":
+                    args.append(self.expression())
+                    while self.peek() is not None and self.peek().text == ",":
+                        self.next()
+                        args.append(self.expression())
+                self.expect(")")
+                return ("function", word, args, distinct)
+            if word in _CONTINUING_WORDS or word in ("ASC", "DESC", "LIMIT"):
+                raise CompileError(f"unexpected {token.text!r}")
+            return ("column", token.text)
+        raise CompileError(f"unexpected {token.text!r}")
+
+
+def parse_scalar(tokens):
+    parser = _ScalarParser(tokens)
+    node = parser.expression()
+    if not parser.done():
+        raise CompileError(f"unexpected {parser.peek().text!r} in condition")
+    return node
+
+
+def parse_items(tokens):
+    return _ScalarParser(tokens).items()
+
+
+def has_aggregate(node):
+    if node[0] == "function" and node[1] in AGGREGATES:
+        return True
+    return any(isinstance(part, tuple) and has_aggregate(part) for part in node[1:]) or any(
+        isinstance(part, list) and any(has_aggregate(p) for p in part) for part in node[1:]
+    )
+
+
+# ===================== compilation =====================
+
+class _Source:
+    '''
+    one table or subquery in a FROM clause
+    '''
+
+    def __init__(self, alias, columns, table=None):
+        self.alias = alias
+        self.table = table
+        self.columns = {}
+        self.ambiguous = set()
+        for column in columns:
+            if column.lower() in self.columns:
+                self.ambiguous.add(column.lower())
+            self.columns[column.lower()] = column
+
+
+class _Block:
+    '''
+    one SELECT being assembled; operators fill its clauses until one no
+    longer fits, and the block is then wrapped as a subquery
+    '''
+
+    def __init__(self, from_sql, sources):
+        self.from_sql = from_sql
+        self.sources = sources
+        self.where = []
+        self.group_by = None
+        self.having = []
+        self.select = None      # [(sql, output name)]
+        self.projected = False
+        self.distinct = False
+        self.order_by = []
+        self.limit = None
+        self.aliases = {}       # output alias -> expression sql
+        self.equated = set()    # (alias.column, alias.column) pairs equal through a join
+        self.set_sql = None     # UNION / INTERSECT / EXCEPT of two blocks
+        self.set_columns = []
+
+    def plain(self):
+        return (self.set_sql is None and self.group_by is None and self.select is None
+                and not self.order_by and self.limit is None)
+
+    def sql(self):
+        if self.set_sql is not None:
+            return self.set_sql
+        select = ", ".join(f"{sql} AS {name}" if name and not _names_column(sql, name) else sql
+                           for sql, name in self.select) if self.select else "*"
+        lines = [f"SELECT {'DISTINCT ' if self.distinct else ''}{select}", f"FROM {self.from_sql}"]
+        if self.where:
+            lines.append("WHERE " + " AND ".join(self.where))
+        if self.group_by:
+            lines.append("GROUP BY " + ", ".join(self.group_by))
+        if self.having:
+            lines.append("HAVING " + " AND ".join(self.having))
+        if self.order_by:
+            lines.append("ORDER BY " + ", ".join(self.order_by))
+        if self.limit is not None:
+            lines.append(f"LIMIT {self.limit}")
+        return "\n".join(lines)
+
+    def output_columns(self):
+        if self.select:
+            return [name for _, name in self.select]
+        columns = []
+        for source in self.sources:
+            columns.extend(source.columns.values())
+            columns.extend(source.ambiguous)
+        return columns
+
+
+def _names_column(sql, name):
+    return sql.split(".")[-1].lower() == name.lower()
+
+
+class _Compiler:
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.used_aliases = set()
+        self.subqueries = 0
+
+    # ---------- relations ----------
+
+    def compile(self, tree):
+        op = tree[0]
+        if op == "relation":
+            return self.relation(tree[1])
+        if op == "rename":
+            return self.rename(tree[1], tree[2])
+        if op in ("join", "cross"):
+            return self.join(op, tree[1], tree[2], tree[3])
+        if op in SET_OPERATORS:
+            sides = []
+            for side in (self.compile(tree[1]), self.compile(tree[2])):
+                # ORDER BY / LIMIT only apply to a whole compound query
+                if side.order_by or side.limit is not None or side.set_sql is not None:
+                    side = self.wrap(side)
+                sides.append(side)
+            block = _Block(None, [])
+            block.set_sql = f"{sides[0].sql()}\n{SET_OPERATORS[op]}\n{sides[1].sql()}"
+            block.set_columns = sides[0].output_columns()
+            return block
+        block = self.compile(tree[2])
+        return getattr(self, op)(tree[1], block)
+
+    def relation(self, name, alias=None):
+        table = self.catalog.get(name.lower())
+        if table is None:
+            raise CompileError(f"unknown table {name}")
+        alias = self.new_alias(alias or "".join(c for c in table["name"] if c.isupper()).lower() or table["name"][:2].lower())
+        source = _Source(alias, table["columns"], table["name"].lower())
+        return _Block(f"{table['name']} {alias}", [source])
+
+    def rename(self, params, child):
+        if len(params) != 1 or params[0].kind != "ident":
+            raise CompileError("ρ takes one name")
+        if child[0] == "relation":
+            return self.relation(child[1], params[0].text)
+        # keep the name free while the operand takes its own aliases
+        self.used_aliases.add(params[0].text.lower())
+        return self.wrap(self.compile(child), params[0].text, exact=True)
+
+    def new_alias(self, base):
+        alias, n = base, 2
+        while alias.lower() in self.used_aliases or alias.upper() in FUNCTIONS | _RESERVED_WORDS:
+            alias = f"{base}{n}"
+            n += 1
+        self.used_aliases.add(alias.lower())
+        return alias
+
+    def wrap(self, block, alias=None, exact=False):
+        '''
+        turn a finished block into a subquery source of a new block
+        '''
+        if block.set_sql is not None:
+            columns = block.set_columns
+        else:
+            if block.select:
+                block.select = [(sql, name or self.default_name(sql, i)) for i, (sql, name) in enumerate(block.select)]
+            columns = block.output_columns()
+        self.subqueries += 1
+        alias = alias if exact else self.new_alias(alias or f"sub{self.subqueries}")
+        inner = "\n".join("    " + line for line in block.sql().splitlines())
+        return _Block(f"(\n{inner}\n) {alias}", [_Source(alias, columns)])
+
+    def join(self, op, left_tree, right_tree, condition):
+        left, right = self.compile(left_tree), self.compile(right_tree)
+        if not left.plain():
+            left = self.wrap(left)
+        if not right.plain():
+            right = self.wrap(right)
+
+        right_from = f"({right.from_sql})" if len(right.sources) > 1 else right.from_sql
+        block = _Block(None, left.sources + right.sources)
+        block.where = left.where + right.where
+        block.equated = left.equated | right.equated
+
+        if op == "cross":
+            block.from_sql = f"{left.from_sql}\nCROSS JOIN {right_from}"
+            return block
+        if condition is not None:
+            on = self.expression(condition, block)
+        else:
+            pairs = self.join_columns(left.sources, right.sources)
+            on = " AND ".join(f"{a} = {b}" for a, b in pairs)
+            block.equated |= {tuple(sorted(pair)) for pair in pairs}
+        block.from_sql = f"{left.from_sql}\nJOIN {right_from} ON {on}"
+        return block
+
+    def join_columns(self, left_sources, right_sources):
+        '''
+        equality pairs joining two sides: a foreign key between them, else their shared columns
+        '''
+        edges = []
+        for l in left_sources:
+            for r in right_sources:
+                for child, parent in ((l, r), (r, l)):
+                    if child.table is None or parent.table is None:
+                        continue
+                    for columns, referenced, ref_columns in self.catalog[child.table]["foreign_keys"]:
+                        if referenced == parent.table:
+                            edges.append((l, [(f"{child.alias}.{child.columns[c]}", f"{parent.alias}.{parent.columns[p]}")
+                                              for c, p in zip(columns, ref_columns)], columns))
+        if edges:
+            # LoanApplication references Sex and Ethnicity twice; the applicant's own key wins
+            primary = [e for e in edges if not any(c.startswith("co_") for c in e[2])] or edges
+            first = [e for e in primary if e[0] is primary[0][0]]
+            if len(first) > 1:
+                raise CompileError(f"ambiguous join between {first[0][0].alias} and the right side")
+            return first[0][1]
+
+        for r in right_sources:
+            for l in left_sources:
+                shared = [c for c in r.columns if c in l.columns and c not in l.ambiguous and c not in r.ambiguous]
+                if shared:
+                    return [(f"{l.alias}.{l.columns[c]}", f"{r.alias}.{r.columns[c]}") for c in shared]
+        raise CompileError("no foreign key or shared column to join on")
+
+    # ---------- unary operators ----------
+
+    def select(self, params, block):
+        condition = parse_scalar(params)
+        if block.group_by is not None and not block.projected and not block.order_by and block.limit is None:
+            block.having.append(self.expression(condition, block, grouped=True, precedence=_PRECEDENCE["AND"]))
+            return block
+        if not block.plain():
+            block = self.wrap(block)
+        if has_aggregate(condition):
+            raise CompileError("aggregate in a selection without grouping")
+        block.where.append(self.expression(condition, block, precedence=_PRECEDENCE["AND"]))
+        return block
+
+    def group(self, params, block):
+        if not block.plain():
+            block = self.wrap(block)
+        items = parse_items(params)
+        if any("expr" not in i for i in items):
+            raise CompileError("LIMIT inside γ")
+        groups = [i for i in items if not has_aggregate(i["expr"])]
+        block.group_by = [self.expression(i["expr"], block) for i in groups]
+        block.select = []
+        for item in items:
+            sql = self.expression(item["expr"], block, grouped=True)
+            block.select.append((sql, item["alias"] or self.default_name(sql, len(block.select))))
+            if item["alias"]:
+                block.aliases[item["alias"].lower()] = sql
+        return block
+
+    def project(self, params, block):
+        distinct = bool(params) and params[0].upper() == "DISTINCT"
+        items = parse_items(params[1:] if distinct else params)
+        if any("expr" not in i for i in items):
+            raise CompileError("LIMIT inside π")
+        if block.projected or block.set_sql is not None:
+            block = self.wrap(block)
+
+        if block.group_by is None and any(has_aggregate(i["expr"]) for i in items):
+            # π with aggregates and no γ: group by the plain columns, as the question intends
+            if not block.plain():
+                block = self.wrap(block)
+            block.group_by = [self.expression(i["expr"], block) for i in items
+                              if not has_aggregate(i["expr"]) and i["expr"][0] != "star"]
+
+        grouped = block.group_by is not None
+        select = []
+        for item in items:
+            if item["expr"][0] == "star":
+                if grouped or len(items) > 1:
+                    raise CompileError("* in a grouped projection")
+                select = None
+                break
+            sql = self.expression(item["expr"], block, grouped=grouped)
+            if item["alias"]:
+                name = item["alias"]
+            elif item["expr"][0] == "column":
+                name = item["expr"][1].split(".")[-1]
+            else:
+                name = self.default_name(sql, len(select))
+            select.append((sql, name))
+        block.select = select
+        block.projected = True
+        block.distinct = distinct
+        for item, (sql, _) in zip(items, select or []):
+            if item["alias"]:
+                block.aliases[item["alias"].lower()] = sql
+        return block
+
+    def sort(self, params, block):
+        items = parse_items(params)
+        if block.order_by or block.limit is not None or block.set_sql is not None or block.distinct:
+            block = self.wrap(block)
+        grouped = block.group_by is not None
+        for item in items:
+            if item["limit"] is not None:
+                block.limit = item["limit"]
+                continue
+            sql = self.expression(item["expr"], block, grouped=grouped)
+            block.order_by.append(f"{sql} {item['direction']}" if item["direction"] else sql)
+        return block
+
+    # ---------- names and expressions ----------
+
+    def default_name(self, sql, index):
+        match = re.match(r"^(\w+)\((?:DISTINCT )?(?:\w+\.)?(\w+|\*)\)$", sql)
+        if match:
+            func, arg = match.group(1).lower(), match.group(2).lower()
+            return func if arg == "*" else f"{func}_{arg}"
+        if re.match(r"^\w+\.\w+$", sql):
+            return sql.split(".")[1]
+        return f"value{index + 1}"
+
+    def column(self, name, block, grouped, in_aggregate):
+        qualifier, _, column = name.rpartition(".")
+        if not qualifier and column.lower() in block.aliases:
+            return block.aliases[column.lower()]
+
+        if qualifier:
+            matches = [s for s in block.sources if s.alias.lower() == qualifier.lower()] or \
+                      [s for s in block.sources if s.table == qualifier.lower()]
+            if not matches:
+                matches = [self.auto_join(block, table=qualifier.lower())]
+            if column == "*":
+                return f"{matches[0].alias}.*"
+        else:
+            matches = [s for s in block.sources if column.lower() in s.columns]
+            if not matches:
+                matches = [self.auto_join(block, column=column.lower())]
+
+        source = self.pick_source(matches, column.lower(), block)
+        if column.lower() not in source.columns:
+            raise CompileError(f"unknown column {name}")
+        if column.lower() in source.ambiguous:
+            raise CompileError(f"column {column} is ambiguous in {source.alias}")
+        sql = f"{source.alias}.{source.columns[column.lower()]}"
+        if grouped and not in_aggregate and sql not in (block.group_by or []) and sql not in block.aliases.values():
+            raise CompileError(f"{sql} is neither grouped nor aggregated")
+        return sql
+
+    def pick_source(self, matches, column, block):
+        if len(matches) == 1:
+            return matches[0]
+        # columns equated by a join are interchangeable
+        names = [f"{s.alias}.{s.columns[column]}" for s in matches if column in s.columns]
+        linked = {names[0]}
+        changed = True
+        while changed:
+            changed = False
+            for a, b in block.equated:
+                if (a in linked) != (b in linked):
+                    linked |= {a, b}
+                    changed = True
+        if all(n in linked for n in names):
+            return matches[0]
+        raise CompileError(f"column {column} is ambiguous")
+
+    def auto_join(self, block, column=None, table=None):
+        '''
+        join a table the expression refers to but never joined, when exactly one
+        foreign key leads to it from a joined table (lookup names mostly)
+        '''
+        candidates = []
+        for source in block.sources:
+            if source.table is None:
+                continue
+            for columns, referenced, ref_columns in self.catalog[source.table]["foreign_keys"]:
+                target = self.catalog[referenced]
+                if (table and referenced == table) or (column and column in (c.lower() for c in target["columns"])):
+                    candidates.append((source, columns, referenced, ref_columns))
+        primary = [c for c in candidates if not any(col.startswith("co_") for col in c[1])] or candidates
+        targets = {c[2] for c in primary}
+        if len(targets) != 1 or len([c for c in primary if c[0] is primary[0][0]]) != 1:
+            raise CompileError(f"unknown column {column or table}")
+        source, columns, referenced, ref_columns = primary[0]
+        joined = self.relation(referenced).sources[0]
+        on = " AND ".join(f"{source.alias}.{source.columns[c]} = {joined.alias}.{joined.columns[p]}"
+                          for c, p in zip(columns, ref_columns))
+        block.from_sql = f"{block.from_sql}\nJOIN {self.catalog[referenced]['name']} {joined.alias} ON {on}"
+        block.sources.append(joined)
+        return joined
+
+    def expression(self, node, block, grouped=False, precedence=0, in_aggregate=False):
+        kind = node[0]
+        if kind == "literal":
+            return node[1]
+        if kind == "star":
+            return "*"
+        if kind == "column":
+            return self.column(node[1], block, grouped, in_aggregate)
+        if kind == "function":
+            aggregate = node[1] in AGGREGATES
+            if aggregate and in_aggregate:
+                raise CompileError("nested aggregates")
+            args = ", ".join(self.expression(a, block, grouped, 0, in_aggregate or aggregate) for a in node[2])
+            return f"{node[1]}({'DISTINCT ' if node[3] else ''}{args})"
+        if kind == "negative":
+            return "-" + self.expression(node[1], block, grouped, 7, in_aggregate)
+
+        if kind == "binary":
+            op = node[1]
+            own = _PRECEDENCE.get(op, _PRECEDENCE["CMP"])
+            left = self.expression(node[2], block, grouped, own, in_aggregate)
+            right = self.expression(node[3], block, grouped, own + 1, in_aggregate)
+            sql = f"{left} {op} {right}"
+        elif kind == "not":
+            own = _PRECEDENCE["NOT"]
+            sql = "NOT " + self.expression(node[1], block, grouped, own, in_aggregate)
+        else:
+            own = _PRECEDENCE["CMP"]
+            operand = self.expression(node[1] if kind != "like" else node[2], block, grouped, own + 1, in_aggregate)
+            if kind == "in":
+                values = ", ".join(self.expression(v, block, grouped, 0, in_aggregate) for v in node[2])
+                sql = f"{operand} {'NOT ' if node[3] else ''}IN ({values})"
+            elif kind == "like":
+                pattern = self.expression(node[3], block, grouped, own + 1, in_aggregate)
+                sql = f"{operand} {'NOT ' if node[4] else ''}{node[1]} {pattern}"
+            elif kind == "between":
+                low = self.expression(node[2], block, grouped, own + 1, in_aggregate)
+                high = self.expression(node[3], block, grouped, own + 1, in_aggregate)
+                sql = f"{operand} {'NOT ' if node[4] else ''}BETWEEN {low} AND {high}"
+            else:
+                sql = f"{operand} IS {'NOT ' if node[2] else ''}NULL"
+        return f"({sql})" if own < precedence else sql
+
+
+def compile_expression(tokens, catalog, definitions=None):
+    '''
+    PostgreSQL for parsed relational algebra tokens
+    '''
+    tree = _Parser(tokens, definitions).parse()
+    block = _Compiler(catalog).compile(tree)
+    return block.sql() + ";"
+
+
+def compile_breakdown(breakdown, schema_sql=None):
+    '''
+    PostgreSQL for a breakdown response; raises CompileError when it can't be compiled
+    '''
+    tokens, definitions = extract_expression(breakdown)
+    return compile_expression(tokens, load_catalog(schema_sql), definitions)
+
+
+# ===================== pipeline hook =====================
+
+def sqlcoder_seconds():
+    '''
+    typical sqlcoder time for one question: p50 of this process's pipeline.sql
+    spans, else of the trace file, else None
+    '''
+    global _historic_sql_seconds
+    current = tracing.stage_p50("pipeline.sql")
+    if current is not None:
+        return current
+    if _historic_sql_seconds is None:
+        _historic_sql_seconds = 0.0
+        if os.path.exists(tracing.TRACE_FILE):
+            try:
+                summary = tracing.summarize(tracing.load_traces(tracing.TRACE_FILE))
+            except OSError:
+                summary = {}
+            if "pipeline.sql" in summary:
+                _historic_sql_seconds = summary["pipeline.sql"]["p50_ms"] / 1000
+    return _historic_sql_seconds or None
+
+
+def try_compile(breakdown, schema_sql=None):
+    '''
+    compile a breakdown for the pipeline, counting the bypass or the fallback;
+    returns None when sqlcoder has to write the SQL
+    '''
+    start = time.perf_counter()
+    with tracing.span("pipeline.ra_compile") as attrs:
+        try:
+            sql = compile_breakdown(breakdown, schema_sql)
+        except (CompileError, RecursionError) as e:
+            attrs["fallback"] = str(e)
+            tracing.increment("ra_compiler_fallback")
+            return None
+
+    tracing.increment("ra_compiler_bypassed")
+    estimate = sqlcoder_seconds()
+    if estimate:
+        tracing.increment("ra_compiler_saved_seconds", max(0.0, estimate - (time.perf_counter() - start)))
+    return sql
+
+
+def compiler_stats(traces):
+    '''
+    bypass rate and sqlcoder time saved over a list of traces
+    '''
+    counters = defaultdict(float)
+    for trace in traces:
+        for name, value in trace.get("counters", {}).items():
+            counters[name] += value
+    bypassed, fallback = counters["ra_compiler_bypassed"], counters["ra_compiler_fallback"]
+    total = bypassed + fallback
+    return {
+        "questions": int(total),
+        "bypassed": int(bypassed),
+        "bypass_rate": bypassed / total if total else 0.0,
+        "saved_seconds": counters["ra_compiler_saved_seconds"],
+    }
+
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    if args[0] == "--stats":
+        trace_file = args[1] if len(args) > 1 else tracing.TRACE_FILE
+        try:
+            stats = compiler_stats(tracing.load_traces(trace_file))
+        except OSError as e:
+            print(f"Error reading trace file: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"{stats['bypassed']} of {stats['questions']} questions skipped sqlcoder "
+              f"({stats['bypass_rate']:.0%}), saving about {stats['saved_seconds']:.1f}s")
+        return
+
+    try:
+        print(compile_breakdown(" ".join(args)))
+    except CompileError as e:
+        print(f"Error compiling expression: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+r'''
+result_cache.py
+
+Query-level result cache for the execution path.
+
+Results are keyed by canonicalized SQL (whitespace collapsed, keywords and
+identifiers lowercased, table aliases renamed to t1, t2, ... in order of
+appearance), so differently worded questions that compile to the same query
+share one entry. Entries remember the version stamp of every table they read;
+stamps come from the backend (pg_stat_user_tables on iLab, the file load time
+locally) and are refreshed at most every VERSION_REFRESH_SECONDS, so a cache
+hit never touches ssh. Eviction is LRU under an entry count and byte budget.
+
+Environment Variables:
+    RESULT_CACHE: set to 0 to disable the cache
+'''
+
+import re
+import time
+from collections import OrderedDict
+
+import tracing
+from execution_backend import ExecutionBackend
+
+MAX_ENTRIES = 256
+MAX_BYTES = 8 * 1024 * 1024
+
+# how often table version stamps are re-read from the backend
+VERSION_REFRESH_SECONDS = 300
+
+_TOKEN_PATTERN = re.compile(
+    r"""
+    '(?:[^']|'')*'                                  # string literal
+    | "(?:[^"]|"")*"                                # quoted identifier
+    | [A-Za-z_][\w$]*(?:\.(?:[A-Za-z_][\w$]*|\*))*  # identifier, possibly qualified
+    | \d+(?:\.\d+)?                                 # number
+    | ::|<>|!=|<=|>=|\|\|                           # multi-char operators
+    | \S                                            # anything else
+    """,
+    re.VERBOSE,
+)
+
+# words that end a FROM/JOIN table reference instead of naming its alias
+_NOT_ALIASES = {
+    "where", "join", "inner", "left", "right", "full", "outer", "cross", "natural",
+    "on", "using", "group", "order", "limit", "offset", "having", "union", "intersect",
+    "except", "window", "fetch", "for", "lateral",
+}
+
+
+def _tokenize(sql):
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(sql):
+        # string literals keep their case, everything else is case-insensitive
+        tokens.append(token if token.startswith("'") else token.lower())
+    while tokens and tokens[-1] == ";":
+        tokens.pop()
+    return tokens
+
+
+def canonicalize_sql(sql):
+    '''
+    canonical text of a query and the set of tables it reads
+    '''
+    tokens = _tokenize(sql)
+    aliases = {}
+    tables = set()
+    output = []
+
+    i = 0
+    in_from = False
+    while i < len(tokens):
+        token = tokens[i]
+        output.append(token)
+        i += 1
+
+        if token in ("from", "join"):
+            in_from = token == "from"
+        elif token == "," and in_from:
+            pass
+        else:
+            if token in _NOT_ALIASES or token == "select":
+                in_from = False
+            continue
+
+        # a table reference follows: name [AS] [alias]
+        if i >= len(tokens) or tokens[i] == "(":
+            continue
+
+        table = tokens[i]
+        output.append(table)
+        i += 1
+        tables.add(table.strip('"'))
+        canonical = f"t{len(aliases) + 1}"
+
+        if i < len(tokens) and tokens[i] == "as":
+            i += 1
+        if i < len(tokens) and re.match(r"^[a-z_][\w$]*$", tokens[i]) and tokens[i] not in _NOT_ALIASES:
+            aliases[tokens[i]] = canonical
+            i += 1
+        else:
+            # unaliased table: qualifiers use the table name itself
+            aliases.setdefault(table, canonical)
+        output.append(canonical)
+
+    # rewrite alias qualifiers (dr.denial_reason_name -> t2.denial_reason_name)
+    for idx, token in enumerate(output):
+        if "." in token and not token.startswith("'"):
+            qualifier, rest = token.split(".", 1)
+            if qualifier in aliases:
+                output[idx] = f"{aliases[qualifier]}.{rest}"
+
+    return " ".join(output), tables
+
+
+class ResultCache:
+    '''
+    LRU cache of query results with table-version invalidation
+    '''
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, versions):
+        '''
+        cached result for a canonical query, or None if missing or any table changed
+        '''
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        for table, stamp in entry["versions"].items():
+            if versions.get(table) != stamp:
+                self._remove(key)
+                self.misses += 1
+                return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, result, tables, versions):
+        size = len(result.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        if key in self.entries:
+            self._remove(key)
+
+        self.entries[key] = {
+            "result": result,
+            "tables": sorted(tables),
+            "versions": {table: versions.get(table) for table in tables},
+            "stored_at": time.time(),
+            "size": size,
+        }
+        self.total_bytes += size
+
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry["size"]
+
+
+class CachedBackend(ExecutionBackend):
+    '''
+    execution backend wrapper that answers repeated queries from the result cache
+    '''
+
+    def __init__(self, backend, cache=None, refresh_seconds=VERSION_REFRESH_SECONDS):
+        self.backend = backend
+        self.name = backend.name
+        self.cache = cache or ResultCache()
+        self.refresh_seconds = refresh_seconds
+        self._versions = {}
+        self._versions_at = None
+
+    def __getattr__(self, name):
+        # backend specific attributes (db_path, host, ...) pass through
+        return getattr(self.backend, name)
+
+    def table_versions(self, force=False):
+        '''
+        per-table version stamps, re-read from the backend when stale
+        '''
+        now = time.monotonic()
+        if force or self._versions_at is None or now - self._versions_at > self.refresh_seconds:
+            with tracing.span("cache.refresh_versions"):
+                self._versions = self.backend.table_versions()
+            self._versions_at = now
+        return self._versions
+
+    def execute(self, query):
+        key, tables = canonicalize_sql(query)
+        versions = self.table_versions()
+
+        # without version stamps there is no safe way to invalidate, so don't cache
+        if not versions:
+            return self.backend.execute(query)
+
+        entry = self.cache.get(key, versions)
+        if entry is not None:
+            tracing.increment("result_cache_hits")
+            return entry["result"]
+
+        tracing.increment("result_cache_misses")
+        result = self.backend.execute(query)
+
+        # only successful results are worth keeping
+        if result is not None and "error" not in result.lower():
+            self.cache.put(key, result, tables, versions)
+        return result
+
+    def execute_batch(self, queries):
+        versions = self.table_versions()
+        if not versions:
+            return self.backend.execute_batch(queries)
+
+        results = [None] * len(queries)
+        missing = []
+        for i, query in enumerate(queries):
+            key, tables = canonicalize_sql(query)
+            entry = self.cache.get(key, versions)
+            if entry is not None:
+                tracing.increment("result_cache_hits")
+                results[i] = entry["result"]
+            else:
+                tracing.increment("result_cache_misses")
+                missing.append((i, key, tables))
+
+        # only the misses go to the backend, still as one batch
+        if missing:
+            fetched = self.backend.execute_batch([queries[i] for i, _, _ in missing])
+            for (i, key, tables), result in zip(missing, fetched):
+                results[i] = result
+                if result is not None and "error" not in result.lower():
+                    self.cache.put(key, result, tables, versions)
+        return results
+
+    def close(self):
+        self.backend.close()
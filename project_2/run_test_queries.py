@@ -1,42 +1,37 @@
 #!/usr/bin/env python3
 
+import contextlib
+import io
 import os
-import subprocess
-import re
 import time
 
+import benchmark
+import database_llm
+import llm_manager
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
 # Extract actual queries from test_querys.txt
 def extract_queries(file_path):
-    queries = []
-    with open(file_path, 'r') as f:
-        content = f.read()
-    
-    # Extract queries, which follow a number and description format
-    pattern = r'\d+\.\s+.*?:\s+"(.*?)"'
-    matches = re.findall(pattern, content, re.DOTALL)
-    
-    for match in matches:
-        queries.append(match.strip())
-    
-    return queries
+    return benchmark.load_questions(file_path)
 
-# Run a single query and save the output
-def run_query(query, output_dir, query_num):
+# Run a single query in-process and save the output
+def run_query(query, output_dir, query_num, context, backend, catalog=None):
     print(f"\n{'='*80}")
     print(f"Running Query #{query_num}: {query}")
     print(f"{'='*80}\n")
     
-    # Create the command that feeds the query into the database_llm.py
-    # Use bash explicitly and the correct paths
-    command = f'''bash -c 'cd /home/admiralx/cs336-rutgers/project_2 && 
-                source /home/admiralx/cs336-rutgers/project_2/CS336P2/bin/activate && 
-                printf "{query}\\nexit\\n" | 
-                KMP_DUPLICATE_LIB_OK=TRUE python3 database_llm.py' '''
-    
-    # Run the command and capture output
+    # Run the pipeline directly (models stay loaded between queries) and capture its output
+    output = io.StringIO()
     start_time = time.time()
-    process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    stdout, stderr = process.communicate()
+    with contextlib.redirect_stdout(output):
+        try:
+            outcome = database_llm.answer_question(query, context, backend, catalog=catalog)
+            success = outcome["success"]
+        except Exception as e:
+            print(f"Error: {e}")
+            outcome = None
+            success = False
     end_time = time.time()
     
     # Save output to file
@@ -44,10 +39,13 @@ def run_query(query, output_dir, query_num):
     with open(result_file, 'w') as f:
         f.write(f"Query #{query_num}: {query}\n")
         f.write(f"{'='*80}\n\n")
-        f.write(f"STDOUT:\n{stdout.decode('utf-8')}\n\n")
+        f.write(f"STDOUT:\n{output.getvalue()}\n\n")
         
-        if stderr:
-            f.write(f"STDERR:\n{stderr.decode('utf-8')}\n\n")
+        if outcome and outcome["trace"]:
+            f.write("Stage timings:\n")
+            for stage, ms in sorted(benchmark.stage_totals(outcome["trace"]).items()):
+                f.write(f"  {stage}: {ms:.1f}ms\n")
+            f.write("\n")
         
         f.write(f"Execution time: {end_time - start_time:.2f} seconds\n")
     
@@ -58,32 +56,34 @@ def run_query(query, output_dir, query_num):
         "query_num": query_num,
         "query": query,
         "execution_time": end_time - start_time,
-        "success": process.returncode == 0
+        "success": success
     }
 
 def main():
     # Path to test queries file
-    test_queries_path = "project_2/test_querys.txt"
+    test_queries_path = os.path.join(SCRIPT_DIR, "test_querys.txt")
     
     # Create output directory for results
-    output_dir = "project_2/test_results"
+    output_dir = os.path.join(SCRIPT_DIR, "test_results")
     os.makedirs(output_dir, exist_ok=True)
     
     # Extract queries
     queries = extract_queries(test_queries_path)
+
+    # credentials and schema are loaded once for the whole run
+    backend = database_llm.create_backend()
+    context = llm_manager.load_schema()
+    catalog = database_llm.load_value_catalog(backend)
     
     # Summary of results
     results = []
     
     # Run each query
     for i, query in enumerate(queries, 1):
-        result = run_query(query, output_dir, i)
+        result = run_query(query, output_dir, i, context, backend, catalog)
         results.append(result)
-        
-        # Sleep a bit to give the system time between queries
-        if i < len(queries):
-            print("\nWaiting 2 seconds before next query...\n")
-            time.sleep(2)
+    
+    backend.close()
     
     # Write summary report
     summary_file = os.path.join(output_dir, "summary.txt")
@@ -101,6 +101,7 @@ def main():
             f.write(f"#{r['query_num']} - {'Success' if r['success'] else 'Failed'} - {r['execution_time']:.2f}s - {r['query'][:60]}{'...' if len(r['query']) > 60 else ''}\n")
     
     print(f"\nTest complete! Summary saved to {summary_file}")
+    print("For repeated runs, per-stage percentiles and baseline comparison use benchmark.py")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -185,4 +185,37 @@ CREATE TABLE DenialReasons (
     PRIMARY KEY (ID, reason_number),
     FOREIGN KEY (ID) REFERENCES LoanApplication(ID),
     FOREIGN KEY (denial_reason_code) REFERENCES DenialReason(denial_reason_code)
-);
\ No newline at end of file
+);
+-- precomputed rollups (materialized views refreshed after every load); prefer them for
+-- counts, totals and averages by year, state, agency, action taken or denial reason.
+-- an average is a total divided by its count, e.g. SUM(total_loan_amount_000s) / SUM(loan_amount_count)
+
+CREATE MATERIALIZED VIEW LoansByStateYear (
+    as_of_year INTEGER,
+    state_code CHAR(2),
+    action_taken SMALLINT,
+    application_count BIGINT,
+    total_loan_amount_000s NUMERIC,
+    loan_amount_count BIGINT,
+    total_applicant_income_000s NUMERIC,
+    applicant_income_count BIGINT
+);
+
+CREATE MATERIALIZED VIEW LoansByAgencyYear (
+    as_of_year INTEGER,
+    agency_code SMALLINT,
+    action_taken SMALLINT,
+    application_count BIGINT,
+    total_loan_amount_000s NUMERIC,
+    loan_amount_count BIGINT,
+    total_applicant_income_000s NUMERIC,
+    applicant_income_count BIGINT
+);
+
+CREATE MATERIALIZED VIEW DenialsByReason (
+    as_of_year INTEGER,
+    state_code CHAR(2),
+    denial_reason_code SMALLINT,
+    denial_reason_name VARCHAR(100),
+    denial_count BIGINT
+);
@@ -1,8 +1,22 @@
 import getpass
+import json
 import paramiko
 import os
+import time
 from dotenv import load_dotenv
 
+import cancellation
+import tracing
+
+# seconds a remote command may run when no stage deadline is active
+EXEC_TIMEOUT = 300
+
+# how often the client checks for Ctrl-C / deadlines while a remote command runs
+POLL_INTERVAL = 0.05
+
+# seconds ilab_script gets to cancel its own query after SIGTERM before we escalate
+CANCEL_GRACE = 2.0
+
 def get_ssh_credentials():
     '''
     gets user and pwd from .env file or falls back to user input
@@ -29,6 +43,140 @@ def get_ssh_credentials():
 
     return user, pwd
 
+def split_remote_timings(error):
+    '''
+    separates the TIMING line printed by ilab_script from the rest of stderr
+    '''
+    timings = {}
+    lines = []
+    for line in error.split('\n'):
+        if line.startswith("TIMING "):
+            try:
+                timings = json.loads(line[len("TIMING "):])
+            except json.JSONDecodeError:
+                pass
+        elif line.startswith("BACKEND "):
+            # process ids are only needed for cancellation
+            continue
+        else:
+            lines.append(line)
+
+    return '\n'.join(lines).strip(), timings
+
+def record_remote_timings(timings, exec_seconds):
+    '''
+    records the stage timings reported by ilab_script as remote.* spans
+    '''
+    for stage in ("imports", "db_connect", "db_execute", "format"):
+        if stage in timings:
+            tracing.record_span(f"remote.{stage}", timings[stage])
+
+    # whatever the script didn't see itself is shell, venv and interpreter startup
+    if "total" in timings:
+        tracing.record_span("remote.startup", max(0.0, exec_seconds - timings["total"]))
+
+def remote_setup(wd_path, db_user, db_pwd):
+    '''
+    shell prefix that enters the project venv and exports the database settings
+    '''
+    # Escape single quotes in password just in case
+    db_pwd_escaped = db_pwd.replace("'", "'\\''")
+
+    # the server stops the statement itself once the stage deadline has passed
+    remaining = cancellation.remaining()
+    timeout_ms = int((EXEC_TIMEOUT if remaining is None else remaining) * 1000)
+
+    return f"cd {wd_path}; source venv/bin/activate; export DB_USER='{db_user}'; export DB_PASSWORD='{db_pwd_escaped}'; export STATEMENT_TIMEOUT_MS={max(1, timeout_ms)};"
+
+def parse_remote_processes(error):
+    '''
+    the script PID and Postgres backend PIDs from the BACKEND lines ilab_script prints
+    '''
+    pid = None
+    backend_pids = []
+    for line in error.split('\n'):
+        if not line.startswith("BACKEND "):
+            continue
+        try:
+            ids = json.loads(line[len("BACKEND "):])
+        except json.JSONDecodeError:
+            continue
+        pid = ids.get("pid", pid)
+        if ids.get("backend_pid") is not None:
+            backend_pids.append(ids["backend_pid"])
+    return pid, backend_pids
+
+def _run_short(client, command):
+    stdin, stdout, stderr = client.exec_command(command, timeout=30)
+    return stdout.channel.recv_exit_status()
+
+def cancel_remote(client, channel, setup, ilab_script_path, error):
+    '''
+    stop an abandoned ilab_script run: SIGTERM makes it cancel its own queries,
+    then pg_cancel_backend and SIGKILL if it doesn't exit in time
+    '''
+    pid, backend_pids = parse_remote_processes(error)
+    with tracing.span("ssh.cancel", pid=pid, backend_pids=backend_pids) as cancel_span:
+        try:
+            if pid:
+                _run_short(client, f"kill -TERM {pid}")
+
+            deadline = time.monotonic() + CANCEL_GRACE
+            while not channel.exit_status_ready() and time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+            cancel_span["graceful"] = channel.exit_status_ready()
+            if channel.exit_status_ready():
+                return
+
+            for backend_pid in backend_pids:
+                _run_short(client, f"{setup} python3 {ilab_script_path} --cancel {int(backend_pid)}")
+            if pid:
+                _run_short(client, f"kill -KILL {pid}")
+        except Exception as e:
+            print(f"Error cancelling remote query: {e}")
+
+def run_remote(client, command, setup, ilab_script_path, stdin_data=None):
+    '''
+    runs a command and collects its output, polling for Ctrl-C and the stage deadline;
+    abandoned runs are cancelled on the server before the interruption is re-raised
+    '''
+    remaining = cancellation.remaining()
+    expires = time.monotonic() + (EXEC_TIMEOUT if remaining is None else remaining)
+
+    stdin, stdout, stderr = client.exec_command(command)
+    channel = stdout.channel
+
+    if stdin_data is not None:
+        stdin.write(stdin_data)
+        stdin.flush()
+        stdin.channel.shutdown_write()  # Signal EOF
+
+    output = []
+    error = []
+    try:
+        while True:
+            # read as we go so a large result can't fill the channel window and stall the script
+            while channel.recv_ready():
+                output.append(channel.recv(65536))
+            while channel.recv_stderr_ready():
+                error.append(channel.recv_stderr(65536))
+
+            if channel.exit_status_ready():
+                output.append(stdout.read())
+                error.append(stderr.read())
+                break
+
+            cancellation.check()
+            if time.monotonic() > expires:
+                raise cancellation.Cancelled("timed out", "execute")
+            time.sleep(POLL_INTERVAL)
+    except (KeyboardInterrupt, cancellation.Cancelled):
+        cancel_remote(client, channel, setup, ilab_script_path, b"".join(error).decode('utf-8', 'replace'))
+        raise
+
+    exit_status = channel.recv_exit_status()
+    return exit_status, b"".join(output).decode('utf-8').strip(), b"".join(error).decode('utf-8').strip()
+
 def execute_query(host, user, pwd, query, wd_path, db_user, db_pwd):
     '''
     connects to iLab and runs iLab script, passing query
@@ -44,20 +192,22 @@ def execute_query(host, user, pwd, query, wd_path, db_user, db_pwd):
     client.set_missing_host_key_policy(paramiko.AutoAddPolicy()) 
 
     try:
-        client.connect(host, username=user, password=pwd, timeout=10)
+        with tracing.span("ssh.connect", host=host):
+            client.connect(host, username=user, password=pwd, timeout=10)
 
-        # Escape single quotes in password just in case
-        db_pwd_escaped = db_pwd.replace("'", "'\\''")
         # Set environment variables before executing the script
-        command = f"cd {wd_path}; source venv/bin/activate; export DB_USER='{db_user}'; export DB_PASSWORD='{db_pwd_escaped}'; python3 {ilab_script_path} '{query}'"
+        setup = remote_setup(wd_path, db_user, db_pwd)
+        command = f"{setup} python3 {ilab_script_path} '{query}'"
 
-        stdin, stdout, stderr = client.exec_command(command, timeout=300)
-        
-        # Wait for the command to complete and get the exit status
-        exit_status = stdout.channel.recv_exit_status()
-        
-        output = stdout.read().decode('utf-8').strip()
-        error = stderr.read().decode('utf-8').strip()
+        exec_start = time.perf_counter()
+        with tracing.span("ssh.exec") as exec_span:
+            # Wait for the command to complete and get the exit status
+            exit_status, output, error = run_remote(client, command, setup, ilab_script_path)
+            exec_span["exit_status"] = exit_status
+            exec_seconds = time.perf_counter() - exec_start
+
+        error, timings = split_remote_timings(error)
+        record_remote_timings(timings, exec_seconds)
 
         # Check exit status first
         if exit_status != 0:
@@ -69,6 +219,8 @@ def execute_query(host, user, pwd, query, wd_path, db_user, db_pwd):
 
         return output
     
+    except cancellation.Cancelled:
+        raise
     except paramiko.AuthenticationException:
         print("Authentication failed. Check user and password.")
         return "Error: Authentication failed. Check your username and password."
@@ -98,26 +250,23 @@ def execute_query_stdin(host, user, pwd, query, wd_path, db_user, db_pwd):
     client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
     try:
-        client.connect(host, username=user, password=pwd, timeout=10)
+        with tracing.span("ssh.connect", host=host):
+            client.connect(host, username=user, password=pwd, timeout=10)
 
-        # Escape single quotes in password just in case
-        db_pwd_escaped = db_pwd.replace("'", "'\\''")
         # Set environment variables before executing the script
         # Corrected command to execute the script file, not the directory
-        command = f"cd {wd_path}; source venv/bin/activate; export DB_USER='{db_user}'; export DB_PASSWORD='{db_pwd_escaped}'; python3 {ilab_script_path}"
+        setup = remote_setup(wd_path, db_user, db_pwd)
+        command = f"{setup} python3 {ilab_script_path}"
 
-        stdin, stdout, stderr = client.exec_command(command, timeout=300)
-        
-        # Write query to stdin and flush
-        stdin.write(query)
-        stdin.flush()
-        stdin.channel.shutdown_write()  # Signal EOF
-        
-        # Wait for the command to complete and get the exit status
-        exit_status = stdout.channel.recv_exit_status()
-        
-        output = stdout.read().decode('utf-8').strip()
-        error = stderr.read().decode('utf-8').strip()
+        exec_start = time.perf_counter()
+        with tracing.span("ssh.exec") as exec_span:
+            # Write query to stdin and wait for the command to complete
+            exit_status, output, error = run_remote(client, command, setup, ilab_script_path, stdin_data=query)
+            exec_span["exit_status"] = exit_status
+            exec_seconds = time.perf_counter() - exec_start
+
+        error, timings = split_remote_timings(error)
+        record_remote_timings(timings, exec_seconds)
 
         # Check exit status first
         if exit_status != 0:
@@ -129,6 +278,8 @@ def execute_query_stdin(host, user, pwd, query, wd_path, db_user, db_pwd):
 
         return output
     
+    except cancellation.Cancelled:
+        raise
     except paramiko.AuthenticationException:
         print("Authentication failed. Check user and password.")
         return "Error: Authentication failed. Check your username and password."
@@ -142,3 +293,73 @@ def execute_query_stdin(host, user, pwd, query, wd_path, db_user, db_pwd):
     finally:
         if client:
             client.close()
+
+def execute_batch(host, user, pwd, queries, wd_path, db_user, db_pwd, workers=1):
+    '''
+    connects to iLab once and runs every query in a single ilab_script invocation (batch mode)
+    Returns one result per query, in order: the formatted table or an error string.
+    '''
+
+    ilab_script_path = wd_path + "/ilab_script.py"
+
+    if not queries:
+        return []
+
+    client = paramiko.SSHClient()
+    # Use AutoAddPolicy for convenience if host keys change or are new
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+    try:
+        with tracing.span("ssh.connect", host=host):
+            client.connect(host, username=user, password=pwd, timeout=10)
+
+        setup = remote_setup(wd_path, db_user, db_pwd)
+        command = f"{setup} python3 {ilab_script_path} --batch --workers {int(workers)}"
+
+        exec_start = time.perf_counter()
+        with tracing.span("ssh.exec", statements=len(queries)) as exec_span:
+            # the whole batch goes over stdin as one JSON list
+            exit_status, output, error = run_remote(client, command, setup, ilab_script_path, stdin_data=json.dumps(queries))
+            exec_span["exit_status"] = exit_status
+            exec_seconds = time.perf_counter() - exec_start
+
+        error, timings = split_remote_timings(error)
+        record_remote_timings(timings, exec_seconds)
+
+        if exit_status != 0:
+            print(f"Remote command failed with exit status {exit_status}")
+            if error:
+                print(f"Command error output:\n{error}")
+            # the batch never ran, so every statement gets the same error
+            message = f"Error executing query. Exit status: {exit_status}\nCommand error output:\n{error}"
+            return [message] * len(queries)
+
+        try:
+            entries = json.loads(output)
+        except json.JSONDecodeError as e:
+            return [f"Error: Could not parse batch output: {e}"] * len(queries)
+
+        results = []
+        for entry in entries:
+            tracing.record_span("remote.statement", entry.get("seconds", 0.0), status=entry.get("status"))
+            if entry.get("status") == "ok":
+                results.append(entry.get("result"))
+            else:
+                results.append(f"Error executing query.\nCommand error output:\n{entry.get('error', '')}")
+        return results
+
+    except cancellation.Cancelled:
+        raise
+    except paramiko.AuthenticationException:
+        print("Authentication failed. Check user and password.")
+        return ["Error: Authentication failed. Check your username and password."] * len(queries)
+    except paramiko.SSHException as sshException:
+        print(f"Unable to establish connection: {sshException}")
+        return [f"Error: Unable to establish SSH connection: {sshException}"] * len(queries)
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        return [f"Error: {e}"] * len(queries)
+
+    finally:
+        if client:
+            client.close()
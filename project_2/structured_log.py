@@ -0,0 +1,242 @@
+r'''
+structured_log.py
+
+Buffered JSONL logging of LLM interactions.
+
+Records are queued by the pipeline and written by a background thread, so no
+file I/O happens in the request path. Prompts are not stored verbatim: each
+record holds the template ID and its parameters, and the schema is referenced
+by content hash (stored once under logs/schemas/). The log is rotated by size
+and rotated files are gzip compressed.
+
+Usage:
+    python3 structured_log.py                      # print all entries with full prompts
+    python3 structured_log.py logs/llm_log.jsonl   # same, for another log file
+    python3 structured_log.py --no-prompts         # entries only
+'''
+
+import gzip
+import hashlib
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
+LOG_FILE = os.path.join(LOG_DIR, 'llm_log.jsonl')
+SCHEMA_DIR = os.path.join(LOG_DIR, 'schemas')
+
+# rotate once the active log passes this size, keeping this many compressed files
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 5
+
+# how long the writer waits to batch up records before flushing
+FLUSH_INTERVAL = 0.5
+
+_STOP = object()
+
+
+def schema_hash(schema):
+    '''
+    content hash used to reference a schema from log records
+    '''
+    return hashlib.sha256(schema.encode('utf-8')).hexdigest()[:16]
+
+
+class StructuredLogger:
+    '''
+    JSONL logger whose writes happen on a background thread
+    '''
+
+    def __init__(self, path=LOG_FILE, schema_dir=SCHEMA_DIR, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT):
+        self.path = path
+        self.schema_dir = schema_dir
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._known_schemas = set()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def register_schema(self, schema):
+        '''
+        queue the schema for storage (once per content hash) and return its hash
+        '''
+        digest = schema_hash(schema)
+        if digest not in self._known_schemas:
+            self._known_schemas.add(digest)
+            self._queue.put(("schema", digest, schema))
+        return digest
+
+    def log(self, event, **fields):
+        '''
+        queue one JSON record; returns immediately
+        '''
+        record = {"ts": time.strftime('%Y-%m-%dT%H:%M:%S'), "event": event}
+        record.update(fields)
+        self._queue.put(("record", record, None))
+
+    def close(self):
+        '''
+        flush everything still queued and stop the writer thread
+        '''
+        if self._thread.is_alive():
+            self._queue.put((_STOP, None, None))
+            self._thread.join()
+
+    def _run(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        os.makedirs(self.schema_dir, exist_ok=True)
+
+        stopping = False
+        while not stopping:
+            items = [self._queue.get()]
+            # batch whatever else arrives shortly after the first item
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while items[-1][0] is not _STOP:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            lines = []
+            for kind, payload, extra in items:
+                if kind is _STOP:
+                    stopping = True
+                elif kind == "schema":
+                    self._write_schema(payload, extra)
+                else:
+                    lines.append(json.dumps(payload, ensure_ascii=False))
+
+            if lines:
+                try:
+                    with open(self.path, 'a') as f:
+                        f.write("\n".join(lines) + "\n")
+                    self._maybe_rotate()
+                except OSError as e:
+                    print(f"Error writing log: {e}", file=sys.stderr)
+
+    def _write_schema(self, digest, schema):
+        schema_path = os.path.join(self.schema_dir, f"{digest}.sql")
+        if os.path.exists(schema_path):
+            return
+        try:
+            with open(schema_path, 'w') as f:
+                f.write(schema)
+        except OSError as e:
+            print(f"Error writing schema: {e}", file=sys.stderr)
+
+    def _maybe_rotate(self):
+        if os.path.getsize(self.path) < self.max_bytes:
+            return
+
+        # shift llm_log.jsonl.N.gz -> N+1, dropping the oldest
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}.gz"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}.gz")
+
+        with open(self.path, 'rb') as src, gzip.open(f"{self.path}.1.gz", 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(self.path)
+
+
+def log_files(path=LOG_FILE):
+    '''
+    the active log and its rotated files, oldest first
+    '''
+    files = []
+    i = 1
+    while os.path.exists(f"{path}.{i}.gz"):
+        files.append(f"{path}.{i}.gz")
+        i += 1
+    files.reverse()
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def read_records(path=LOG_FILE):
+    '''
+    yield records from the log and its rotated files in write order
+    '''
+    for file_path in log_files(path):
+        opener = gzip.open if file_path.endswith(".gz") else open
+        with opener(file_path, 'rt') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+
+
+def load_logged_schema(digest, schema_dir=SCHEMA_DIR):
+    with open(os.path.join(schema_dir, f"{digest}.sql"), 'r') as f:
+        return f.read()
+
+
+def rebuild_prompt(record, schema_dir=SCHEMA_DIR):
+    '''
+    reconstruct the full prompt of a logged LLM call from its template ID and parameters
+    '''
+    # imported lazily, the builders live next to the model loading code
+    import llm_manager
+
+    params = record.get("params", {})
+    schema = load_logged_schema(record["schema"], schema_dir) if record.get("schema") else ""
+    template = record.get("template")
+
+    if template == "breakdown":
+        return llm_manager.build_breakdown_prompt(schema, params["question"])
+    if template == "sql_from_breakdown":
+        return llm_manager.build_sql_from_breakdown_prompt(params["breakdown"], schema, params["question"],
+                                                           params.get("value_hints", ""))
+    if template == "correction_turn":
+        # the follow-up turn only; the rest of the conversation is the logged sql record
+        return llm_manager.build_correction_turn(params["question"], params["query"], params["error_msg"])
+    if template == "correction":
+        return llm_manager.build_correction_prompt(
+            params["question"], params["query"], params["error_msg"], schema, params["breakdown"]
+        )
+    raise ValueError(f"Unknown prompt template: {template}")
+
+
+def main():
+    '''
+    print logged entries, reconstructing prompts unless --no-prompts is passed
+    '''
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    show_prompts = "--no-prompts" not in sys.argv
+    path = args[0] if args else LOG_FILE
+    schema_dir = os.path.join(os.path.dirname(os.path.abspath(path)), 'schemas')
+
+    found = False
+    for record in read_records(path):
+        found = True
+        print(f"==================== {record.get('ts')} {record.get('event')} ====================")
+        for key, value in record.items():
+            if key in ("ts", "event"):
+                continue
+            print(f"{key}: {json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value}")
+        if show_prompts and record.get("template"):
+            try:
+                print("--- Prompt ---")
+                print(rebuild_prompt(record, schema_dir))
+            except (OSError, KeyError, ValueError) as e:
+                print(f"Could not rebuild prompt: {e}")
+        print()
+
+    if not found:
+        print(f"No log entries found at {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+r'''
+tracing.py
+
+Per-stage latency and token instrumentation for the NL database pipeline.
+
+Each question gets a trace made of spans (llm load, prompt eval, decode, ssh
+connect, remote startup, db execution, correction rounds, ...). Finished traces
+are appended to logs/traces.jsonl and aggregated in memory so they can be
+scraped in Prometheus text format from a local endpoint.
+
+Usage:
+    python3 tracing.py                        # p50/p95 per stage from logs/traces.jsonl
+    python3 tracing.py path/to/traces.jsonl   # same, for another trace file
+
+Environment Variables:
+    METRICS_PORT: if set, database_llm.py serves /metrics on this port
+'''
+
+import contextlib
+import json
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# default trace output, next to the other llm logs
+TRACE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'traces.jsonl')
+
+# number of recent durations kept per stage for the metrics endpoint quantiles
+METRICS_WINDOW = 1000
+
+# trace currently being recorded (one question at a time)
+current_trace = None
+
+# in-memory aggregates for the metrics endpoint
+_metrics_lock = threading.Lock()
+_stage_durations = defaultdict(lambda: deque(maxlen=METRICS_WINDOW))
+_stage_totals = defaultdict(lambda: [0, 0.0])  # stage -> [count, sum seconds]
+_counters = defaultdict(float)
+
+_metrics_server = None
+
+
+class Trace:
+    '''
+    spans and counters recorded while answering one question
+    '''
+
+    def __init__(self, question):
+        self.trace_id = uuid.uuid4().hex
+        self.question = question
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.spans = []
+        self.counters = defaultdict(float)
+        self.status = None
+        self.duration_ms = None
+
+    def offset_ms(self):
+        return (time.perf_counter() - self._start) * 1000
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "question": self.question,
+            "started_at": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+            "status": self.status,
+            "duration_ms": round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            "spans": self.spans,
+            "counters": dict(self.counters),
+        }
+
+
+def start_trace(question):
+    '''
+    begin a new trace for a question, replacing any unfinished one
+    '''
+    global current_trace
+    current_trace = Trace(question)
+    return current_trace
+
+
+def end_trace(status, trace_file=TRACE_FILE):
+    '''
+    finish the current trace and append it to the JSONL trace file
+    '''
+    global current_trace
+    trace = current_trace
+    current_trace = None
+
+    if trace is None:
+        return None
+
+    trace.status = status
+    trace.duration_ms = trace.offset_ms()
+    _observe("question", trace.duration_ms / 1000)
+    increment(f"questions_{status}")
+
+    if trace_file:
+        try:
+            os.makedirs(os.path.dirname(trace_file), exist_ok=True)
+            with open(trace_file, 'a') as f:
+                f.write(json.dumps(trace.to_dict(), ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"Error writing trace: {e}", file=sys.stderr)
+
+    return trace
+
+
+@contextlib.contextmanager
+def span(stage, **attrs):
+    '''
+    time a pipeline stage; the yielded dict can be filled with extra attributes
+    (token counts, exit status, ...) before the block exits
+    '''
+    start = time.perf_counter()
+    offset = current_trace.offset_ms() if current_trace is not None else None
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs.setdefault("error", type(e).__name__)
+        raise
+    finally:
+        record_span(stage, time.perf_counter() - start, offset_ms=offset, **attrs)
+
+
+def record_span(stage, seconds, offset_ms=None, **attrs):
+    '''
+    record an already measured stage duration (e.g. timings reported by the remote script)
+    '''
+    _observe(stage, seconds)
+
+    if current_trace is not None:
+        if offset_ms is None:
+            offset_ms = current_trace.offset_ms() - seconds * 1000
+        current_trace.spans.append({
+            "stage": stage,
+            "start_ms": round(offset_ms, 3),
+            "duration_ms": round(seconds * 1000, 3),
+            "attrs": attrs,
+        })
+
+
+def increment(name, amount=1):
+    '''
+    add to a named counter (tokens, cache hits, retries, ...) for the trace and the metrics endpoint
+    '''
+    if not amount:
+        return
+
+    with _metrics_lock:
+        _counters[name] += amount
+
+    if current_trace is not None:
+        current_trace.counters[name] += amount
+
+
+def _observe(stage, seconds):
+    with _metrics_lock:
+        _stage_durations[stage].append(seconds)
+        totals = _stage_totals[stage]
+        totals[0] += 1
+        totals[1] += seconds
+
+
+def stage_p50(stage):
+    '''
+    median duration in seconds of a stage over this process's recent observations, or None
+    '''
+    with _metrics_lock:
+        durations = list(_stage_durations.get(stage, ()))
+    return percentile(durations, 50) if durations else None
+
+
+def percentile(values, pct):
+    '''
+    nearest-rank percentile of a list of numbers
+    '''
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def render_prometheus():
+    '''
+    format the in-memory aggregates in Prometheus text exposition format
+    '''
+    lines = [
+        "# HELP nldb_stage_duration_seconds Pipeline stage latency.",
+        "# TYPE nldb_stage_duration_seconds summary",
+    ]
+
+    with _metrics_lock:
+        for stage in sorted(_stage_totals):
+            durations = list(_stage_durations[stage])
+            count, total = _stage_totals[stage]
+            for quantile in (0.5, 0.95):
+                value = percentile(durations, quantile * 100)
+                lines.append(f'nldb_stage_duration_seconds{{stage="{stage}",quantile="{quantile}"}} {value:.6f}')
+            lines.append(f'nldb_stage_duration_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'nldb_stage_duration_seconds_count{{stage="{stage}"}} {count}')
+
+        for name in sorted(_counters):
+            metric = "nldb_" + "".join(c if c.isalnum() else "_" for c in name) + "_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {_counters[name]:g}")
+
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # keep scrapes out of the interactive prompt
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    '''
+    serve /metrics on a local port from a daemon thread
+    '''
+    global _metrics_server
+
+    if _metrics_server is not None:
+        return _metrics_server
+
+    _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=_metrics_server.serve_forever, daemon=True)
+    thread.start()
+    return _metrics_server
+
+
+def load_traces(trace_file):
+    '''
+    read finished traces from a JSONL trace file, skipping malformed lines
+    '''
+    traces = []
+    with open(trace_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                traces.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return traces
+
+
+def summarize(traces):
+    '''
+    p50/p95 latency per stage, summing repeated spans of a stage within one trace
+    '''
+    per_stage = defaultdict(list)
+    for trace in traces:
+        totals = defaultdict(float)
+        for s in trace.get("spans", []):
+            totals[s["stage"]] += s["duration_ms"]
+        for stage, ms in totals.items():
+            per_stage[stage].append(ms)
+        if trace.get("duration_ms") is not None:
+            per_stage["question"].append(trace["duration_ms"])
+
+    return {
+        stage: {
+            "count": len(values),
+            "p50_ms": percentile(values, 50),
+            "p95_ms": percentile(values, 95),
+        }
+        for stage, values in per_stage.items()
+    }
+
+
+def main():
+    '''
+    print a per-stage latency summary of a trace file
+    '''
+    trace_file = sys.argv[1] if len(sys.argv) > 1 else TRACE_FILE
+
+    try:
+        traces = load_traces(trace_file)
+    except OSError as e:
+        print(f"Error reading trace file: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if not traces:
+        print(f"No traces found in {trace_file}")
+        return
+
+    summary = summarize(traces)
+    counters = defaultdict(float)
+    for trace in traces:
+        for name, value in trace.get("counters", {}).items():
+            counters[name] += value
+
+    print(f"{len(traces)} traces from {trace_file}\n")
+    print(f"{'stage':<24}{'count':>8}{'p50 ms':>12}{'p95 ms':>12}")
+    for stage in sorted(summary):
+        row = summary[stage]
+        print(f"{stage:<24}{row['count']:>8}{row['p50_ms']:>12.1f}{row['p95_ms']:>12.1f}")
+
+    if counters:
+        print("\nCounters (total over all traces):")
+        for name in sorted(counters):
+            print(f"  {name}: {counters[name]:g}")
+
+
+if __name__ == "__main__":
+    main()
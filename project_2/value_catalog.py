@@ -0,0 +1,332 @@
+r'''
+value_catalog.py
+
+Catalog of the values stored in the HMDA database, used to ground filter
+literals in generated SQL.
+
+The catalog holds the contents of every lookup table (code/name pairs), the
+distinct values of low-cardinality columns and min/max/histograms of numeric
+columns. It is fetched with one batched backend call, cached as JSON under
+cache/ and refreshed once it is older than CATALOG_MAX_AGE. For each question
+only the entries that fuzzy-match its wording are injected into the SQL prompt,
+e.g. "loans in New Jersey" -> State.state_code = '34' (state_name 'New Jersey').
+
+Usage:
+    python3 value_catalog.py --refresh                   # fetch and cache the catalog
+    python3 value_catalog.py "loans denied for credit history in NJ"
+
+Environment Variables:
+    VALUE_CATALOG: set to 0 to leave value hints out of the SQL prompt
+'''
+
+import difflib
+import json
+import os
+import re
+import sys
+import time
+
+import tracing
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CATALOG_PATH = os.path.join(SCRIPT_DIR, "cache", "value_catalog.json")
+
+# refetch the catalog once the cached copy is older than this (seconds)
+CATALOG_MAX_AGE = 24 * 60 * 60
+
+# lookup table -> (code columns, name column, exact-match alias column)
+LOOKUP_TABLES = {
+    "Agency": (["agency_code"], "agency_name", "agency_abbr"),
+    "LoanType": (["loan_type"], "loan_type_name", None),
+    "PropertyType": (["property_type"], "property_type_name", None),
+    "LoanPurpose": (["loan_purpose"], "loan_purpose_name", None),
+    "OwnerOccupancy": (["owner_occupancy"], "owner_occupancy_name", None),
+    "Preapproval": (["preapproval"], "preapproval_name", None),
+    "ActionTaken": (["action_taken"], "action_taken_name", None),
+    "MSA": (["msamd"], "msamd_name", None),
+    "State": (["state_code"], "state_name", "state_abbr"),
+    "County": (["county_code", "state_code"], "county_name", None),
+    "Ethnicity": (["ethnicity_code"], "ethnicity_name", None),
+    "Race": (["race_code"], "race_name", None),
+    "Sex": (["sex_code"], "sex_name", None),
+    "PurchaserType": (["purchaser_type"], "purchaser_type_name", None),
+    "DenialReason": (["denial_reason_code"], "denial_reason_name", None),
+    "HOEPAStatus": (["hoepa_status"], "hoepa_status_name", None),
+    "LienStatus": (["lien_status"], "lien_status_name", None),
+    "EditStatus": (["edit_status"], "edit_status_name", None),
+}
+
+# columns whose distinct values are kept if there are at most MAX_DISTINCT of them
+LOW_CARDINALITY_COLUMNS = [
+    ("LoanApplication", "as_of_year"),
+    ("LoanApplication", "application_date_indicator"),
+    ("RespondentAgency", "as_of_year"),
+]
+MAX_DISTINCT = 50
+
+# numeric column -> words that mention it in a question
+NUMERIC_COLUMNS = {
+    ("LoanApplication", "loan_amount_000s"): ["loan amount", "amount", "loan size"],
+    ("LoanApplication", "applicant_income_000s"): ["income", "applicant income"],
+    ("Location", "population"): ["population"],
+    ("Location", "minority_population"): ["minority"],
+    ("Location", "hud_median_family_income"): ["median family income", "family income"],
+    ("Location", "tract_to_msamd_income"): ["tract income", "tract to msa"],
+}
+HISTOGRAM_BUCKETS = 10
+
+# a question phrase must be at least this similar to a stored name to count as a match
+MIN_SIMILARITY = 0.85
+MAX_MATCHES_PER_TABLE = 5
+MAX_MATCHES = 20
+
+_STOPWORDS = {
+    "the", "a", "an", "of", "for", "in", "on", "and", "or", "to", "by", "with", "was", "not",
+    "is", "are", "be", "that", "this", "from", "as", "at", "other", "applicable", "information",
+    "provided", "loan", "loans", "application", "applications", "applicant", "applicants",
+}
+
+
+def lookup_query(table):
+    codes, name, alias = LOOKUP_TABLES[table]
+    columns = codes + [name] + ([alias] if alias else [])
+    return f"SELECT jsonb_agg(jsonb_build_array({', '.join(columns)}))::text AS catalog FROM {table}"
+
+
+def distinct_query(table, column):
+    return (f"SELECT jsonb_agg(v)::text AS catalog FROM "
+            f"(SELECT DISTINCT {column} AS v FROM {table} WHERE {column} IS NOT NULL LIMIT {MAX_DISTINCT + 1}) AS d")
+
+
+def numeric_query(table, column):
+    # equal-width histogram over [min, max]; the top value falls in the last bucket
+    last = HISTOGRAM_BUCKETS - 1
+    bucket = (f"CASE WHEN b.hi = b.lo THEN 0 "
+              f"WHEN FLOOR(({column} - b.lo) * {HISTOGRAM_BUCKETS}.0 / (b.hi - b.lo)) > {last} THEN {last} "
+              f"ELSE FLOOR(({column} - b.lo) * {HISTOGRAM_BUCKETS}.0 / (b.hi - b.lo)) END")
+    return (
+        f"SELECT jsonb_build_object('min', b.lo, 'max', b.hi, 'avg', b.mean, 'count', b.n, 'histogram', "
+        f"(SELECT jsonb_agg(jsonb_build_array(h.bucket, h.n)) FROM "
+        f"(SELECT {bucket} AS bucket, COUNT(*) AS n FROM {table} WHERE {column} IS NOT NULL GROUP BY 1 ORDER BY 1) AS h)"
+        f")::text AS catalog FROM "
+        f"(SELECT MIN({column}) AS lo, MAX({column}) AS hi, AVG({column}) AS mean, COUNT({column}) AS n FROM {table}) AS b"
+    )
+
+
+def catalog_queries():
+    '''
+    (kind, key, query) for every catalog entry, in batch order
+    '''
+    queries = [("lookup", table, lookup_query(table)) for table in LOOKUP_TABLES]
+    queries += [("distinct", f"{t}.{c}", distinct_query(t, c)) for t, c in LOW_CARDINALITY_COLUMNS]
+    queries += [("numeric", f"{t}.{c}", numeric_query(t, c)) for t, c in NUMERIC_COLUMNS]
+    return queries
+
+
+def parse_json_cell(result):
+    '''
+    the JSON value of a one row, one column result table, or None if it can't be read
+    '''
+    if result is None or "error" in result.lower():
+        return None
+    lines = result.splitlines()
+    value = "\n".join(lines[1:]).strip()
+    if not value or value in ("None", "NaN"):
+        return None
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return None
+
+
+def fetch_catalog(backend):
+    '''
+    build the catalog with one batched call to the backend
+    '''
+    queries = catalog_queries()
+    with tracing.span("catalog.fetch", queries=len(queries)):
+        results = backend.execute_batch([q for _, _, q in queries])
+
+    catalog = {"fetched_at": time.time(), "backend": backend.name, "lookups": {}, "distinct": {}, "numeric": {}}
+    for (kind, key, _), result in zip(queries, results):
+        value = parse_json_cell(result)
+        if value is None:
+            continue
+        if kind == "lookup":
+            rows = sorted(value, key=lambda row: [str(v) for v in row])
+            catalog["lookups"][key] = rows
+        elif kind == "distinct":
+            if len(value) <= MAX_DISTINCT:
+                catalog["distinct"][key] = sorted(value, key=str)
+        else:
+            catalog["numeric"][key] = value
+    return catalog
+
+
+def save_catalog(catalog, path=CATALOG_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(catalog, f, ensure_ascii=False)
+
+
+def load_catalog(backend, path=CATALOG_PATH, max_age=CATALOG_MAX_AGE, refresh=False):
+    '''
+    the cached catalog for this backend, fetching a new one if it is missing or stale
+    '''
+    if not refresh and os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                catalog = json.load(f)
+            fresh = time.time() - catalog.get("fetched_at", 0) < max_age
+            if fresh and catalog.get("backend") == backend.name:
+                return catalog
+        except (OSError, json.JSONDecodeError):
+            pass
+
+    catalog = fetch_catalog(backend)
+    if not catalog["lookups"]:
+        # nothing came back (connection or permission problem); don't cache an empty catalog
+        print("Warning: could not fetch the value catalog, continuing without value hints.")
+        return catalog
+
+    try:
+        save_catalog(catalog, path)
+    except OSError as e:
+        print(f"Error saving value catalog: {e}")
+    return catalog
+
+
+def _words(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def _similar(a, b):
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+
+def name_score(name, question_words):
+    '''
+    how well a stored name is mentioned in the question, 0 to 1
+    '''
+    name_words = _words(name)
+    if not name_words:
+        return 0.0
+
+    # the whole name appears, allowing for typos
+    phrase = " ".join(name_words)
+    n = len(name_words)
+    best = 0.0
+    for i in range(max(1, len(question_words) - n + 1)):
+        best = max(best, _similar(phrase, " ".join(question_words[i:i + n])))
+    if best >= MIN_SIMILARITY:
+        return best
+
+    # otherwise most of its meaningful words appear ("denied ... credit history")
+    content = [w for w in name_words if w not in _STOPWORDS and len(w) > 3]
+    if not content:
+        return 0.0
+    found = [w for w in content if any(_similar(w, q) >= MIN_SIMILARITY for q in question_words)]
+    if not found or not any(len(w) >= 5 for w in found):
+        return 0.0
+    return 0.8 * len(found) / len(content)
+
+
+def match_values(catalog, question, min_score=0.6):
+    '''
+    catalog entries mentioned by the question: lookup rows, distinct values and numeric columns
+    '''
+    question_words = _words(question)
+    # short codes like NJ only count when written in capitals, so "in" or "or" don't match states
+    upper_tokens = set(re.findall(r"\b[A-Z]{2,5}\b", question))
+
+    matches = {"lookups": {}, "distinct": {}, "numeric": {}}
+    total = 0
+    for table, rows in catalog.get("lookups", {}).items():
+        codes, name_column, alias = LOOKUP_TABLES.get(table, ([], None, None))
+        scored = []
+        for row in rows:
+            name = row[len(codes)] if len(row) > len(codes) else None
+            score = name_score(str(name), question_words) if name else 0.0
+            if alias and len(row) > len(codes) + 1 and row[len(codes) + 1] in upper_tokens:
+                score = 1.0
+            if score >= min_score:
+                scored.append((score, row))
+        if scored:
+            scored.sort(key=lambda item: -item[0])
+            matches["lookups"][table] = [row for _, row in scored[:MAX_MATCHES_PER_TABLE]]
+            total += len(matches["lookups"][table])
+        if total >= MAX_MATCHES:
+            break
+
+    for key, values in catalog.get("distinct", {}).items():
+        mentioned = [v for v in values if str(v).lower() in question_words]
+        if mentioned:
+            matches["distinct"][key] = mentioned
+
+    text = " ".join(question_words)
+    for key, stats in catalog.get("numeric", {}).items():
+        table, column = key.split(".", 1)
+        if any(phrase in text for phrase in NUMERIC_COLUMNS.get((table, column), [])):
+            matches["numeric"][key] = stats
+
+    return matches
+
+
+def _literal(value):
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return str(value)
+
+
+def format_hints(matches):
+    '''
+    prompt text listing the matched values, empty if nothing matched
+    '''
+    lines = []
+    for table, rows in matches.get("lookups", {}).items():
+        codes, name_column, alias = LOOKUP_TABLES[table]
+        for row in rows:
+            pairs = [f"{c} = {_literal(v)}" for c, v in zip(codes, row)]
+            lines.append(f"- {table}: {', '.join(pairs)} ({name_column} = {_literal(row[len(codes)])})")
+
+    for key, values in matches.get("distinct", {}).items():
+        lines.append(f"- {key} values: {', '.join(_literal(v) for v in values)}")
+
+    for key, stats in matches.get("numeric", {}).items():
+        unit = " (in thousands of dollars)" if key.endswith("_000s") else ""
+        avg = stats.get("avg")
+        avg_text = f", avg {float(avg):.1f}" if avg is not None else ""
+        lines.append(f"- {key}{unit}: min {stats.get('min')}, max {stats.get('max')}{avg_text}, {stats.get('count')} non-null rows")
+
+    if not lines:
+        return ""
+    return "Stored values matching the question (use these exact codes and literals):\n" + "\n".join(lines)
+
+
+def hints_for(catalog, question):
+    if not catalog:
+        return ""
+    return format_hints(match_values(catalog, question))
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+
+    # imported here so importing the catalog doesn't pull in the ssh stack
+    import database_llm
+
+    backend = database_llm.create_backend()
+    try:
+        catalog = load_catalog(backend, refresh="--refresh" in sys.argv)
+    finally:
+        backend.close()
+
+    print(f"{len(catalog['lookups'])} lookup tables, {len(catalog['distinct'])} distinct-value columns, "
+          f"{len(catalog['numeric'])} numeric columns")
+    for question in args:
+        print(f"\n{question}")
+        print(hints_for(catalog, question) or "(no matching values)")
+
+
+if __name__ == "__main__":
+    main()